@@ -0,0 +1,90 @@
+"""
+Scaled feature cache shared by the SVM stages
+=============================================
+Stage 1 fits a StandardScaler on the middle-split training set. Stage 2 and
+the combo pipeline then apply the same scaler to the same arrays again.
+scaled_features() runs that transform once and keeps the float32 result as
+.npy files that later stages memory-map:
+
+    X = scaled_features(DATA_PATH, scaler)          # {'X_train': memmap, 'X_test': memmap}
+
+Entries live in feature_cache/<dataset stem>_<dataset hash>_<scaler hash>/.
+The dataset hash covers the .npz file's name, size and mtime (as for the
+sweep cache). The scaler hash covers the fitted scaler's parameters, so an
+identical refit in Stage 1 still hits. A new dataset or scaler gives a new
+key, and the stale entries for that dataset are removed when it is written.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+from pathlib import Path
+
+import joblib
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from sweep import file_fingerprint
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+FEATURE_CACHE_DIR = os.path.join(SCRIPT_DIR, 'feature_cache')
+BLOCK_ROWS = 262_144
+
+
+def cache_key(npz_path, scaler):
+    """'<dataset stem>_<dataset hash>_<scaler hash>' for an .npz file and a fitted scaler."""
+    data_hash = hashlib.sha1(file_fingerprint(npz_path).encode()).hexdigest()[:12]
+    return f"{Path(npz_path).stem}_{data_hash}_{joblib.hash(scaler)[:12]}"
+
+
+def scaled_features(npz_path, scaler, keys=('X_train', 'X_test'), cache_dir=FEATURE_CACHE_DIR):
+    """
+    {key: read-only float32 memmap of scaler.transform(npz[key])}. Missing
+    arrays are transformed in blocks of BLOCK_ROWS rows and written to the
+    cache first. `scaler` is a fitted scaler or the path to a joblib dump.
+    """
+    if isinstance(scaler, (str, os.PathLike)):
+        scaler = joblib.load(scaler)
+    key = cache_key(npz_path, scaler)
+    entry = os.path.join(cache_dir, key)
+    missing = [k for k in keys if not os.path.exists(os.path.join(entry, f'{k}.npy'))]
+
+    if missing:
+        _prune_stale(cache_dir, Path(npz_path).stem, key)
+        os.makedirs(entry, exist_ok=True)
+        with np.load(npz_path) as data:
+            for k in missing:
+                print(f"  Scaling '{k}' -> {os.path.join(entry, k + '.npy')}")
+                _write_scaled(data[k], scaler, os.path.join(entry, f'{k}.npy'))
+        with open(os.path.join(entry, 'manifest.json'), 'w') as f:
+            json.dump({'source': os.path.abspath(npz_path), 'fingerprint': file_fingerprint(npz_path),
+                       'scaler': type(scaler).__name__,
+                       'arrays': sorted(p[:-4] for p in os.listdir(entry) if p.endswith('.npy'))}, f, indent=2)
+    else:
+        print(f"  Scaled features from cache: {entry}")
+
+    return {k: np.load(os.path.join(entry, f'{k}.npy'), mmap_mode='r') for k in keys}
+
+
+def _write_scaled(raw, scaler, npy_path):
+    """scaler.transform(raw) as float32, written block by block through a temporary file."""
+    tmp_path = npy_path + '.tmp'
+    out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=raw.shape)
+    for start in range(0, len(raw), BLOCK_ROWS):
+        block = raw[start:start + BLOCK_ROWS].astype(np.float32)
+        out[start:start + len(block)] = scaler.transform(block)
+    out.flush()
+    del out
+    os.replace(tmp_path, npy_path)
+
+
+def _prune_stale(cache_dir, stem, key):
+    """Remove the entries for the same dataset stem under a different key."""
+    if not os.path.isdir(cache_dir):
+        return
+    for name in os.listdir(cache_dir):
+        if name != key and name.rsplit('_', 2)[0] == stem:
+            print(f"  Removing stale feature cache: {name}")
+            shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
@@ -20,18 +20,27 @@ Usage:
   2. Run model_svm_rbf_wetland_grid_search.py     → note best Stage 2 model
   3. Update STAGE1_MODEL_PATH and STAGE2_MODEL_PATH below
   4. Run this script
+
+The scaled test set is mapped from the feature cache the grid searches
+wrote (feature_cache.py); it is only recomputed if the dataset or the
+scaler changed.
 """
 
 import numpy as np
 import os
+import sys
 import json
 import joblib
 from datetime import datetime
+from pathlib import Path
 from sklearn.metrics import (
     accuracy_score, confusion_matrix,
     precision_recall_fscore_support,
 )
 
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from feature_cache import scaled_features
+
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # ── !! UPDATE THESE PATHS AFTER GRID SEARCHES !! ─────────────────────────────
@@ -57,15 +66,14 @@ print(f"  Scaler:  {os.path.basename(SCALER_PATH)}\n")
 
 # ── Load test data ─────────────────────────────────────────────────────────────
 data = np.load(DATA_PATH)
-X_test_raw   = data['X_test']
 y_test_raw   = data['y_test']
 test_row_min = int(data['test_row_min'])
 test_row_max = int(data['test_row_max'])
 data.close()
 
-print(f"Test samples: {X_test_raw.shape[0]:,}")
+print(f"Test samples: {y_test_raw.shape[0]:,}")
 
-X_test = scaler.transform(X_test_raw.astype(np.float32))
+X_test = scaled_features(DATA_PATH, scaler, keys=('X_test',))['X_test']
 
 # ── Stage 1: Predict background vs wetland ────────────────────────────────────
 print("\nRunning Stage 1 (background vs wetland)...")
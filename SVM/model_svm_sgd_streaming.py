@@ -0,0 +1,399 @@
+"""
+STREAMING SVM — Kernel Approximation + SGD (out-of-core)
+=========================================================
+Out-of-core alternative to model_svm_nystroem.py. That script fits
+Nystroem(n_components=300) + LinearSVC on the whole 1.2M x 64 training
+matrix in memory.
+
+Here the training set is never loaded whole:
+  1. The arrays in the .npz are extracted once to .npy files in
+     memmap_cache/. Every pass reads shuffled row chunks from the memory
+     map.
+  2. A StandardScaler is fitted with partial_fit over the chunks.
+  3. The RBF feature map (Nystroem, or random Fourier features with
+     --features rff) is fitted on a stratified sample of the training rows.
+  4. A hinge-loss SGDClassifier (a linear SVM, with averaged weights) is
+     trained with partial_fit for --epochs passes over shuffled chunks,
+     using the dataset's class weights. The scale + feature-map transform of
+     upcoming chunks runs on --n-jobs threads while SGD consumes the
+     current one.
+
+Evaluation streams the test chunks through an inference.ConfusionAccumulator.
+Accuracy and run time are reported against the current pipeline: the latest
+svm_nystroem_wetland_model_v*_metadata.json, or a same-machine refit with
+--baseline. Train / test split is the same as model_svm_nystroem.py
+(train_test_split, test_size=0.2, random_state=42).
+
+The saved model is a Pipeline(StandardScaler, feature map, SGDClassifier).
+It predicts like the Nystroem pipeline.
+
+Usage:
+    python model_svm_sgd_streaming.py [--features nystroem|rff] [--components 300]
+                                      [--epochs 5] [--chunk 32768] [--n-jobs 4] [--baseline]
+"""
+
+import argparse
+import contextlib
+import glob
+import json
+import os
+import re
+import sys
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import joblib
+import numpy as np
+from sklearn.kernel_approximation import Nystroem, RBFSampler
+from sklearn.linear_model import SGDClassifier
+from sklearn.model_selection import train_test_split
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from inference.metrics import ConfusionAccumulator
+from sweep import available_cores, stratified_subsample
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.path.join(SCRIPT_DIR, '..', 'wetland_dataset_1.5M_4Training.npz')
+MEMMAP_DIR = os.path.join(SCRIPT_DIR, 'memmap_cache')
+
+
+# ======================================
+# MEMORY-MAPPED DATA
+# ======================================
+def npz_memmap(npz_path, key, cache_dir=MEMMAP_DIR, block_bytes=64 * 1024 ** 2):
+    """
+    Read-only memory map of array `key` from an .npz file. On first use the
+    member is copied out of the archive in blocks to <cache_dir>/<stem>_<key>.npy,
+    so it is never held in memory whole. The copy is redone when the .npz
+    changes (size / mtime).
+    """
+    stat = os.stat(npz_path)
+    stamp = {'source': os.path.abspath(npz_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    stem = Path(npz_path).stem
+    npy_path = os.path.join(cache_dir, f'{stem}_{key}.npy')
+    stamp_path = npy_path + '.json'
+
+    if os.path.exists(npy_path) and os.path.exists(stamp_path):
+        with open(stamp_path) as f:
+            if json.load(f) == stamp:
+                return np.load(npy_path, mmap_mode='r')
+
+    os.makedirs(cache_dir, exist_ok=True)
+    print(f"  Extracting '{key}' from {os.path.basename(npz_path)} -> {npy_path}")
+    with zipfile.ZipFile(npz_path) as archive, archive.open(f'{key}.npy') as member:
+        version = np.lib.format.read_magic(member)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(member)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(member)
+        tmp_path = npy_path + '.tmp'
+        out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=dtype, shape=shape,
+                                        fortran_order=fortran_order)
+        flat = out.reshape(-1, order='A')
+        step = max(1, block_bytes // dtype.itemsize)
+        for start in range(0, flat.size, step):
+            count = min(step, flat.size - start)
+            flat[start:start + count] = np.frombuffer(member.read(count * dtype.itemsize), dtype=dtype)
+        out.flush()
+        del flat, out
+    os.replace(tmp_path, npy_path)
+    with open(stamp_path, 'w') as f:
+        json.dump(stamp, f)
+    return np.load(npy_path, mmap_mode='r')
+
+
+def iter_chunks(X, y, idx, chunk, rng=None):
+    """(X rows, y rows) for `idx` in chunks; shuffled when rng is given. Rows are read sorted per chunk."""
+    if rng is not None:
+        idx = idx[rng.permutation(len(idx))]
+    for start in range(0, len(idx), chunk):
+        rows = np.sort(idx[start:start + chunk])
+        yield np.asarray(X[rows], dtype=np.float32), np.asarray(y[rows])
+
+
+def prefetch_transform(chunks, transform, pool, lookahead):
+    """Yield (transform(X), y) per chunk, with up to `lookahead` chunks transforming ahead on `pool`."""
+    pending = deque()
+    for X_chunk, y_chunk in chunks:
+        pending.append((pool.submit(transform, X_chunk), y_chunk))
+        if len(pending) > lookahead:
+            future, y_ready = pending.popleft()
+            yield future.result(), y_ready
+    while pending:
+        future, y_ready = pending.popleft()
+        yield future.result(), y_ready
+
+
+def weighted(values, support):
+    """Support-weighted mean of per-class values (NaN counts as 0, as in sklearn's zero_division)."""
+    return float(np.sum(np.nan_to_num(values) * support) / max(support.sum(), 1))
+
+
+def parse_duration(text):
+    """Seconds in a str(timedelta) such as '0:18:38.659626'."""
+    h, m, s = text.split(':')
+    return int(h) * 3600 + int(m) * 60 + float(s)
+
+
+def latest_baseline_metadata():
+    """Metadata of the newest model_svm_nystroem.py run in this folder, or None."""
+    paths = glob.glob(os.path.join(SCRIPT_DIR, 'svm_nystroem_wetland_model_v*_metadata.json'))
+    if not paths:
+        return None
+    path = max(paths, key=lambda p: re.search(r'_(\d{8}_\d{6})_metadata', p).group(1))
+    with open(path) as f:
+        meta = json.load(f)
+    return {
+        'source':          os.path.basename(path),
+        'accuracy':        meta['overall_metrics']['accuracy'],
+        'f1_weighted':     meta['overall_metrics']['f1_weighted'],
+        'train_seconds':   parse_duration(meta['training_duration']),
+    }
+
+
+def run_baseline(X, y, train_idx, test_idx, class_weight_dict):
+    """Refit the in-memory model_svm_nystroem.py pipeline on the same split, for same-machine timing."""
+    from sklearn.svm import LinearSVC
+    from sklearn.metrics import accuracy_score, precision_recall_fscore_support
+
+    X_train, y_train = np.asarray(X[np.sort(train_idx)]), np.asarray(y[np.sort(train_idx)])
+    X_test, y_test = np.asarray(X[np.sort(test_idx)]), np.asarray(y[np.sort(test_idx)])
+    pipeline = make_pipeline(
+        StandardScaler(),
+        Nystroem(kernel='rbf', gamma=None, n_components=300, random_state=42),
+        LinearSVC(class_weight=class_weight_dict, random_state=42, dual=False, max_iter=1000),
+    )
+    start = datetime.now()
+    pipeline.fit(X_train, y_train)
+    seconds = (datetime.now() - start).total_seconds()
+    y_pred = pipeline.predict(X_test)
+    _, _, f1_avg, _ = precision_recall_fscore_support(y_test, y_pred, average='weighted', zero_division=0)
+    return {
+        'source':        'refit on this machine (--baseline)',
+        'accuracy':      float(accuracy_score(y_test, y_pred)),
+        'f1_weighted':   float(f1_avg),
+        'train_seconds': seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Out-of-core kernel-approximation SVM trained with SGD')
+    parser.add_argument('--data', default=DATA_PATH, help='.npz with X, y and class_weights')
+    parser.add_argument('--features', choices=['nystroem', 'rff'], default='nystroem',
+                        help='RBF feature map: Nystroem or random Fourier features (default: nystroem)')
+    parser.add_argument('--components', type=int, default=300, help='Feature-map dimension (default: 300)')
+    parser.add_argument('--gamma', type=float, default=None, help='RBF gamma (default: 1 / n_features)')
+    parser.add_argument('--fit-sample', type=int, default=20000,
+                        help='Training rows (stratified) used to fit the feature map (default: 20000)')
+    parser.add_argument('--epochs', type=int, default=5, help='Passes over the training set (default: 5)')
+    parser.add_argument('--chunk', type=int, default=32768, help='Rows per chunk (default: 32768)')
+    parser.add_argument('--alpha', type=float, default=1e-5, help='SGD L2 regularization (default: 1e-5)')
+    parser.add_argument('--n-jobs', type=int, default=None,
+                        help='Threads for the feature transform (default: all available cores)')
+    parser.add_argument('--baseline', action='store_true',
+                        help='Also refit the in-memory Nystroem + LinearSVC pipeline for a timing comparison')
+    args = parser.parse_args()
+    n_jobs = args.n_jobs or available_cores()
+
+    # ======================================
+    # LOAD THE DATA (memory-mapped)
+    # ======================================
+    print("Mapping data...")
+    if not os.path.exists(args.data):
+        print(f"Error: Dataset not found at {args.data}")
+        sys.exit(1)
+    X = npz_memmap(args.data, 'X')
+    y = np.asarray(npz_memmap(args.data, 'y'))   # labels are small; keep them in memory
+    with np.load(args.data) as data:
+        class_weights = data['class_weights']
+    class_weight_dict = {i: float(w) for i, w in enumerate(class_weights)}
+    classes = np.arange(len(class_weights))
+    print(f"X: {X.shape} {X.dtype} (memory-mapped) | classes: {classes.tolist()}")
+
+    # Same split as model_svm_nystroem.py
+    train_idx, test_idx = train_test_split(np.arange(len(y)), test_size=0.2, random_state=42)
+    print(f"Train: {len(train_idx):,} | Test: {len(test_idx):,} | chunk {args.chunk:,} rows | "
+          f"{n_jobs} transform threads\n")
+
+    # Keep BLAS to one thread per transform thread, only while the pool runs
+    # (the --baseline refit keeps the default threading)
+    limit_blas = contextlib.nullcontext
+    if n_jobs > 1:
+        try:
+            from threadpoolctl import threadpool_limits
+            limit_blas = lambda: threadpool_limits(1)
+        except ImportError:
+            pass
+
+    start_time = datetime.now()
+
+    # ======================================
+    # 1. STANDARD SCALER (streaming)
+    # ======================================
+    print("Fitting StandardScaler (streaming)...")
+    scaler = StandardScaler()
+    for X_chunk, _ in iter_chunks(X, y, np.sort(train_idx), args.chunk):
+        scaler.partial_fit(X_chunk)
+
+    # ======================================
+    # 2. FEATURE MAP (fitted on a stratified sample)
+    # ======================================
+    gamma = args.gamma if args.gamma is not None else 1.0 / X.shape[1]
+    sample = train_idx[stratified_subsample(y[train_idx], min(1.0, args.fit_sample / len(train_idx)))]
+    X_sample = scaler.transform(np.asarray(X[np.sort(sample)], dtype=np.float32))
+    if args.features == 'nystroem':
+        feature_map = Nystroem(kernel='rbf', gamma=gamma, n_components=args.components, random_state=42)
+    else:
+        feature_map = RBFSampler(gamma=gamma, n_components=args.components, random_state=42)
+    feature_map.fit(X_sample)
+    print(f"Fitted {type(feature_map).__name__} ({args.components} components, gamma={gamma:.4g}) "
+          f"on {len(X_sample):,} sampled rows")
+
+    def transform(X_chunk):
+        return feature_map.transform(scaler.transform(X_chunk))
+
+    # ======================================
+    # 3. SGD (hinge loss = linear SVM) over shuffled chunks
+    # ======================================
+    sgd = SGDClassifier(loss='hinge', alpha=args.alpha, class_weight=class_weight_dict, average=True,
+                        random_state=42)
+    rng = np.random.default_rng(42)
+    with limit_blas(), ThreadPoolExecutor(n_jobs) as pool:
+        for epoch in range(1, args.epochs + 1):
+            epoch_start = datetime.now()
+            for Z, y_chunk in prefetch_transform(iter_chunks(X, y, train_idx, args.chunk, rng), transform,
+                                                 pool, lookahead=n_jobs):
+                sgd.partial_fit(Z, y_chunk, classes=classes)
+            print(f"  Epoch {epoch}/{args.epochs} done in {datetime.now() - epoch_start}")
+        end_time = datetime.now()
+        print(f"Training completed in {end_time - start_time}")
+
+        # ======================================
+        # EVALUATE (streaming confusion matrix)
+        # ======================================
+        print("Predicting on test set...")
+        acc = ConfusionAccumulator(num_classes=len(classes))
+        for Z, y_chunk in prefetch_transform(iter_chunks(X, y, test_idx, args.chunk), transform,
+                                             pool, lookahead=n_jobs):
+            acc.update(y_chunk, sgd.predict(Z))
+
+    support = acc.support
+    precision, recall, f1 = acc.precision(), acc.recall(), acc.f1()
+    accuracy = acc.accuracy()
+    f1_avg = weighted(f1, support)
+
+    print(f"\n{'='*60}")
+    print(f"MODEL EVALUATION RESULTS ({type(feature_map).__name__} + SGD hinge, streaming)")
+    print(f"{'='*60}")
+    print(f"Accuracy: {accuracy:.4f} ({accuracy*100:.2f}%)")
+    print(f"Precision (weighted): {weighted(precision, support):.4f}")
+    print(f"Recall (weighted): {weighted(recall, support):.4f}")
+    print(f"F1-Score (weighted): {f1_avg:.4f}")
+    print(f"\n{'Class':>6}  {'precision':>9}  {'recall':>7}  {'f1':>6}  {'support':>8}")
+    for i in classes:
+        print(f"{i:>6}  {precision[i]:>9.4f}  {recall[i]:>7.4f}  {f1[i]:>6.4f}  {support[i]:>8,}")
+    print("\nConfusion Matrix:")
+    print(acc.matrix)
+
+    # ======================================
+    # COMPARE AGAINST THE CURRENT PIPELINE
+    # ======================================
+    train_seconds = (end_time - start_time).total_seconds()
+    baseline = run_baseline(X, y, train_idx, test_idx, class_weight_dict) if args.baseline \
+        else latest_baseline_metadata()
+    if baseline is not None:
+        print(f"\n{'='*60}")
+        print(f"COMPARISON vs Nystroem + LinearSVC ({baseline['source']})")
+        print(f"{'='*60}")
+        print(f"{'':>12}  {'accuracy':>9}  {'wt_f1':>7}  {'train time':>14}")
+        print(f"{'streaming':>12}  {accuracy:>9.4f}  {f1_avg:>7.4f}  {str(timedelta(seconds=round(train_seconds))):>14}")
+        print(f"{'baseline':>12}  {baseline['accuracy']:>9.4f}  {baseline['f1_weighted']:>7.4f}  "
+              f"{str(timedelta(seconds=round(baseline['train_seconds']))):>14}")
+        baseline['speedup'] = round(baseline['train_seconds'] / max(train_seconds, 1e-9), 2)
+        baseline['accuracy_delta'] = round(accuracy - baseline['accuracy'], 4)
+        print(f"Speed-up: {baseline['speedup']}x | accuracy delta: {baseline['accuracy_delta']:+.4f}")
+
+    # ======================================
+    # SAVE THE MODEL, TIME STAMP AND VERSION
+    # ======================================
+    print(f"\n{'='*60}")
+    print("SAVING MODEL")
+    print(f"{'='*60}")
+
+    version = 1
+    while glob.glob(os.path.join(SCRIPT_DIR, f'svm_sgd_streaming_model_v{version}_*.pkl')):
+        version += 1
+
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    model_filename = f'svm_sgd_streaming_model_v{version}_{timestamp}.pkl'
+    metadata_filename = f'svm_sgd_streaming_model_v{version}_{timestamp}_metadata.json'
+
+    svm_pipeline = make_pipeline(scaler, feature_map, sgd)
+    joblib.dump(svm_pipeline, os.path.join(SCRIPT_DIR, model_filename))
+
+    metadata = {
+        'version': version,
+        'timestamp': timestamp,
+        'model_type': f'{type(feature_map).__name__} + SGDClassifier (hinge, streaming)',
+        'trained_datetime': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'training_duration': str(end_time - start_time),
+
+        'overall_metrics': {
+            'accuracy': float(accuracy),
+            'precision_weighted': weighted(precision, support),
+            'recall_weighted': weighted(recall, support),
+            'f1_weighted': f1_avg,
+        },
+
+        'per_class_metrics': {
+            str(i): {
+                'precision': float(np.nan_to_num(precision[i])),
+                'recall': float(np.nan_to_num(recall[i])),
+                'f1_score': float(np.nan_to_num(f1[i])),
+                'support': int(support[i]),
+            }
+            for i in classes
+        },
+
+        'confusion_matrix': acc.matrix.tolist(),
+
+        'hyperparameters': {
+            'feature_map': args.features,
+            'n_components': args.components,
+            'kernel': 'rbf',
+            'gamma': gamma,
+            'feature_map_fit_rows': int(len(X_sample)),
+            'loss': 'hinge',
+            'alpha': args.alpha,
+            'epochs': args.epochs,
+            'chunk_rows': args.chunk,
+            'transform_threads': n_jobs,
+            'class_weight': 'custom',
+            'random_state': 42,
+            'standard_scaler': 'streaming partial_fit',
+        },
+        'dataset': {
+            'source': os.path.relpath(args.data, SCRIPT_DIR),
+            'n_train': int(len(train_idx)),
+            'n_test': int(len(test_idx)),
+            'n_features': int(X.shape[1]),
+        },
+        'class_weights': {str(k): float(v) for k, v in class_weight_dict.items()},
+        'comparison_vs_nystroem_linearsvc': baseline,
+    }
+
+    with open(os.path.join(SCRIPT_DIR, metadata_filename), 'w') as f:
+        json.dump(metadata, f, indent=2)
+
+    print(f"Model saved to: {model_filename}")
+    print(f"Metadata saved to: {metadata_filename}")
+    print(f"{'='*60}")
+
+
+if __name__ == '__main__':
+    main()
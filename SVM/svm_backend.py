@@ -0,0 +1,233 @@
+"""
+SVC backend for the RBF grid searches
+=====================================
+Exact RBF SVC is only practical on CPU for small training sets. libsvm is
+O(n^2) in memory and time, and probability=True adds an internal 5-fold
+Platt calibration. make_svc() picks the estimator for a given training-set
+size:
+
+  cuml       cuML SVC on the GPU (as before, when cuML is installed)
+  exact      sklearn SVC(probability=True), up to max_exact samples
+  subsample  sklearn SVC on a stratified subsample of max_exact rows
+  nystroem   Nystroem RBF features + LinearSVC on all rows
+
+'auto' takes cuml when available, then exact up to max_exact rows. Above
+that it takes subsample while that keeps at least a quarter of the rows,
+and nystroem otherwise. The substitutes hold out a stratified calibration
+slice and fit a Platt / multinomial logistic head on its decision values,
+so predict_proba stays calibrated without the 5-fold refit.
+
+    model, info = make_svc(C=10.0, gamma='scale', class_weight='balanced', n_samples=len(X_train))
+    model.fit(X_train, y_train)
+    metadata['svm_backend'] = info        # strategy, reason, estimator description
+
+Other modules add strategies with register_strategy(); svm_ensemble.py
+adds 'bagged' (exact SVCs on disjoint shards of at most max_exact rows,
+decision functions averaged). The saved models
+are plain sklearn estimators: predict, decision_function and
+predict_proba work as for SVC.
+"""
+
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+from sklearn.base import BaseEstimator, ClassifierMixin
+from sklearn.kernel_approximation import Nystroem
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import make_pipeline
+from sklearn.svm import SVC, LinearSVC
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from sweep import stratified_subsample
+
+try:
+    from cuml.svm import SVC as cuSVC
+    USE_CUML = True
+except ImportError:
+    cuSVC = None
+    USE_CUML = False
+
+# Above this many training rows exact libsvm (with probability=True) is not practical on CPU
+EXACT_MAX_SAMPLES = int(os.environ.get('SVM_EXACT_MAX_SAMPLES', 50_000))
+CALIBRATION_ROWS = 20_000
+
+
+def resolve_gamma(gamma, X):
+    """Numeric RBF gamma, with sklearn's meaning of 'scale' and 'auto'."""
+    if gamma == 'scale':
+        var = float(np.var(X))
+        return 1.0 / (X.shape[1] * var) if var > 0 else 1.0
+    if gamma == 'auto':
+        return 1.0 / X.shape[1]
+    return float(gamma)
+
+
+def to_numpy(y_pred):
+    """Predictions as a NumPy array (cuML may return CuPy arrays)."""
+    return y_pred.get() if hasattr(y_pred, 'get') else np.asarray(y_pred)
+
+
+class CalibratedSVMBase(ClassifierMixin, BaseEstimator):
+    """
+    Shared fit / predict for the scalable substitutes. A stratified slice of
+    up to calibration_rows rows is held out. The subclass's _fit_base trains
+    on the rest, and a logistic head maps decision values on the slice to
+    probabilities (Platt scaling for binary problems).
+    """
+
+    def fit(self, X, y):
+        y = np.asarray(y)
+        fraction = min(0.1, self.calibration_rows / max(len(y), 1))
+        cal = stratified_subsample(y, fraction, seed=self.random_state)
+        fit_mask = np.ones(len(y), dtype=bool)
+        fit_mask[cal] = False
+        self._fit_base(X[fit_mask], y[fit_mask])
+        self.n_calibration_ = len(cal)
+        self.head_ = LogisticRegression(max_iter=1000).fit(self._scores(X[cal]), y[cal])
+        return self
+
+    def _scores(self, X):
+        return np.asarray(self.decision_function(X)).reshape(len(X), -1)
+
+    def predict(self, X):
+        scores = self._scores(X)
+        if scores.shape[1] == 1:
+            return self.classes_[(scores[:, 0] > 0).astype(int)]
+        return self.classes_[np.argmax(scores, axis=1)]
+
+    def predict_proba(self, X):
+        return self.head_.predict_proba(self._scores(X))
+
+
+class SubsampledSVC(CalibratedSVMBase):
+    """Exact RBF SVC fitted on a stratified subsample of at most max_samples rows."""
+
+    def __init__(self, C=1.0, gamma='scale', class_weight=None, max_samples=EXACT_MAX_SAMPLES,
+                 calibration_rows=CALIBRATION_ROWS, cache_size=1000, random_state=42):
+        self.C = C
+        self.gamma = gamma
+        self.class_weight = class_weight
+        self.max_samples = max_samples
+        self.calibration_rows = calibration_rows
+        self.cache_size = cache_size
+        self.random_state = random_state
+
+    def _fit_base(self, X, y):
+        idx = stratified_subsample(y, min(1.0, self.max_samples / len(y)), seed=self.random_state)
+        self.svc_ = SVC(kernel='rbf', C=self.C, gamma=self.gamma, class_weight=self.class_weight,
+                        cache_size=self.cache_size)
+        self.svc_.fit(X[idx], y[idx])
+        self.classes_ = self.svc_.classes_
+        self.n_fit_ = len(idx)
+
+    def decision_function(self, X):
+        return self.svc_.decision_function(X)
+
+
+class NystroemSVM(CalibratedSVMBase):
+    """Nystroem approximation of the RBF kernel + LinearSVC, trained on every row."""
+
+    def __init__(self, C=1.0, gamma='scale', class_weight=None, n_components=1000,
+                 calibration_rows=CALIBRATION_ROWS, random_state=42):
+        self.C = C
+        self.gamma = gamma
+        self.class_weight = class_weight
+        self.n_components = n_components
+        self.calibration_rows = calibration_rows
+        self.random_state = random_state
+
+    def _fit_base(self, X, y):
+        self.gamma_ = resolve_gamma(self.gamma, X)
+        self.pipeline_ = make_pipeline(
+            Nystroem(kernel='rbf', gamma=self.gamma_, n_components=min(self.n_components, len(X)),
+                     random_state=self.random_state),
+            LinearSVC(C=self.C, class_weight=self.class_weight, dual=False, max_iter=2000,
+                      random_state=self.random_state),
+        )
+        self.pipeline_.fit(X, y)
+        self.classes_ = self.pipeline_.classes_
+        self.n_fit_ = len(X)
+
+    def decision_function(self, X):
+        return self.pipeline_.decision_function(X)
+
+
+# name -> (estimator class, one-line description)
+STRATEGIES = {
+    'subsample': (SubsampledSVC, 'RBF SVC on a stratified subsample'),
+    'nystroem':  (NystroemSVM, 'Nystroem RBF features + LinearSVC on all rows'),
+}
+
+
+def register_strategy(name, estimator_class, description):
+    """Make estimator_class(C=, gamma=, class_weight=, random_state=, **options) available as `name`."""
+    STRATEGIES[name] = (estimator_class, description)
+
+
+def strategy_choices():
+    return ['auto', 'cuml', 'exact', *STRATEGIES]
+
+
+def resolve_strategy(strategy, n_samples, max_exact=EXACT_MAX_SAMPLES):
+    """(strategy name, reason) for a training set of n_samples rows."""
+    if strategy != 'auto':
+        return strategy, 'requested'
+    if USE_CUML:
+        return 'cuml', 'cuML available'
+    if n_samples <= max_exact:
+        return 'exact', f'{n_samples:,} rows <= {max_exact:,}'
+    if n_samples <= 4 * max_exact:
+        return 'subsample', f'{n_samples:,} rows > {max_exact:,}; subsample keeps >= 25%'
+    return 'nystroem', f'{n_samples:,} rows > {4 * max_exact:,}'
+
+
+def make_svc(C, gamma, class_weight, n_samples, strategy='auto', max_exact=EXACT_MAX_SAMPLES,
+             probability=True, random_state=42, n_jobs=1, **options):
+    """
+    (unfitted estimator, info dict) for an RBF SVM with the given
+    hyperparameters on n_samples training rows. `info` records the strategy
+    and why it was chosen, for the model metadata. `options` go to the
+    chosen substitute's constructor, and so does n_jobs if it takes one.
+    """
+    name, reason = resolve_strategy(strategy, n_samples, max_exact)
+    info = {'strategy': name, 'reason': reason, 'n_train': int(n_samples), 'max_exact': int(max_exact)}
+
+    if name == 'cuml':
+        if not USE_CUML:
+            raise ValueError("strategy 'cuml' requested but cuML is not installed")
+        # cuML does not support probability=True natively
+        model = cuSVC(kernel='rbf', C=C, gamma=gamma, class_weight=class_weight)
+        info.update(backend='cuML (GPU)', estimator='cuml.svm.SVC', probability='none')
+    elif name == 'exact':
+        model = SVC(kernel='rbf', C=C, gamma=gamma, class_weight=class_weight, probability=probability,
+                    random_state=random_state)
+        info.update(backend='sklearn (CPU)', estimator='sklearn.svm.SVC',
+                    probability='libsvm 5-fold Platt' if probability else 'none')
+    elif name in STRATEGIES:
+        estimator_class, description = STRATEGIES[name]
+        if name == 'subsample':
+            options.setdefault('max_samples', max_exact)
+        elif name == 'bagged':
+            # Shards of at most max_exact rows, so each member is an exact fit of practical size
+            options.setdefault('n_shards', max(1, -(-int(n_samples) // max_exact)))
+        if 'n_jobs' in estimator_class().get_params():
+            options.setdefault('n_jobs', n_jobs)
+        model = estimator_class(C=C, gamma=gamma, class_weight=class_weight, random_state=random_state, **options)
+        info.update(backend=f'sklearn (CPU) — {name}', estimator=f'{estimator_class.__name__}: {description}',
+                    probability='logistic head on a held-out calibration slice',
+                    params={k: v for k, v in model.get_params().items()
+                            if k not in ('C', 'gamma', 'class_weight', 'random_state', 'n_jobs')})
+    else:
+        raise ValueError(f"unknown SVM strategy {name!r}; choose from {strategy_choices()}")
+    return model, info
+
+
+def fit_details(model, info):
+    """info plus what the fitted model actually trained / calibrated on."""
+    details = dict(info)
+    for attr, key in (('n_fit_', 'n_fit'), ('n_calibration_', 'n_calibration'), ('gamma_', 'gamma_resolved')):
+        if hasattr(model, attr):
+            details[key] = getattr(model, attr)
+    return details
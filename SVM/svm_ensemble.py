@@ -0,0 +1,129 @@
+"""
+Bagged RBF SVC ensemble
+=======================
+Exact SVC training time grows much faster than linearly with the number of
+rows. BaggedSVC splits the training set into n_shards stratified, disjoint
+shards and fits one exact RBF SVC per shard, in parallel processes. Every
+row is used by exactly one member. The members are combined by averaging
+their decision functions.
+
+All members share one numeric gamma, resolved on the full training set.
+Their support vectors are stacked, so inference computes a single RBF
+kernel block against every member's support vectors at once. The averaged
+one-vs-one decision values then come from one matrix product, instead of
+n_shards separate predict calls.
+
+predict / decision_function / predict_proba work as for the SVC models the
+grid searches save. predict_proba uses the same held-out logistic head as
+the other substitutes in svm_backend.py. Importing this module registers
+the 'bagged' strategy:
+
+    model, info = make_svc(C=10.0, gamma='scale', class_weight='balanced',
+                           n_samples=len(y_train), strategy='bagged', n_jobs=4)
+"""
+
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from sklearn.metrics.pairwise import rbf_kernel
+from sklearn.svm import SVC
+from sklearn.utils.multiclass import _ovr_decision_function
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from svm_backend import CALIBRATION_ROWS, CalibratedSVMBase, register_strategy, resolve_gamma
+
+# Kernel block size at inference (bytes of float64 kernel values per block)
+KERNEL_BLOCK_BYTES = 256 * 1024 ** 2
+
+
+def stratified_shards(y, n_shards, seed=42):
+    """n_shards disjoint index arrays, each with about 1/n_shards of every class."""
+    rng = np.random.default_rng(seed)
+    shards = [[] for _ in range(n_shards)]
+    for cls in np.unique(y):
+        idx = np.flatnonzero(y == cls)
+        # Rotate the starting shard so small classes do not all land in shard 0
+        for k, part in enumerate(np.array_split(idx[rng.permutation(len(idx))], n_shards)):
+            shards[(k + int(cls)) % n_shards].append(part)
+    return [np.sort(np.concatenate(parts)) for parts in shards]
+
+
+def _fit_member(X, y, params):
+    return SVC(kernel='rbf', **params).fit(X, y)
+
+
+class BaggedSVC(CalibratedSVMBase):
+    """Average of exact RBF SVCs, each fitted on one stratified shard of the training set."""
+
+    def __init__(self, C=1.0, gamma='scale', class_weight=None, n_shards=4, n_jobs=1,
+                 calibration_rows=CALIBRATION_ROWS, cache_size=1000, random_state=42):
+        self.C = C
+        self.gamma = gamma
+        self.class_weight = class_weight
+        self.n_shards = n_shards
+        self.n_jobs = n_jobs
+        self.calibration_rows = calibration_rows
+        self.cache_size = cache_size
+        self.random_state = random_state
+
+    def _fit_base(self, X, y):
+        self.gamma_ = resolve_gamma(self.gamma, X)
+        shards = stratified_shards(y, max(1, self.n_shards), seed=self.random_state)
+        params = {'C': self.C, 'gamma': self.gamma_, 'class_weight': self.class_weight,
+                  'cache_size': self.cache_size}
+        if self.n_jobs > 1 and len(shards) > 1:
+            with ProcessPoolExecutor(max_workers=min(self.n_jobs, len(shards))) as pool:
+                futures = [pool.submit(_fit_member, X[idx], y[idx], params) for idx in shards]
+                self.estimators_ = [f.result() for f in futures]
+        else:
+            self.estimators_ = [_fit_member(X[idx], y[idx], params) for idx in shards]
+
+        self.classes_ = np.unique(y)
+        for member in self.estimators_:
+            if not np.array_equal(member.classes_, self.classes_):
+                raise ValueError(f"a shard is missing classes; use fewer than {self.n_shards} shards")
+        self._stack_members()
+        self.n_fit_ = len(y)
+        return self
+
+    def _stack_members(self):
+        """Stacked support vectors and the (n_SV, n_pairs) weights giving the averaged ovo decisions."""
+        n_classes = len(self.classes_)
+        pairs = [(i, j) for i in range(n_classes) for j in range(i + 1, n_classes)]
+        vectors, weights = [], []
+        intercept = np.zeros(len(pairs))
+        for member in self.estimators_:
+            starts = np.concatenate([[0], np.cumsum(member.n_support_)])
+            coef = np.zeros((len(member.support_vectors_), len(pairs)))
+            for p, (i, j) in enumerate(pairs):
+                # libsvm layout: SVs of class i carry their coefficient vs j in row j-1, SVs of j in row i
+                coef[starts[i]:starts[i + 1], p] = member.dual_coef_[j - 1, starts[i]:starts[i + 1]]
+                coef[starts[j]:starts[j + 1], p] = member.dual_coef_[i, starts[j]:starts[j + 1]]
+            vectors.append(member.support_vectors_)
+            weights.append(coef)
+            intercept += member.intercept_
+        k = len(self.estimators_)
+        self.support_vectors_ = np.vstack(vectors)
+        self.pair_coef_ = np.vstack(weights) / k
+        self.pair_intercept_ = intercept / k
+
+    def _ovo_decision(self, X):
+        X = np.asarray(X, dtype=self.support_vectors_.dtype)
+        out = np.empty((len(X), self.pair_coef_.shape[1]))
+        step = max(1, KERNEL_BLOCK_BYTES // (8 * max(len(self.support_vectors_), 1)))
+        for start in range(0, len(X), step):
+            K = rbf_kernel(X[start:start + step], self.support_vectors_, gamma=self.gamma_)
+            out[start:start + step] = K @ self.pair_coef_ + self.pair_intercept_
+        return out
+
+    def decision_function(self, X):
+        """Averaged member decisions: (n,) for two classes, one-vs-rest (n, n_classes) otherwise."""
+        dec = self._ovo_decision(X)
+        if len(self.classes_) == 2:
+            return dec[:, 0]
+        return _ovr_decision_function(dec < 0, -dec, len(self.classes_))
+
+
+register_strategy('bagged', BaggedSVC, 'exact RBF SVCs on disjoint stratified shards, decision functions averaged')
@@ -0,0 +1,78 @@
+"""
+Benchmark CNN batch loading with per-sample vs batched augmentation.
+
+    per-sample : NPZPatchDataset(is_train=True), np.flip / np.rot90 + copy per sample
+    collate    : NPZPatchDataset(is_train=False) + augment_collate (batched, in the workers)
+    main process / on-device : dihedral_augment on each loaded batch (what train.py does)
+    none       : no augmentation (upper bound)
+
+on random (N, 64, P, P) patches, through the same DataLoader settings as
+train.py.
+
+Usage:
+    python -m cnn.benchmark_augment
+    python -m cnn.benchmark_augment --samples 50000 --workers 2 --epochs 3
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+
+from cnn.data import NPZPatchDataset, augment_collate, dihedral_augment
+
+
+def samples_per_second(loader, epochs: int, on_device=None) -> float:
+    n = 0
+    t0 = time.perf_counter()
+    for _ in range(epochs):
+        for xb, _ in loader:
+            if on_device is not None:
+                xb = on_device(xb)
+            n += xb.shape[0]
+    return n / (time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-sample vs batched augmentation throughput")
+    parser.add_argument("--samples", type=int, default=20000)
+    parser.add_argument("--patch-size", type=int, default=15)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--epochs", type=int, default=2)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    X = rng.standard_normal((args.samples, 64, args.patch_size, args.patch_size), dtype=np.float32)
+    y = rng.integers(0, 6, args.samples)
+
+    def loader(is_train, collate_fn=None):
+        ds = NPZPatchDataset(X, y, is_train=is_train)
+        return DataLoader(ds, batch_size=args.batch_size, shuffle=True, num_workers=args.workers,
+                          collate_fn=collate_fn, persistent_workers=args.workers > 0)
+
+    runs = [
+        ("per-sample", loader(True), None),
+        ("collate", loader(False, augment_collate), None),
+        ("main process", loader(False), dihedral_augment),
+        ("none", loader(False), None),
+    ]
+    if torch.cuda.is_available():
+        runs.insert(3, ("on-device", loader(False), lambda xb: dihedral_augment(xb.cuda(non_blocking=True))))
+
+    print(f"{args.samples} x (64, {args.patch_size}, {args.patch_size}) | batch {args.batch_size} | "
+          f"{args.workers} workers | {args.epochs} epochs")
+    baseline = None
+    for name, dl, on_device in runs:
+        samples_per_second(dl, 1, on_device)   # warm up workers / caches
+        rate = samples_per_second(dl, args.epochs, on_device)
+        baseline = baseline or rate
+        print(f"  {name:13s} {rate:12,.0f} samples/s  ({rate / baseline:5.2f}x per-sample)")
+
+
+if __name__ == "__main__":
+    main()
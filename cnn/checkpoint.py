@@ -0,0 +1,87 @@
+"""
+Training checkpoints written off the training thread.
+
+    writer = AsyncCheckpointer()
+    writer.save(path, {"model": model.state_dict(), "rng": rng_state(), ...})
+    ...                       # training continues while the file is written
+    writer.wait()             # before reading a checkpoint back / at exit
+
+save() snapshots every tensor to CPU on the calling thread, so the training
+step that follows cannot change what ends up on disk, and hands the
+serialization to a single background thread (writes land in order). Files are
+written to <path>.tmp and renamed, so a crash mid-write never leaves a
+truncated checkpoint behind.
+"""
+
+from __future__ import annotations
+
+import os
+import random
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+import torch
+
+
+def snapshot(obj):
+    """Copy of a (nested dict / list / tuple of) state with every tensor cloned to CPU."""
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return {k: snapshot(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(snapshot(v) for v in obj)
+    return obj
+
+
+def _write(path: str, state) -> str:
+    tmp = f"{path}.tmp"
+    torch.save(state, tmp)
+    os.replace(tmp, path)
+    return path
+
+
+class AsyncCheckpointer:
+    """Writes torch.save checkpoints on one background thread."""
+
+    def __init__(self):
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="checkpoint")
+        self._pending: list[Future] = []
+
+    def save(self, path: str, state) -> None:
+        # Surface errors from earlier writes instead of losing them
+        for f in [f for f in self._pending if f.done()]:
+            self._pending.remove(f)
+            f.result()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._pending.append(self._pool.submit(_write, path, snapshot(state)))
+
+    def wait(self) -> None:
+        """Block until every queued checkpoint is on disk."""
+        pending, self._pending = self._pending, []
+        for f in pending:
+            f.result()
+
+    def close(self) -> None:
+        self.wait()
+        self._pool.shutdown()
+
+
+def rng_state() -> dict:
+    """Python, NumPy and torch (CPU + CUDA) RNG states."""
+    state = {
+        "python": random.getstate(),
+        "numpy": np.random.get_state(),
+        "torch": torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def set_rng_state(state: dict) -> None:
+    random.setstate(state["python"])
+    np.random.set_state(state["numpy"])
+    torch.set_rng_state(state["torch"])
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
@@ -2,39 +2,93 @@ from __future__ import annotations
 
 import numpy as np
 import torch
-from torch.utils.data import Dataset
+from torch.utils.data import Dataset, default_collate, get_worker_info
 import random
 
 
+class ChannelStats:
+    """
+    Streaming per-channel mean / std (Chan et al.'s parallel form of
+    Welford's update): each update() folds in the float64 mean and sum of
+    squared deviations of one chunk, so a dataset of any size is summarised
+    in one pass with no full-size temporary and without the cancellation of
+    the sum / sum-of-squares formula.
+    """
+
+    def __init__(self, n_channels: int):
+        self.count = 0
+        self.mean = np.zeros(n_channels, dtype=np.float64)
+        self.m2 = np.zeros(n_channels, dtype=np.float64)
+
+    def update(self, x: np.ndarray):
+        """Fold in (n, n_channels) values."""
+        x = np.asarray(x, dtype=np.float64)
+        n = x.shape[0]
+        if n == 0:
+            return
+        mean = x.mean(axis=0)
+        m2 = ((x - mean) ** 2).sum(axis=0)
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * (n / total)
+        self.m2 += m2 + delta ** 2 * (self.count * n / total)
+        self.count = total
+
+    @property
+    def std(self) -> np.ndarray:
+        """Population std (as np.std)."""
+        return np.sqrt(self.m2 / max(self.count, 1))
+
+
+def channel_stats(X: np.ndarray, chunk_size: int = 4096) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Per-channel mean / std of (N, C, H, W) patches or (N, C) pixels, reading
+    chunk_size samples at a time so X can be a memory-mapped array.
+    """
+    stats = ChannelStats(X.shape[1])
+    for start in range(0, X.shape[0], chunk_size):
+        chunk = np.asarray(X[start:start + chunk_size], dtype=np.float32)
+        stats.update(np.moveaxis(chunk, 1, -1).reshape(-1, X.shape[1]))
+    return stats.mean, stats.std
+
+
 class NPZPatchDataset(Dataset):
-    def __init__(self, X: np.ndarray, y: np.ndarray, mean: np.ndarray | None = None, std: np.ndarray | None = None, is_train: bool = False):
+    """
+    Pre-cut patches, in memory or memory-mapped (np.load(..., mmap_mode="r")).
+    Normalization is applied per sample in __getitem__, so X is never copied;
+    index restricts the dataset to those rows of X. is_train applies the
+    per-sample flip / rot90 augmentation in __getitem__; train.py leaves it
+    off and augments whole batches with dihedral_augment instead.
+    """
+    def __init__(self, X: np.ndarray, y: np.ndarray, mean: np.ndarray | None = None, std: np.ndarray | None = None, is_train: bool = False,
+                 index: np.ndarray | None = None):
         # Allow arrays of any shape, but expect (N, C, H, W) for CNN patches
-        self.X = X.astype(np.float32, copy=False)
+        self.X = X
         self.y = y.astype(np.int64, copy=False)
+        self.index = None if index is None else np.asarray(index, dtype=np.int64)
         self.is_train = is_train
 
         # Normalization (per channel)
-        # Expected mean/std shape: (C,) -> expand to (1, C, 1, 1) for broadcasting
-        # Fallback if standard MLP: (C,) -> expand to (1, C)
+        # Expected mean/std shape: (C,) -> expand to (C, 1, 1) for broadcasting against one sample
+        # Fallback if standard MLP: (C,) -> (C,)
+        self.mean_b = self.std_b = None
         if mean is not None and std is not None:
             std = np.where(std == 0, 1.0, std)
-            
-            # Broadcast appropriately based on dimensions of X
-            if self.X.ndim == 4:
-                mean_b = mean.reshape(1, -1, 1, 1)
-                std_b = std.reshape(1, -1, 1, 1)
-            else:
-                mean_b = mean.reshape(1, -1)
-                std_b = std.reshape(1, -1)
-                
-            self.X = (self.X - mean_b.astype(np.float32)) / std_b.astype(np.float32)
+            shape = (-1, 1, 1) if self.X.ndim == 4 else (-1,)
+            self.mean_b = np.asarray(mean, dtype=np.float32).reshape(shape)
+            self.std_b = np.asarray(std, dtype=np.float32).reshape(shape)
 
     def __len__(self) -> int:
-        return int(self.y.shape[0])
+        return int(self.y.shape[0] if self.index is None else self.index.shape[0])
 
     def __getitem__(self, idx: int):
-        x = self.X[idx]
+        if self.index is not None:
+            idx = self.index[idx]
+        x = np.array(self.X[idx], dtype=np.float32)
         y = self.y[idx]
+        if self.mean_b is not None:
+            x -= self.mean_b
+            x /= self.std_b
         
         # Spatial Augmentations
         if self.is_train and x.ndim == 3: # (C, H, W)
@@ -58,4 +112,139 @@ class NPZPatchDataset(Dataset):
         if self.is_train and x.ndim == 3:
             x = x.copy()
             
-        return torch.from_numpy(x), torch.tensor(y, dtype=torch.long)
\ No newline at end of file
+        return torch.from_numpy(x), torch.tensor(y, dtype=torch.long)
+
+class EmbeddingPatchDataset(Dataset):
+    """
+    Patches cut on the fly from a pixel-interleaved embedding store
+    (data_preprocessing/build_pixel_store.py), so no (N, 64, P, P) patch file
+    has to be generated for a given patch size.
+
+    rows / cols are the raster coordinates of the patch centres. Patches that
+    cross tile borders are stitched from the neighbouring tiles; pixels
+    outside any tile (or NaN) become `nan_fill` after normalization, i.e.
+    the channel mean by default. Call complete() to drop such patches
+    instead, as the .npz patch datasets did.
+    """
+
+    def __init__(self, store, rows: np.ndarray, cols: np.ndarray, y: np.ndarray, patch_size: int = 15,
+                 mean: np.ndarray | None = None, std: np.ndarray | None = None, is_train: bool = False,
+                 nan_fill: float = 0.0):
+        from inference import PixelStore
+
+        if patch_size % 2 == 0:
+            raise ValueError(f"patch_size must be odd, got {patch_size}")
+        self.store = store if isinstance(store, PixelStore) else PixelStore(store)
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.cols = np.asarray(cols, dtype=np.int64)
+        self.y = np.asarray(y).astype(np.int64, copy=False)
+        self.patch_size = patch_size
+        self.radius = patch_size // 2
+        self.is_train = is_train
+        self.nan_fill = nan_fill
+        self.mean = None if mean is None else np.asarray(mean, dtype=np.float32)
+        self.std = None if std is None else np.where(np.asarray(std) == 0, 1.0, std).astype(np.float32)
+
+        # Tile holding each patch centre; patches fully inside it are sliced directly
+        self._tile_of = np.full(self.rows.size, -1, dtype=np.int64)
+        self._bounds = []
+        for i, (tile, (th, tw)) in enumerate(zip(self.store.tiles, self.store._shapes)):
+            self._bounds.append((tile.row_off, tile.col_off, th, tw))
+            inside = ((self.rows >= tile.row_off) & (self.rows < tile.row_off + th) &
+                      (self.cols >= tile.col_off) & (self.cols < tile.col_off + tw))
+            self._tile_of[inside] = i
+        self._tiles = {}   # memmaps, opened lazily per DataLoader worker
+
+    def __len__(self) -> int:
+        return int(self.y.shape[0])
+
+    def _patch(self, idx: int) -> np.ndarray:
+        """(P, P, bands) float32 patch centred on sample idx."""
+        r0 = int(self.rows[idx]) - self.radius
+        c0 = int(self.cols[idx]) - self.radius
+        t = self._tile_of[idx]
+        if t >= 0:
+            row_off, col_off, th, tw = self._bounds[t]
+            lr, lc = r0 - row_off, c0 - col_off
+            if lr >= 0 and lc >= 0 and lr + self.patch_size <= th and lc + self.patch_size <= tw:
+                if t not in self._tiles:
+                    self._tiles[t] = self.store.open_tile(t)
+                block = self._tiles[t][lr:lr + self.patch_size, lc:lc + self.patch_size]
+                return np.array(self.store.decode(block), dtype=np.float32)
+        # Halo crosses a tile border (or the centre is uncovered): stitch
+        return self.store.read_window(r0, c0, self.patch_size, self.patch_size)
+
+    def complete(self) -> 'EmbeddingPatchDataset':
+        """Keep only samples whose whole patch is covered and NaN-free (one read pass)."""
+        keep = np.array([not np.isnan(self._patch(i)).any() for i in range(len(self))], dtype=bool)
+        return self.subset(keep)
+
+    def subset(self, selector) -> 'EmbeddingPatchDataset':
+        """New dataset over the selected samples (boolean mask or indices)."""
+        return EmbeddingPatchDataset(self.store, self.rows[selector], self.cols[selector], self.y[selector],
+                                     self.patch_size, self.mean, self.std, self.is_train, self.nan_fill)
+
+    def __getitem__(self, idx: int):
+        x = self._patch(idx)
+        if self.mean is not None:
+            x -= self.mean
+            x /= self.std
+        np.nan_to_num(x, copy=False, nan=self.nan_fill)
+        x = np.ascontiguousarray(x.transpose(2, 0, 1))   # (C, H, W)
+
+        if self.is_train:
+            if random.random() > 0.5:
+                x = np.flip(x, axis=2)
+            if random.random() > 0.5:
+                x = np.flip(x, axis=1)
+            k = random.randint(0, 3)
+            if k > 0:
+                x = np.rot90(x, k=k, axes=(1, 2))
+            x = x.copy()
+
+        return torch.from_numpy(x), torch.tensor(self.y[idx], dtype=torch.long)
+
+
+
+def _dihedral_table(size: int, device) -> torch.Tensor:
+    """(8, size * size) flat-pixel permutations: op & 4 = h-flip, op & 3 = 90-degree turns."""
+    base = torch.arange(size * size, device=device).reshape(size, size)
+    return torch.stack([
+        torch.rot90(torch.flip(base, dims=(1,)) if op & 4 else base, k=op & 3, dims=(0, 1)).reshape(-1)
+        for op in range(8)
+    ])
+
+
+def dihedral_augment(x: torch.Tensor, generator: torch.Generator | None = None,
+                     out: torch.Tensor | None = None) -> torch.Tensor:
+    """
+    One random element of the dihedral group (the 8 flip / 90-degree rotation
+    combinations) per sample of an (N, C, H, W) batch of square patches.
+    Every element is a fixed permutation of the H * W pixels, so the whole
+    batch is transformed by a single torch.gather against a per-sample row
+    of the permutation table; no Python loop over samples or groups. Same
+    distribution as the per-sample path (random h-flip, v-flip, then
+    k ~ U{0..3} rotations). out, if given, receives the result.
+    """
+    n, c, h, w = x.shape
+    if h != w:
+        raise ValueError(f"dihedral_augment needs square patches, got {h}x{w}")
+    ops = torch.randint(0, 8, (n,), generator=generator).to(x.device)
+    index = _dihedral_table(h, x.device)[ops]
+    if out is None:
+        out = torch.empty_like(x)
+    torch.gather(x.reshape(n, c, h * w), 2, index[:, None, :].expand(n, c, h * w),
+                 out=out.view(n, c, h * w))
+    return out
+
+
+def augment_collate(batch):
+    """Stack a batch and dihedral_augment it, for DataLoader workers on CPU."""
+    xs, ys = zip(*batch)
+    xb = torch.stack(xs)
+    out = torch.empty_like(xb)
+    if get_worker_info() is not None:
+        # Like default_collate, put the returned batch in shared memory so it
+        # isn't copied again on its way back to the main process
+        out.share_memory_()
+    return dihedral_augment(xb, out=out), default_collate(ys)
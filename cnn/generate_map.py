@@ -0,0 +1,326 @@
+"""
+Generate Wetland Classification GeoTIFF Map from a trained WetlandCNN15
+=======================================================================
+Runs the CNN fully convolutionally (cnn.models.DenseWetlandCNN15) over
+chunks of every embedding tile plus a halo, giving one prediction per
+pixel without cutting a 15x15 patch per pixel. Halos that cross tile
+borders are read from the neighbouring tiles through the tile index
+(inference.open_embeddings), so tile edges are classified with their real
+neighbourhood. Output is a Cloud Optimized GeoTIFF on the labels grid.
+
+The dense result reproduces cutting each 15x15 patch exactly, including
+the zero padding at the patch border (about 3x faster on CPU).
+--approximate lets border taps read the real neighbours instead, which is
+several times faster again but only approximates the trained model.
+--check N measures the agreement with cut patches on N random pixels.
+Exact mode holds about 2 GB per 256-pixel chunk in a batch.
+
+Usage:
+    python -m cnn.generate_map <embeddings_dir> --model cnn/wetland_cnn_v2_<timestamp>.pt
+    python -m cnn.generate_map <pixel_store> --model <.pt> --chunk 256 --batch 2 --threads 8 --check 2000
+    python -m cnn.generate_map <embeddings_dir> --model <.pt> --approximate --batch 4
+"""
+
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import rasterio
+import rasterio.shutil
+import torch
+from rasterio.windows import Window
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from inference import Region, TileCatalog, open_embeddings
+from cnn.models import DenseWetlandCNN15, WetlandCNN15
+
+DEFAULT_LABELS_PATH = os.path.join(os.path.dirname(__file__), '..', 'data_preprocessing', 'bow_river_wetlands_10m_final.tif')
+DEFAULT_OUTPUT_PATH = os.path.join(os.path.dirname(__file__), 'bow_river_classification_cnn.tif')
+
+CLASS_NAMES = {
+    0: 'Background/Upland',
+    1: 'Marsh',
+    2: 'Swamp',
+    3: 'Shallow Water',
+    4: 'Fen',
+    5: 'Bog',
+}
+NODATA_VALUE = 255
+
+
+def load_cnn(model_path, metadata_path=None):
+    """(WetlandCNN15 in eval mode, mean, std, patch_size) from a train.py checkpoint."""
+    metadata_path = metadata_path or str(Path(model_path).with_suffix('')) + '_metadata.json'
+    meta = {}
+    if os.path.exists(metadata_path):
+        with open(metadata_path, encoding='utf-8') as f:
+            meta = json.load(f)
+    model_type = meta.get('model_type', 'WetlandCNN15')
+    if model_type != 'WetlandCNN15':
+        raise ValueError(f"dense map inference needs a WetlandCNN15 checkpoint, got {model_type}")
+
+    ckpt = torch.load(model_path, map_location='cpu', weights_only=False)
+    model = WetlandCNN15(in_channels=meta.get('input_channels', 64), num_classes=meta.get('num_classes', 6))
+    model.load_state_dict(ckpt['state_dict'])
+    std = np.asarray(ckpt['std'], dtype=np.float32)
+    return model.eval(), np.asarray(ckpt['mean'], dtype=np.float32), np.where(std == 0, 1.0, std), \
+        int(meta.get('patch_size', 15))
+
+
+def prepare(block, mean, std):
+    """(h, w, bands) raw window -> normalized (bands, h, w) with NaN -> 0, and its NaN mask."""
+    nan = np.isnan(block).any(axis=2)
+    block -= mean
+    block /= std
+    np.nan_to_num(block, copy=False, nan=0.0)
+    return block.transpose(2, 0, 1), nan
+
+
+def predict_windows(dense, mosaic, windows, mean, std, chunk):
+    """Class maps for a batch of (row, col, h, w) raster windows, read with a halo."""
+    halo = dense.halo
+    size = chunk + 2 * halo
+    batch = np.zeros((len(windows), mean.size, size, size), dtype=np.float32)
+    masks = []
+    for i, (row, col, h, w) in enumerate(windows):
+        block = mosaic.read_window(row - halo, col - halo, h + 2 * halo, w + 2 * halo)
+        x, nan = prepare(block, mean, std)
+        batch[i, :, :h + 2 * halo, :w + 2 * halo] = x
+        masks.append(nan[halo:halo + h, halo:halo + w])
+    with torch.no_grad():
+        pred = dense(torch.from_numpy(batch)).argmax(dim=1).numpy().astype(np.uint8)
+    out = []
+    for (row, col, h, w), p, nan in zip(windows, pred, masks):
+        p = p[halo:halo + h, halo:halo + w].copy()
+        p[nan] = NODATA_VALUE
+        out.append(p)
+    return out
+
+
+def check_against_patches(model, mosaic, samples, mean, std, patch_size):
+    """Agreement of dense predictions [(row, col, pred), ...] with patch-by-patch WetlandCNN15 predictions."""
+    r = patch_size // 2
+    agree = 0
+    for start in range(0, len(samples), 512):
+        group = samples[start:start + 512]
+        patches = np.stack([prepare(mosaic.read_window(row - r, col - r, patch_size, patch_size), mean, std)[0]
+                            for row, col, _ in group])
+        with torch.no_grad():
+            patch_pred = model(torch.from_numpy(np.ascontiguousarray(patches))).argmax(dim=1).numpy()
+        agree += int((patch_pred == np.array([p for _, _, p in group])).sum())
+    return agree / max(len(samples), 1)
+
+
+def generate_classification_map(embeddings_dir, model_path, labels_path, output_path, catalog_path=None,
+                                chunk=256, batch=1, cog=True, check=0, metadata_path=None, exact=True):
+    """
+    Main function: apply the CNN densely to the embedding tiles and create the classification GeoTIFF.
+    """
+    print("=" * 60)
+    print("WETLAND CNN CLASSIFICATION MAP GENERATOR")
+    print("=" * 60)
+    print(f"  Started: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+
+    # ------------------------------------------
+    # 1. Load the trained CNN
+    # ------------------------------------------
+    print(f"\n1. Loading CNN model...")
+    print(f"   Path: {model_path}")
+    if not os.path.exists(model_path):
+        print(f"   ERROR: Model file not found at {model_path}")
+        sys.exit(1)
+    model, mean, std, patch_size = load_cnn(model_path, metadata_path)
+    dense = DenseWetlandCNN15(model, patch_size=patch_size, exact=exact)
+    print(f"   Loaded: WetlandCNN15, {patch_size}x{patch_size} patches, halo {dense.halo} px, "
+          f"{'exact' if exact else 'approximate'} dense pass, "
+          f"{torch.get_num_threads()} threads")
+
+    # ------------------------------------------
+    # 2. Read spatial metadata from labels raster
+    # ------------------------------------------
+    print(f"\n2. Reading spatial reference from labels raster...")
+    print(f"   Path: {labels_path}")
+    if not os.path.exists(labels_path):
+        print(f"   ERROR: Labels raster not found at {labels_path}")
+        sys.exit(1)
+    with rasterio.open(labels_path) as labels_src:
+        out_height = labels_src.height
+        out_width = labels_src.width
+        out_crs = labels_src.crs
+        out_transform = labels_src.transform
+        print(f"   Dimensions: {out_height} x {out_width}")
+
+    # ------------------------------------------
+    # 3. Index embedding tiles
+    # ------------------------------------------
+    print(f"\n3. Indexing embedding tiles...")
+    print(f"   Directory: {embeddings_dir}")
+    catalog = TileCatalog(catalog_path) if catalog_path else TileCatalog.for_tiles(embeddings_dir)
+    mosaic = open_embeddings(embeddings_dir, catalog=catalog)
+    if not len(mosaic):
+        print(f"   ERROR: No embedding tiles found in {embeddings_dir}")
+        sys.exit(1)
+    print(f"   Found {len(mosaic)} tiles ({type(mosaic).__name__}), {mosaic.n_bands} bands")
+    if mosaic.n_bands != mean.size:
+        print(f"   ERROR: model expects {mean.size} bands")
+        sys.exit(1)
+    if catalog is not None:
+        print(f"   Tile catalog: {catalog.path}")
+
+    # ------------------------------------------
+    # 4. Create output GeoTIFF
+    # ------------------------------------------
+    work_path = output_path + '.tmp.tif' if cog else output_path
+    print(f"\n4. Creating output GeoTIFF...")
+    print(f"   Path: {output_path}")
+    out_profile = {
+        'driver': 'GTiff',
+        'dtype': 'uint8',
+        'width': out_width,
+        'height': out_height,
+        'count': 1,
+        'crs': out_crs,
+        'transform': out_transform,
+        'nodata': NODATA_VALUE,
+        'compress': 'lzw',
+        'tiled': True,
+        'blockxsize': 512,
+        'blockysize': 512,
+    }
+    with rasterio.open(work_path, 'w', **out_profile) as dst:
+        # Fill with nodata a strip at a time
+        for row in range(0, out_height, 512):
+            h = min(512, out_height - row)
+            dst.write(np.full((h, out_width), NODATA_VALUE, dtype=np.uint8), 1, window=Window(0, row, out_width, h))
+
+    # ------------------------------------------
+    # 5. Dense inference, tile by tile in chunks
+    # ------------------------------------------
+    print(f"\n5. Running dense inference on {len(mosaic)} tiles ({chunk}x{chunk} chunks, {batch} per batch)...")
+    print(f"   {'='*50}")
+    region = Region.full(out_height, out_width)
+    class_counts = np.zeros(6, dtype=np.int64)
+    total_nodata = 0
+    skipped_tiles = []
+
+    jobs = []
+    for tile_idx, (tile, (th, tw)) in enumerate(zip(mosaic.tiles, mosaic.tile_shapes)):
+        progress = f"[{tile_idx + 1}/{len(mosaic)}]"
+        if catalog is not None and catalog.is_empty(tile):
+            print(f"   {progress} SKIP {tile.name} (no valid pixels (catalog))")
+            skipped_tiles.append(tile.name)
+            continue
+        placement = region.clip(tile, th, tw)
+        if placement is None:
+            print(f"   {progress} SKIP {tile.name} (outside labels grid)")
+            skipped_tiles.append(tile.name)
+            continue
+        windows = [
+            (row, col, min(chunk, placement.row_off + placement.height - row),
+             min(chunk, placement.col_off + placement.width - col))
+            for row in range(placement.row_off, placement.row_off + placement.height, chunk)
+            for col in range(placement.col_off, placement.col_off + placement.width, chunk)
+        ]
+        jobs.append((progress, tile, placement, windows))
+
+    # --check: a few random classified pixels from every chunk
+    rng = np.random.default_rng(0)
+    per_chunk = -(-check // max(sum(len(w) for *_, w in jobs), 1)) if check else 0
+    samples = []
+
+    with rasterio.open(work_path, 'r+') as dst:
+        for progress, tile, placement, windows in jobs:
+            n_valid = 0
+            for start in range(0, len(windows), batch):
+                group = windows[start:start + batch]
+                for (row, col, h, w), pred in zip(group, predict_windows(dense, mosaic, group, mean, std, chunk)):
+                    dst.write(pred, 1, window=Window(col, row, w, h))
+                    valid = pred[pred != NODATA_VALUE]
+                    n_valid += valid.size
+                    total_nodata += pred.size - valid.size
+                    class_counts += np.bincount(valid, minlength=6)[:6]
+                    if per_chunk and valid.size:
+                        rr, cc = np.nonzero(pred != NODATA_VALUE)
+                        pick = rng.choice(rr.size, min(per_chunk, rr.size), replace=False)
+                        samples.extend((row + int(rr[i]), col + int(cc[i]), int(pred[rr[i], cc[i]])) for i in pick)
+            print(f"   {progress} ✓ {tile.name} | {placement.height}x{placement.width} | "
+                  f"{len(windows)} chunks | {n_valid:,} classified")
+
+    if cog:
+        rasterio.shutil.copy(work_path, output_path, driver='COG', compress='LZW',
+                             blocksize=512, overview_resampling='nearest')
+        os.remove(work_path)
+
+    agreement = None
+    if samples:
+        if len(samples) > check:
+            samples = [samples[i] for i in rng.choice(len(samples), check, replace=False)]
+        print(f"\n6. Checking against patch-by-patch inference on {len(samples)} pixels...")
+        agreement = check_against_patches(model, mosaic, samples, mean, std, patch_size)
+        print(f"   Agreement with cut {patch_size}x{patch_size} patches: {100 * agreement:.2f}%")
+    if hasattr(mosaic, 'close'):
+        mosaic.close()
+
+    # ------------------------------------------
+    # Summary
+    # ------------------------------------------
+    print(f"\n{'='*60}")
+    print("CLASSIFICATION COMPLETE")
+    print(f"{'='*60}")
+    print(f"  Output: {output_path}{' (COG)' if cog else ''}")
+    print(f"  File size: {os.path.getsize(output_path) / (1024 ** 2):.1f} MB")
+    total_classified = class_counts.sum()
+    print(f"\n  Pixels classified: {total_classified:,}")
+    print(f"  Pixels nodata (in tiles): {total_nodata:,}")
+    if total_classified > 0:
+        print(f"\n  Class distribution:")
+        for cls in range(6):
+            pct = 100 * class_counts[cls] / total_classified
+            print(f"    Class {cls} ({CLASS_NAMES[cls]:20s}): {class_counts[cls]:>12,} ({pct:5.2f}%)")
+    if skipped_tiles:
+        print(f"\n  ⚠ Skipped {len(skipped_tiles)} tiles:")
+        for t in skipped_tiles:
+            print(f"    - {t}")
+    print(f"\n  Finished: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    return agreement
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate wetland classification GeoTIFF from a trained WetlandCNN15')
+    parser.add_argument('embeddings_dir', help='Embedding GeoTIFF tiles or a pixel store')
+    parser.add_argument('--model', '-m', required=True, help='train.py checkpoint (.pt) of a WetlandCNN15')
+    parser.add_argument('--metadata', default=None, help='Its metadata JSON (default: <model>_metadata.json)')
+    parser.add_argument('--labels', '-l', default=DEFAULT_LABELS_PATH,
+                        help=f'Labels raster for the output grid (default: {DEFAULT_LABELS_PATH})')
+    parser.add_argument('--output', '-o', default=DEFAULT_OUTPUT_PATH)
+    parser.add_argument('--catalog', '-c', default=None,
+                        help='Tile catalog from check_tile_coverage.py (default: <embeddings_dir>/tile_catalog.json if present)')
+    parser.add_argument('--chunk', type=int, default=256, help='Output chunk size in pixels (read with a halo)')
+    parser.add_argument('--batch', type=int, default=1, help='Chunks per forward pass')
+    parser.add_argument('--approximate', action='store_true',
+                        help='Faster dense pass that ignores the zero padding at patch borders')
+    parser.add_argument('--threads', type=int, default=None, help='torch intra-op threads')
+    parser.add_argument('--no-cog', action='store_true', help='Write a plain tiled GeoTIFF')
+    parser.add_argument('--check', type=int, default=0,
+                        help='Compare N random classified pixels with patch-by-patch inference')
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    generate_classification_map(
+        embeddings_dir=args.embeddings_dir,
+        model_path=args.model,
+        labels_path=args.labels,
+        output_path=args.output,
+        catalog_path=args.catalog,
+        chunk=args.chunk,
+        batch=args.batch,
+        cog=not args.no_cog,
+        check=args.check,
+        metadata_path=args.metadata,
+        exact=not args.approximate,
+    )
@@ -0,0 +1,72 @@
+"""
+Streaming CNN evaluation metrics.
+
+    cm = DeviceConfusion(num_classes=6, device=device)
+    for xb, yb in loader:
+        cm.update(yb, net(xb).argmax(dim=1))   # stays on the device, no host sync
+    result = cm.result()                       # one transfer per epoch
+    result.accuracy(), result.f1(), mean_wetland_f1(result)
+
+The K x K counts live on the training device and are updated per batch with
+torch.bincount, so evaluation never calls .cpu() per batch or keeps the
+predictions around. Under DistributedDataParallel each rank counts its shard
+and all_reduce() sums them. result() hands back an
+inference.ConfusionAccumulator, so accuracy / recall / precision / F1 are
+read off the matrix the same way as for the map evaluators.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+import torch
+import torch.distributed as dist
+
+from inference.metrics import ConfusionAccumulator
+
+# Class 0 is Background/Upland; 1-5 are Marsh, Swamp, Shallow Water, Fen, Bog
+WETLAND_CLASSES = (1, 2, 3, 4, 5)
+
+
+class DeviceConfusion:
+    """Running confusion matrix (rows = ground truth, cols = predicted) held on `device`."""
+
+    def __init__(self, num_classes: int = 6, device: torch.device | str = "cpu"):
+        self.num_classes = num_classes
+        self.counts = torch.zeros(num_classes * num_classes, dtype=torch.int64, device=device)
+
+    def update(self, y_true: torch.Tensor, y_pred: torch.Tensor) -> None:
+        """Add a batch of class indices (same shape, same device as the counts)."""
+        k = self.num_classes
+        idx = y_true.reshape(-1).to(torch.int64) * k + y_pred.reshape(-1).to(torch.int64)
+        self.counts += torch.bincount(idx, minlength=k * k)
+
+    def all_reduce(self) -> None:
+        """Sum the counts over all ranks (no-op outside a process group)."""
+        if dist.is_available() and dist.is_initialized():
+            dist.all_reduce(self.counts)
+
+    def result(self) -> ConfusionAccumulator:
+        k = self.num_classes
+        return ConfusionAccumulator.from_matrix(self.counts.view(k, k).cpu().numpy())
+
+
+def mean_wetland_f1(cm: ConfusionAccumulator, classes=WETLAND_CLASSES) -> float:
+    """Mean F1 over the wetland classes present in the ground truth or predictions (0.0 if none)."""
+    f1 = cm.f1()[list(classes)]
+    f1 = f1[~np.isnan(f1)]
+    return float(f1.mean()) if f1.size else 0.0
+
+
+def format_report(cm: ConfusionAccumulator, class_names=None) -> str:
+    """Per-class precision / recall / F1 / support table, like sklearn's classification_report."""
+    k = cm.num_classes
+    names = [str(class_names[i]) if class_names else str(i) for i in range(k)]
+    width = max(12, *(len(n) for n in names))
+    lines = [f"{'':>{width}} {'precision':>9} {'recall':>9} {'f1-score':>9} {'support':>9}", ""]
+    for i, (p, r, f, s) in enumerate(zip(cm.precision(), cm.recall(), cm.f1(), cm.support)):
+        lines.append(f"{names[i]:>{width}} {np.nan_to_num(p):9.4f} {np.nan_to_num(r):9.4f} "
+                     f"{np.nan_to_num(f):9.4f} {s:9d}")
+    lines += ["",
+              f"{'accuracy':>{width}} {'':>9} {'':>9} {cm.accuracy():9.4f} {cm.n_valid:9d}",
+              f"{'wetland F1':>{width}} {'':>9} {'':>9} {mean_wetland_f1(cm):9.4f}"]
+    return "\n".join(lines)
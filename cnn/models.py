@@ -1,9 +1,30 @@
+import os
+
 import torch
 import torch.nn as nn
 import torchvision.models as models
-import ssl
 
-ssl._create_default_https_context = ssl._create_unverified_context
+# Local ImageNet ResNet-18 weights for air-gapped nodes (see imagenet_resnet18_state_dict)
+RESNET18_WEIGHTS_ENV = "WETLAND_RESNET18_WEIGHTS"
+
+
+def imagenet_resnet18_state_dict(weights_path: str | None = None) -> dict:
+    """
+    ImageNet ResNet-18 weights, from the first local file found:
+    weights_path, $WETLAND_RESNET18_WEIGHTS, then the torch hub cache
+    (<torch hub dir>/checkpoints/resnet18-f37072fd.pth, where torchvision
+    keeps its downloads). Only if none exists is it downloaded into that
+    cache, with normal certificate checks. For an offline node, copy the
+    .pth there or point the environment variable at it.
+    """
+    if weights_path and not os.path.isfile(weights_path):
+        raise FileNotFoundError(f"ResNet-18 weights not found: {weights_path}")
+    url = models.ResNet18_Weights.DEFAULT.url
+    cached = os.path.join(torch.hub.get_dir(), "checkpoints", os.path.basename(url))
+    for path in (weights_path, os.environ.get(RESNET18_WEIGHTS_ENV), cached):
+        if path and os.path.isfile(path):
+            return torch.load(path, map_location="cpu", weights_only=True)
+    return torch.hub.load_state_dict_from_url(url, map_location="cpu", progress=True)
 
 
 class PixelMLP(nn.Module):
@@ -80,12 +101,21 @@ class ResNet18Wetland(nn.Module):
     """
     ResNet-18 architecture fine-tuned for 64-channel 15x15 wetland patches.
     Uses pretrained weights on subsequent layers to extract advanced spatial features.
+
+    pretrained=True loads the ImageNet weights from a local file when there
+    is one (weights_path, $WETLAND_RESNET18_WEIGHTS or the torch hub cache;
+    see imagenet_resnet18_state_dict). Use pretrained=False when a trained
+    state_dict is loaded right after construction: nothing is read and
+    construction needs no network.
     """
-    def __init__(self, in_channels: int = 64, num_classes: int = 6, dropout: float = 0.3):
+    def __init__(self, in_channels: int = 64, num_classes: int = 6, dropout: float = 0.3,
+                 pretrained: bool = True, weights_path: str | None = None):
         super().__init__()
         
-        # Load pre-trained ResNet-18
-        self.resnet = models.resnet18(weights=models.ResNet18_Weights.DEFAULT)
+        # ResNet-18, with pre-trained ImageNet weights if requested
+        self.resnet = models.resnet18(weights=None)
+        if pretrained:
+            self.resnet.load_state_dict(imagenet_resnet18_state_dict(weights_path))
         
         # Modify the first Convolutional Layer to accept 64 channels instead of 3 (RGB)
         # We retain the original geometry parameters of ResNet's first layer.
@@ -110,4 +140,169 @@ class ResNet18Wetland(nn.Module):
         )
         
     def forward(self, x: torch.Tensor) -> torch.Tensor:
-        return self.resnet(x)
\ No newline at end of file
+        return self.resnet(x)
+
+def _shift(x: torch.Tensor, dy: int, dx: int) -> torch.Tensor:
+    """out[..., y, x] = x[..., y + dy, x + dx], zero outside."""
+    h, w = x.shape[-2:]
+    p = max(abs(dy), abs(dx))
+    if p == 0:
+        return x
+    x = nn.functional.pad(x, (p, p, p, p))
+    return x[..., p + dy:p + dy + h, p + dx:p + dx + w]
+
+
+def _patch_roles(patch_size: int) -> list:
+    """
+    Per axis, the role of each final 3x3 conv cell of WetlandCNN15 inside a
+    patch: which of its taps fall inside the patch (the others read zero
+    padding), recursively through the pools and earlier convs. Cells with
+    the same role compute the same function of the input, so each role is
+    evaluated densely once.
+    """
+    n1 = patch_size // 2
+    n2 = n1 // 2
+    taps = (-1, 0, 1)
+    conv1 = [tuple(t for t in taps if 0 <= p + t < patch_size) for p in range(patch_size)]
+    pool1 = [(conv1[2 * q], conv1[2 * q + 1]) for q in range(n1)]
+    conv2 = [tuple((u, pool1[q + u]) for u in taps if 0 <= q + u < n1) for q in range(n1)]
+    pool2 = [(conv2[2 * s], conv2[2 * s + 1]) for s in range(n2)]
+    return [tuple((v, pool2[s + v]) for v in taps if 0 <= s + v < n2) for s in range(n2)]
+
+
+class DenseWetlandCNN15(nn.Module):
+    """
+    A trained WetlandCNN15 run fully convolutionally: (B, 64, H, W) ->
+    (B, num_classes, H, W) logits, where output pixel (y, x) is the
+    prediction for the patch_size x patch_size patch centred on it.
+    Outputs within `halo` pixels of the input border are unreliable;
+    callers pad the input by it.
+
+    The stride-2 max pools become stride-1 pools and every later layer is
+    dilated by the pooling factor so far ("a trous"), so the network is
+    evaluated at every pixel at once instead of once per cut patch. The
+    final average pool becomes a mean over the pooled cells' offsets and the
+    classifier runs as 1x1 convolutions.
+
+    exact=True (default) reproduces patch-by-patch inference, including the
+    zero padding each convolution sees at the patch border: every layer is
+    evaluated once per border role (see _patch_roles), conv1 with masked
+    kernels and conv2 / conv3 as per-tap 1x1 contributions. About 5x less
+    work than cutting patches. exact=False lets border taps read the real
+    neighbouring pixels instead, which is several times cheaper again but
+    only approximates the patch model.
+    """
+    def __init__(self, cnn: WetlandCNN15, patch_size: int = 15, exact: bool = True):
+        super().__init__()
+        self.cnn = cnn.eval()
+        self.exact = exact
+        self.radius = patch_size // 2
+        n_cells = (patch_size // 2) // 2   # cells left after the two 2x2 pools
+        # Pooled cell s covers patch rows 4s .. 4s + 3, i.e. raster offset 4s - radius from the centre
+        self.taps = [4 * s - self.radius for s in range(n_cells)]
+        self.roles = _patch_roles(patch_size)
+        self.halo = max(-min(self.taps) + 7, max(self.taps) + 10)
+
+    @staticmethod
+    def _pool(x: torch.Tensor, dilation: int) -> torch.Tensor:
+        """Stride-1 2x2 max pool anchored at the top-left cell, size preserving."""
+        x = nn.functional.pad(x, (0, dilation, 0, dilation), value=float("-inf"))
+        return nn.functional.max_pool2d(x, kernel_size=2, stride=1, dilation=dilation)
+
+    def _classify(self, pooled: torch.Tensor) -> torch.Tensor:
+        F = nn.functional
+        fc1, bn_fc, fc2 = self.cnn.classifier[1], self.cnn.classifier[2], self.cnn.classifier[5]
+        x = F.conv2d(pooled, fc1.weight[:, :, None, None], fc1.bias)
+        x = F.relu(F.batch_norm(x, bn_fc.running_mean, bn_fc.running_var, bn_fc.weight, bn_fc.bias,
+                                training=False, eps=bn_fc.eps))
+        return F.conv2d(x, fc2.weight[:, :, None, None], fc2.bias)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return self._classify(self._features_exact(x) if self.exact else self._features_atrous(x))
+
+    def _features_atrous(self, x: torch.Tensor) -> torch.Tensor:
+        F = nn.functional
+        conv1, bn1 = self.cnn.conv1[0], self.cnn.conv1[1]
+        conv2, bn2 = self.cnn.conv2[0], self.cnn.conv2[1]
+        conv3, bn3 = self.cnn.conv3[0], self.cnn.conv3[1]
+
+        x = F.relu(bn1(conv1(x)))
+        x = self._pool(x, 1)
+        x = F.relu(bn2(F.conv2d(x, conv2.weight, conv2.bias, padding=2, dilation=2)))
+        x = self._pool(x, 2)
+        x = F.relu(bn3(F.conv2d(x, conv3.weight, conv3.bias, padding=4, dilation=4)))
+
+        # Global average pool of the patch -> mean over the pooled cells' offsets
+        return sum(_shift(x, dy, dx) for dy in self.taps for dx in self.taps) / len(self.taps) ** 2
+
+    @staticmethod
+    def _fold(conv: nn.Conv2d, bn: nn.BatchNorm2d) -> tuple[torch.Tensor, torch.Tensor]:
+        """Eval-mode BatchNorm folded into the conv: (out, in, kh, kw) weight and bias."""
+        scale = bn.weight / torch.sqrt(bn.running_var + bn.eps)
+        return conv.weight * scale[:, None, None, None], (conv.bias - bn.running_mean) * scale + bn.bias
+
+    def _features_exact(self, x: torch.Tensor) -> torch.Tensor:
+        # Channels-last (B, H, W, C) throughout so every tap is one GEMM on a shifted slice
+        F = nn.functional
+        w1, b1 = self._fold(self.cnn.conv1[0], self.cnn.conv1[1])
+        w2, b2 = self._fold(self.cnn.conv2[0], self.cnn.conv2[1])
+        w3, b3 = self._fold(self.cnn.conv3[0], self.cnn.conv3[1])
+        batch, _, height, width = x.shape
+        memo = {}
+
+        def window(size, d):
+            # out[i] = src[i + d]: (destination, source) slices
+            return slice(max(0, -d), size - max(0, d)), slice(max(0, d), size + min(0, d))
+
+        def shifted_into(out, src, dy, dx, op):
+            (ys, yd), (xs, xd) = window(height, dy), window(width, dx)
+            op(out[:, ys, xs], src[:, yd, xd])
+
+        def cached(name, fn):
+            def wrapper(ky, kx):
+                if (name, ky, kx) not in memo:
+                    memo[name, ky, kx] = fn(ky, kx)
+                return memo[name, ky, kx]
+            return wrapper
+
+        def g1(ky, kx):
+            # conv1 at a pixel whose in-patch taps are ky x kx: masked kernel
+            mask = torch.zeros(3, 3, dtype=w1.dtype, device=w1.device)
+            for ty in ky:
+                for tx in kx:
+                    mask[ty + 1, tx + 1] = 1
+            return F.relu(F.conv2d(x, w1 * mask, b1, padding=1)).permute(0, 2, 3, 1).contiguous()
+
+        def pooled(g, ky, kx, step):
+            # 2x2 max pool over cells whose roles are ky = (top, bottom), kx = (left, right)
+            out = g(ky[0], kx[0]).clone()
+            for dy, dx, src in ((step, 0, g(ky[1], kx[0])), (0, step, g(ky[0], kx[1])),
+                                (step, step, g(ky[1], kx[1]))):
+                shifted_into(out, src, dy, dx, lambda o, v: torch.maximum(o, v, out=o))
+            return out
+
+        def tapped(w, b, source, ky, kx, step):
+            # conv over in-patch taps only: sum of per-tap GEMMs on each input role
+            acc = b.expand(batch, height, width, -1).clone()
+            for uy, iy in ky:
+                for ux, ix in kx:
+                    wt = w[:, :, uy + 1, ux + 1].t()
+                    shifted_into(acc, source(iy, ix) @ wt, step * uy, step * ux, lambda o, v: o.add_(v))
+            return acc.relu_()
+
+        g1 = cached("g1", g1)
+        h1 = cached("h1", lambda ky, kx: pooled(g1, ky, kx, 1))
+        g2 = cached("g2", lambda ky, kx: tapped(w2, b2, h1, ky, kx, 2))
+        h2 = cached("h2", lambda ky, kx: pooled(g2, ky, kx, 2))
+
+        # conv3 reads only the pooled conv2 maps; drop the earlier layers' before it runs
+        inputs = {(iy, ix) for ky in self.roles for kx in self.roles for _, iy in ky for _, ix in kx}
+        pooled2 = {key: h2(*key) for key in inputs}
+        memo.clear()
+        h2 = lambda ky, kx: pooled2[ky, kx]
+
+        out = x.new_zeros(batch, height, width, w3.shape[0])
+        for sy, ky in zip(self.taps, self.roles):
+            for sx, kx in zip(self.taps, self.roles):
+                shifted_into(out, tapped(w3, b3, h2, ky, kx, 4), sy, sx, lambda o, v: o.add_(v))
+        return (out / len(self.taps) ** 2).permute(0, 3, 1, 2)
@@ -0,0 +1,73 @@
+"""
+Measure data-parallel scaling of cnn/train.py on this node.
+
+Runs the same training with torchrun at each process count, reads the
+per-epoch throughput from the metadata JSON and reports speedup and
+scaling efficiency (speedup / processes) against one process. The first
+epoch (compile / worker start-up) is left out of the average.
+
+Usage:
+    python -m cnn.scaling_report -- --model cnn15 --epochs 3 --cpu-perf
+    python -m cnn.scaling_report --procs 1 2 4 --output scaling_report.json -- --data <patches> --epochs 3
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+
+def run(n_procs: int, train_args: list[str], out_dir: str) -> dict:
+    cmd = [sys.executable, "-m", "torch.distributed.run", "--standalone", f"--nproc-per-node={n_procs}",
+           "-m", "cnn.train", *train_args, "--out-dir", out_dir]
+    print(f"\n$ {' '.join(cmd)}", flush=True)
+    subprocess.run(cmd, check=True)
+    (meta_path,) = glob.glob(os.path.join(out_dir, "*_metadata.json"))
+    with open(meta_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DDP scaling efficiency of cnn/train.py",
+                                     usage="%(prog)s [--procs N ...] [--output JSON] -- <train.py args>")
+    parser.add_argument("--procs", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--output", "-o", default="scaling_report.json")
+    args, train_args = parser.parse_known_args()
+    train_args = [a for a in train_args if a != "--"]
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.procs:
+            meta = run(n, train_args, os.path.join(tmp, f"procs{n}"))
+            per_epoch = meta["performance"]["train_samples_per_sec"]
+            results.append({
+                "processes": n,
+                "threads_per_process": meta["performance"]["threads"],
+                "samples_per_sec": float(np.mean(per_epoch[1:] or per_epoch)),
+                "per_epoch": per_epoch,
+                "best_val_acc": meta["best_val_acc"],
+                "test_acc": meta["test_acc"],
+            })
+
+    base = next((r for r in results if r["processes"] == 1), results[0])
+    print(f"\n{'procs':>5} {'threads':>7} {'samples/s':>11} {'speedup':>8} {'efficiency':>10} {'val_acc':>8}")
+    for r in results:
+        r["speedup"] = r["samples_per_sec"] / base["samples_per_sec"]
+        r["efficiency"] = r["speedup"] * base["processes"] / r["processes"]
+        print(f"{r['processes']:5d} {r['threads_per_process']:7d} {r['samples_per_sec']:11,.0f} "
+              f"{r['speedup']:7.2f}x {100 * r['efficiency']:9.1f}% {r['best_val_acc']:8.4f}")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"cpu_count": os.cpu_count(), "train_args": train_args, "runs": results}, f, indent=2)
+    print(f"\nSaved: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
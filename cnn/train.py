@@ -1,70 +1,316 @@
+"""
+Train the wetland CNN on 15x15 embedding patches.
+
+Single process:
+    python -m cnn.train --model resnet18 --cpu-perf
+
+Data-parallel on CPU (DistributedDataParallel, gloo backend), launched with
+torchrun; each process trains on its DistributedSampler shard:
+    torchrun --nproc-per-node 4 -m cnn.train --cpu-perf
+    # across nodes, on every node:
+    torchrun --nnodes 2 --node-rank <0|1> --nproc-per-node 4 \\
+        --master-addr <node0 host> --master-port 29500 -m cnn.train --cpu-perf
+
+--batch-size is the global batch, split across processes, so runs with
+different process counts take the same optimizer steps.
+
+Checkpoints (model, optimizer, scheduler, RNG state) are written in the
+background every --checkpoint-every epochs; pick a run back up with
+    python -m cnn.train ... --resume cnn/checkpoints/<prefix>_<run>_last.ckpt
+(same --epochs and --select-by: the LR schedule and best-epoch tracking carry over).
+--patience N stops once the --select-by metric has not improved for N epochs.
+"""
 from __future__ import annotations
 
 import os
+import sys
 import json
+import argparse
+import time
 from datetime import datetime
 
 import numpy as np
 import torch
+import torch.distributed as dist
 import torch.nn as nn
-from torch.utils.data import DataLoader
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data import DataLoader, DistributedSampler, Subset
 
 from sklearn.model_selection import train_test_split
-from sklearn.metrics import accuracy_score, confusion_matrix, classification_report
 
 # Import the new ResNet transfer learning model
-from cnn.models import ResNet18Wetland
-from cnn.data import NPZPatchDataset
-
-
-def main():
-    # Load the new geographically split 15x15 CNN dataset
-    data_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "wetland_cnn_dataset_15x15.npz")
-    
+from cnn.models import ResNet18Wetland, WetlandCNN15
+from cnn.data import ChannelStats, EmbeddingPatchDataset, NPZPatchDataset, channel_stats, dihedral_augment
+from cnn.metrics import DeviceConfusion, format_report, mean_wetland_f1
+from cnn.checkpoint import AsyncCheckpointer, rng_state, set_rng_state
+
+
+def load_npz_datasets(data_path: str):
+    """
+    Train / val / test NPZPatchDatasets from the pre-cut 15x15 patches:
+    either the .npz (loaded into RAM) or a directory holding the same arrays
+    as X_train.npy, y_train.npy, X_val.npy, y_val.npy, class_weights.npy,
+    which are memory-mapped so the patches never have to fit in RAM.
+    """
     if not os.path.exists(data_path):
         raise FileNotFoundError(f"Could not find dataset at: {data_path}")
         
     print(f"Loading data from: {data_path}")
-    data = np.load(data_path)
+    if os.path.isdir(data_path):
+        data = {k: np.load(os.path.join(data_path, f"{k}.npy"), mmap_mode="r")
+                for k in ("X_train", "y_train", "X_val", "y_val", "class_weights")}
+    else:
+        with np.load(data_path) as npz:
+            data = {k: npz[k] for k in ("X_train", "y_train", "X_val", "y_val", "class_weights")}
     
     # 1. Direct Assignment (No more training leakage!)
     X_train = data["X_train"] 
-    y_train = data["y_train"]
-    class_weights = data["class_weights"]
+    y_train = np.asarray(data["y_train"])
+    class_weights = np.asarray(data["class_weights"])
     
-    # 2. Split the validation tiles into Val and Test sets
+    # 2. Split the validation tiles into Val and Test sets (by index, so X_val is not copied)
     X_val_tiles = data["X_val"]
-    y_val_tiles = data["y_val"]
+    y_val_tiles = np.asarray(data["y_val"])
     
-    data.close()
-    
-    X_val, X_test, y_val, y_test = train_test_split(
-        X_val_tiles, y_val_tiles, test_size=0.50, random_state=42, stratify=y_val_tiles
+    val_idx, test_idx = train_test_split(
+        np.arange(len(y_val_tiles)), test_size=0.50, random_state=42, stratify=y_val_tiles
     )
 
     print(f"Loaded X_train: {X_train.shape} | y_train: {y_train.shape}")
-    print(f"Loaded X_val:   {X_val.shape} | y_val:   {y_val.shape}")
-    print(f"Loaded X_test:  {X_test.shape} | y_test:  {y_test.shape}")
-
-    # Normalize per-channel using train stats only
-    mean = X_train.mean(axis=(0, 2, 3))
-    std = X_train.std(axis=(0, 2, 3))
+    print(f"Loaded X_val:   {(len(val_idx), *X_val_tiles.shape[1:])} | y_val:   {val_idx.shape}")
+    print(f"Loaded X_test:  {(len(test_idx), *X_val_tiles.shape[1:])} | y_test:  {test_idx.shape}")
+
+    # Normalize per-channel using train stats only (one streamed pass)
+    mean, std = channel_stats(X_train)
+
+    train_ds = NPZPatchDataset(X_train, y_train, mean=mean, std=std)
+    val_ds = NPZPatchDataset(X_val_tiles, y_val_tiles, mean=mean, std=std, index=val_idx)
+    test_ds = NPZPatchDataset(X_val_tiles, y_val_tiles, mean=mean, std=std, index=test_idx)
+    return train_ds, val_ds, test_ds, mean, std, class_weights
+
+
+def load_store_datasets(store_dir: str, index_path: str, patch_size: int = 15):
+    """
+    Train / val / test EmbeddingPatchDatasets cut on the fly from a pixel
+    store, at the sample positions of a split index
+    (data_preprocessing/build_dataset.py index). As with the .npz, patches
+    with any NaN are dropped and the test split is halved into val / test.
+    """
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from data_preprocessing.sampling import SPLIT_TRAIN, class_weights_for, load_index
+
+    print(f"Loading index from: {index_path}")
+    index = load_index(index_path)
+    samples = EmbeddingPatchDataset(store_dir, index["rows"], index["cols"], index["labels"],
+                                    patch_size=patch_size)
+    is_train = index["split"] == SPLIT_TRAIN
+    train_ds = samples.subset(is_train).complete()
+    held_out = samples.subset(~is_train).complete()
+
+    val_idx, test_idx = train_test_split(
+        np.arange(len(held_out)), test_size=0.50, random_state=42, stratify=held_out.y
+    )
+    val_ds, test_ds = held_out.subset(val_idx), held_out.subset(test_idx)
+
+    print(f"Patches ({patch_size}x{patch_size}) from: {store_dir}")
+    print(f"  train: {len(train_ds)} | val: {len(val_ds)} | test: {len(test_ds)}")
+
+    # Per-channel stats over every pixel of the training patches (one streamed pass)
+    stats = ChannelStats(train_ds.store.n_bands)
+    for start in range(0, len(train_ds), 256):
+        stop = min(start + 256, len(train_ds))
+        stats.update(np.concatenate([train_ds._patch(i).reshape(-1, train_ds.store.n_bands)
+                                     for i in range(start, stop)]))
+    mean, std = stats.mean, stats.std
+
+    for ds in (train_ds, val_ds, test_ds):
+        ds.mean = mean.astype(np.float32)
+        ds.std = np.where(std == 0, 1.0, std).astype(np.float32)
+    return train_ds, val_ds, test_ds, mean, std, class_weights_for(train_ds.y)
+
+
+MODELS = {
+    # --model: (class, output file prefix)
+    "resnet18": (ResNet18Wetland, "wetland_cnn_v3_resnet"),
+    "cnn15": (WetlandCNN15, "wetland_cnn_v2"),
+}
+
+
+def bf16_supported(device: torch.device) -> bool:
+    """bfloat16 autocast is only worth it with native bf16 kernels (AVX512-BF16 / AMX on CPU)."""
+    if device.type == "cuda":
+        return torch.cuda.is_bf16_supported()
+    if device.type == "cpu":
+        checks = ("_is_avx512_bf16_supported", "_is_amx_tile_supported")
+        return any(getattr(torch.cpu, name, lambda: False)() for name in checks)
+    return False
+
+
+def setup_distributed() -> tuple[int, int]:
+    """(rank, world_size); joins the gloo process group when launched by torchrun with more than one process."""
+    world_size = int(os.environ.get("WORLD_SIZE", 1))
+    if world_size == 1:
+        return 0, 1
+    dist.init_process_group(backend="gloo")
+    return dist.get_rank(), dist.get_world_size()
+
+
+def load_on_rank0(path: str, rank: int, distributed: bool, weights_only: bool = True):
+    """
+    torch.load on rank 0, broadcast to the other ranks. Checkpoints are only
+    written by rank 0, so on other nodes the file may not exist.
+    """
+    obj = [torch.load(path, map_location="cpu", weights_only=weights_only) if rank == 0 else None]
+    if distributed:
+        dist.broadcast_object_list(obj, src=0)
+    return obj[0]
+
+
+def evaluate(net, loader, device, autocast, channels_last: bool = False):
+    """
+    Confusion matrix (cnn.metrics.DeviceConfusion) over a loader, summed
+    over all ranks. Counts stay on the device until the single transfer at
+    the end.
+    """
+    net.eval()
+    cm = DeviceConfusion(num_classes=6, device=device)
+    with torch.no_grad(), autocast():
+        for xb, yb in loader:
+            xb = xb.to(device, non_blocking=True)
+            if channels_last:
+                xb = xb.contiguous(memory_format=torch.channels_last)
+            cm.update(yb.to(device, non_blocking=True), net(xb).argmax(dim=1))
+    cm.all_reduce()
+    return cm.result()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Train the wetland CNN")
+    parser.add_argument("--data", default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                       "wetland_cnn_dataset_15x15.npz"),
+                        help="Patch dataset: the .npz, or a directory of its arrays as .npy files (memory-mapped)")
+    parser.add_argument("--store", default=None,
+                        help="Pixel store to cut patches from on the fly (instead of --data)")
+    parser.add_argument("--index", default=None, help="Split index for --store (build_dataset.py index)")
+    parser.add_argument("--patch-size", type=int, default=15, help="Patch size for --store (odd)")
+    parser.add_argument("--model", choices=sorted(MODELS), default="resnet18")
+    parser.add_argument("--resnet-weights", default=None,
+                        help="Local ImageNet ResNet-18 .pth (default: $WETLAND_RESNET18_WEIGHTS or the torch hub cache)")
+    parser.add_argument("--no-pretrained", action="store_true", help="Train ResNet-18 from random initialization")
+    parser.add_argument("--epochs", type=int, default=15)
+    parser.add_argument("--batch-size", type=int, default=256, help="Global batch size")
+    parser.add_argument("--out-dir", default=os.path.dirname(os.path.abspath(__file__)),
+                        help="Where the .pt and metadata JSON are written")
+    parser.add_argument("--select-by", choices=("wetland_f1", "accuracy"), default="wetland_f1",
+                        help="Validation metric that picks the best epoch and drives early stopping "
+                             "(default: mean F1 of classes 1-5)")
+    parser.add_argument("--patience", type=int, default=None,
+                        help="Stop after this many epochs without a --min-delta improvement (default: run all epochs)")
+    parser.add_argument("--min-delta", type=float, default=0.0, help="Smallest change that counts as an improvement")
+    parser.add_argument("--checkpoint-dir", default=None, help="Checkpoint directory (default: <out-dir>/checkpoints)")
+    parser.add_argument("--checkpoint-every", type=int, default=1,
+                        help="Write a resumable checkpoint every N epochs (0: only the best weights)")
+    parser.add_argument("--resume", default=None, help="Continue training from a *_last.ckpt checkpoint")
+
+    perf = parser.add_argument_group("performance")
+    perf.add_argument("--cpu-perf", action="store_true",
+                      help="Shorthand for --channels-last --bf16 --compile")
+    perf.add_argument("--channels-last", action="store_true", help="channels_last memory format")
+    perf.add_argument("--bf16", action="store_true",
+                      help="bfloat16 autocast (ignored where the hardware has no native bf16)")
+    perf.add_argument("--compile", action="store_true", help="torch.compile the model")
+    perf.add_argument("--threads", type=int, default=None, help="Intra-op threads (torch.set_num_threads)")
+    perf.add_argument("--interop-threads", type=int, default=None,
+                      help="Inter-op threads (torch.set_num_interop_threads)")
+    perf.add_argument("--workers", type=int, default=2, help="DataLoader workers (persistent)")
+    perf.add_argument("--prefetch-factor", type=int, default=None,
+                      help="Batches prefetched per DataLoader worker (torch default: 2)")
+    args = parser.parse_args(argv)
+    if args.store and not args.index:
+        parser.error("--store needs --index")
+    if args.patience is not None and args.patience < 1:
+        parser.error("--patience must be at least 1")
+    if args.cpu_perf:
+        args.channels_last = args.bf16 = args.compile = True
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    rank, world_size = setup_distributed()
+    distributed = world_size > 1
+    if rank != 0:
+        sys.stdout = open(os.devnull, "w")   # only rank 0 reports
+
+    # Thread pools must be sized before any parallel work starts. Processes
+    # sharing a node split its cores unless --threads says otherwise
+    if args.interop_threads:
+        torch.set_num_interop_threads(args.interop_threads)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    elif distributed:
+        local_world = int(os.environ.get("LOCAL_WORLD_SIZE", world_size))
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // local_world))
+
+    if args.store:
+        train_ds, val_ds, test_ds, mean, std, class_weights = load_store_datasets(
+            args.store, args.index, args.patch_size)
+        patch_size = args.patch_size
+        source = {"source": "pixel_store", "store": args.store, "index": args.index}
+    else:
+        # Load the new geographically split 15x15 CNN dataset
+        train_ds, val_ds, test_ds, mean, std, class_weights = load_npz_datasets(args.data)
+        patch_size = 15
+        source = {"source": os.path.basename(os.path.normpath(args.data))}
+
+    if distributed:
+        # gloo data parallelism is for CPU-only nodes
+        device = torch.device("cpu")
+    else:
+        device = torch.device("cuda" if torch.cuda.is_available() else "mps" if torch.backends.mps.is_available() else "cpu")
+    print(f"Training on device: {device}" + (f" x {world_size} processes (gloo)" if distributed else ""))
+
+    if args.bf16 and not bf16_supported(device):
+        print("bfloat16 not natively supported here, training in float32")
+        args.bf16 = False
+    perf_config = {
+        "channels_last": args.channels_last,
+        "bf16": args.bf16,
+        "compile": args.compile,
+        "threads": torch.get_num_threads(),
+        "interop_threads": torch.get_num_interop_threads(),
+        "workers": args.workers,
+        "prefetch_factor": args.prefetch_factor,
+        "batch_size": args.batch_size,
+        "world_size": world_size,
+    }
+    print("Performance config: " + ", ".join(f"{k}={v}" for k, v in perf_config.items()))
 
-    train_ds = NPZPatchDataset(X_train, y_train, mean=mean, std=std, is_train=True)
-    val_ds = NPZPatchDataset(X_val, y_val, mean=mean, std=std)
-    test_ds = NPZPatchDataset(X_test, y_test, mean=mean, std=std)
+    def autocast():
+        return torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=args.bf16)
 
     # 15x15 patches are memory-light, allowing for much larger batch sizes
-    batch_size = 256 
-    train_loader = DataLoader(train_ds, batch_size=batch_size, shuffle=True, num_workers=2, pin_memory=True)
-    val_loader = DataLoader(val_ds, batch_size=batch_size, shuffle=False, num_workers=2, pin_memory=True)
-    test_loader = DataLoader(test_ds, batch_size=batch_size, shuffle=False, num_workers=2, pin_memory=True)
-
-    device = torch.device("cuda" if torch.cuda.is_available() else "mps" if torch.backends.mps.is_available() else "cpu")
-    print(f"Training on device: {device}")
-
-    # Use the 15x15 optimized ResNet-18 Transfer Learning model
-    model = ResNet18Wetland(in_channels=64, num_classes=6, dropout=0.3).to(device)
+    batch_size = max(1, args.batch_size // world_size)
+    loader_kwargs = dict(batch_size=batch_size, num_workers=args.workers, pin_memory=device.type == "cuda")
+    if args.workers > 0:
+        loader_kwargs.update(persistent_workers=True, prefetch_factor=args.prefetch_factor)
+    train_sampler = DistributedSampler(train_ds, shuffle=True) if distributed else None
+    train_loader = DataLoader(train_ds, shuffle=train_sampler is None, sampler=train_sampler, **loader_kwargs)
+    # Every rank predicts a strided shard of val / test; shards are gathered, not padded
+    val_loader = DataLoader(Subset(val_ds, range(rank, len(val_ds), world_size)), shuffle=False, **loader_kwargs)
+    test_loader = DataLoader(Subset(test_ds, range(rank, len(test_ds), world_size)), shuffle=False, **loader_kwargs)
+
+    # ResNet-18 transfer learning model (or the plain 15x15 CNN)
+    model_cls, out_prefix = MODELS[args.model]
+    model_kwargs = {}
+    if model_cls is ResNet18Wetland:
+        model_kwargs = dict(pretrained=not args.no_pretrained, weights_path=args.resnet_weights)
+    model = model_cls(in_channels=64, num_classes=6, dropout=0.3, **model_kwargs).to(device)
+    if args.channels_last:
+        model = model.to(memory_format=torch.channels_last)
+    # Forward passes go through net; model keeps the plain parameter names for saving
+    net = DistributedDataParallel(model) if distributed else model
+    net = torch.compile(net) if args.compile else net
 
     cw = torch.tensor(class_weights, dtype=torch.float32, device=device)
     criterion = nn.CrossEntropyLoss(weight=cw)
@@ -72,112 +318,197 @@ def main():
     # Optimizer and Learning Rate Scheduler
     optimizer = torch.optim.AdamW(model.parameters(), lr=1e-3, weight_decay=1e-4)
     
-    epochs = 15
+    epochs = args.epochs
     scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=epochs)
 
-    best_val_acc = -1.0
-    best_state = None
-
-    print(f"Starting training for {epochs} epochs...")
-    
-    for epoch in range(1, epochs + 1):
-        model.train()
+    best_score = -1.0
+    best_val_acc = best_val_f1 = 0.0
+    best_epoch = 0
+    bad_epochs = 0
+    start_epoch = 1
+    throughput = []
+    run_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    if args.resume:
+        ckpt = load_on_rank0(args.resume, rank, distributed, weights_only=False)
+        if ckpt["select_by"] != args.select_by:
+            raise ValueError(f"{args.resume} tracked the best epoch by {ckpt['select_by']}, "
+                             f"resume with --select-by {ckpt['select_by']}")
+        # The cosine schedule's T_max comes back with the scheduler state
+        ckpt_epochs = ckpt.get("epochs", ckpt["scheduler"]["T_max"])
+        if ckpt_epochs != epochs:
+            raise ValueError(f"{args.resume} was trained with an LR schedule over {ckpt_epochs} epochs, "
+                             f"resume with --epochs {ckpt_epochs}")
+        model.load_state_dict(ckpt["model"])
+        optimizer.load_state_dict(ckpt["optimizer"])
+        scheduler.load_state_dict(ckpt["scheduler"])
+        set_rng_state(ckpt["rng"])
+        best_score, best_val_acc, best_val_f1, best_epoch, bad_epochs = (
+            ckpt[k] for k in ("best_score", "best_val_acc", "best_val_f1", "best_epoch", "bad_epochs"))
+        throughput = ckpt["throughput"]
+        run_id = ckpt["run_id"]
+        start_epoch = ckpt["epoch"] + 1
+        print(f"Resumed from {args.resume} (epoch {ckpt['epoch']}, best epoch {best_epoch})")
+
+    # Best weights and the resumable state go to disk in the background (rank 0 only)
+    checkpoint_dir = args.checkpoint_dir or os.path.join(args.out_dir, "checkpoints")
+    best_path = os.path.join(checkpoint_dir, f"{out_prefix}_{run_id}_best.pt")
+    if args.resume and best_epoch:
+        best_path = ckpt["best_path"]   # written before the interruption
+    last_path = os.path.join(checkpoint_dir, f"{out_prefix}_{run_id}_last.ckpt")
+    writer = AsyncCheckpointer() if rank == 0 else None
+    stopped_early = False
+
+    print(f"Starting training for epochs {start_epoch}-{epochs}...")
+
+    for epoch in range(start_epoch, epochs + 1):
+        net.train()
+        if train_sampler is not None:
+            train_sampler.set_epoch(epoch)
         total_loss = 0.0
+        t0 = time.perf_counter()
 
         for xb, yb in train_loader:
-            xb = xb.to(device, non_blocking=True)
+            # Flip / rot90 augmentation on the whole batch, on the training device
+            xb = dihedral_augment(xb.to(device, non_blocking=True))
+            if args.channels_last:
+                xb = xb.contiguous(memory_format=torch.channels_last)
             yb = yb.to(device, non_blocking=True)
 
             optimizer.zero_grad(set_to_none=True)
-            logits = model(xb)
-            loss = criterion(logits, yb)
+            with autocast():
+                logits = net(xb)
+                loss = criterion(logits, yb)
             loss.backward()
             optimizer.step()
 
             total_loss += float(loss.item()) * xb.size(0)
 
+        if distributed:
+            loss_sum = torch.tensor([total_loss], dtype=torch.float64)
+            dist.all_reduce(loss_sum)
+            total_loss = float(loss_sum.item())
+        train_time = time.perf_counter() - t0
+        throughput.append(len(train_ds) / train_time)
         train_loss = total_loss / len(train_ds)
 
-        # Validate
-        model.eval()
-        y_pred, y_true = [], []
-        with torch.no_grad():
-            for xb, yb in val_loader:
-                xb = xb.to(device, non_blocking=True)
-                logits = model(xb)
-                pred = torch.argmax(logits, dim=1).cpu().numpy()
-                y_pred.append(pred)
-                y_true.append(yb.numpy())
-
-        val_acc = accuracy_score(np.concatenate(y_true), np.concatenate(y_pred))
+        # Validate; the confusion matrix is summed over ranks, so all agree on the best epoch
+        val_cm = evaluate(net, val_loader, device, autocast, args.channels_last)
+        val_acc, val_f1 = val_cm.accuracy(), mean_wetland_f1(val_cm)
 
         current_lr = scheduler.get_last_lr()[0]
-        print(f"Epoch {epoch:02d} | train_loss={train_loss:.4f} | val_acc={val_acc:.4f} | lr={current_lr:.2e}")
+        print(f"Epoch {epoch:02d} | train_loss={train_loss:.4f} | val_acc={val_acc:.4f} | "
+              f"val_wetland_f1={val_f1:.4f} | lr={current_lr:.2e} | "
+              f"{throughput[-1]:,.0f} samples/s ({train_time:.1f}s)")
 
         # Step the learning rate scheduler
         scheduler.step()
 
-        if val_acc > best_val_acc:
-            best_val_acc = val_acc
-            best_state = {k: v.detach().cpu().clone() for k, v in model.state_dict().items()}
+        # Every rank sees the same all-reduced metrics, so all stop on the same epoch
+        score = val_f1 if args.select_by == "wetland_f1" else val_acc
+        if score > best_score + args.min_delta:
+            best_score, best_val_acc, best_val_f1, best_epoch = score, val_acc, val_f1, epoch
+            bad_epochs = 0
+            if writer:
+                writer.save(best_path, model.state_dict())
+        else:
+            bad_epochs += 1
+        stopped_early = args.patience is not None and bad_epochs >= args.patience
+
+        if writer and args.checkpoint_every and (epoch % args.checkpoint_every == 0 or epoch == epochs
+                                                 or stopped_early):
+            writer.save(last_path, {
+                "epoch": epoch,
+                "epochs": epochs,
+                "run_id": run_id,
+                "model": model.state_dict(),
+                "optimizer": optimizer.state_dict(),
+                "scheduler": scheduler.state_dict(),
+                "rng": rng_state(),
+                "best_score": best_score,
+                "best_val_acc": best_val_acc,
+                "best_val_f1": best_val_f1,
+                "best_epoch": best_epoch,
+                "bad_epochs": bad_epochs,
+                "throughput": throughput,
+                "best_path": best_path,
+                "select_by": args.select_by,
+            })
+        if stopped_early:
+            print(f"Early stopping: no val {args.select_by} improvement for {args.patience} epochs "
+                  f"(best epoch {best_epoch})")
+            break
+
+    # The first epoch includes torch.compile / worker start-up
+    steady = throughput[1:] or throughput
+    print(f"\nThroughput: {np.mean(steady):,.0f} samples/s (mean of epochs {2 if len(throughput) > 1 else 1}-"
+          f"{len(throughput)}), first epoch {throughput[0]:,.0f} samples/s")
 
     # Test using best checkpoint
-    print("\nEvaluating on Test Set...")
-    if best_state is not None:
-        model.load_state_dict(best_state)
-
-    model.eval()
-    y_pred, y_true = [], []
-    with torch.no_grad():
-        for xb, yb in test_loader:
-            xb = xb.to(device, non_blocking=True)
-            logits = model(xb)
-            pred = torch.argmax(logits, dim=1).cpu().numpy()
-            y_pred.append(pred)
-            y_true.append(yb.numpy())
+    print(f"\nEvaluating on Test Set (best epoch {best_epoch} by val {args.select_by})...")
+    if writer:
+        writer.close()
+    if best_epoch:
+        # Rank 0's writer has flushed; the weights reach the other ranks by broadcast
+        model.load_state_dict(load_on_rank0(best_path, rank, distributed))
 
-    y_pred = np.concatenate(y_pred)
-    y_true = np.concatenate(y_true)
-
-    acc = accuracy_score(y_true, y_pred)
-    cm = confusion_matrix(y_true, y_pred)
-    report = classification_report(y_true, y_pred, digits=4)
+    test_cm = evaluate(net, test_loader, device, autocast, args.channels_last)
+    acc, test_f1 = test_cm.accuracy(), mean_wetland_f1(test_cm)
 
     print("\nTEST ACC:", acc)
-    print("\nCONFUSION MATRIX:\n", cm)
-    print("\nREPORT:\n", report)
-
-    # Save model + metadata
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    out_model = os.path.join(os.path.dirname(__file__), f"wetland_cnn_v3_resnet_{timestamp}.pt")
-    out_meta = os.path.join(os.path.dirname(__file__), f"wetland_cnn_v3_resnet_{timestamp}_metadata.json")
-
-    torch.save(
-        {
-            "state_dict": model.state_dict(),
-            "mean": mean.astype(np.float32),
-            "std": std.astype(np.float32),
-            "class_weights": class_weights.astype(np.float32),
-        },
-        out_model,
-    )
-
-    meta = {
-        "timestamp": timestamp,
-        "model_type": "ResNet18Wetland",
-        "input_channels": 64,
-        "patch_size": 15,
-        "num_classes": 6,
-        "best_val_acc": float(best_val_acc),
-        "test_acc": float(acc),
-        "optimizer": "AdamW_CosineAnnealingLR",
-        "dataset": {"source": "wetland_cnn_dataset_15x15.npz"},
-    }
-    with open(out_meta, "w", encoding="utf-8") as f:
-        json.dump(meta, f, indent=2)
-
-    print(f"\nSaved: {out_model}")
-    print(f"Saved: {out_meta}")
+    print("TEST WETLAND F1:", test_f1)
+    print("\nCONFUSION MATRIX:\n", test_cm.matrix)
+    print("\nREPORT:\n", format_report(test_cm))
+
+    # Save model + metadata (rank 0 only; all ranks hold the same weights)
+    if rank == 0:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        os.makedirs(args.out_dir, exist_ok=True)
+        out_model = os.path.join(args.out_dir, f"{out_prefix}_{timestamp}.pt")
+        out_meta = os.path.join(args.out_dir, f"{out_prefix}_{timestamp}_metadata.json")
+
+        torch.save(
+            {
+                "state_dict": model.state_dict(),
+                "mean": mean.astype(np.float32),
+                "std": std.astype(np.float32),
+                "class_weights": class_weights.astype(np.float32),
+            },
+            out_model,
+        )
+
+        meta = {
+            "timestamp": timestamp,
+            "model_type": model_cls.__name__,
+            "input_channels": 64,
+            "patch_size": patch_size,
+            "num_classes": 6,
+            "best_val_acc": float(best_val_acc),
+            "best_val_wetland_f1": float(best_val_f1),
+            "best_epoch": best_epoch,
+            "selected_by": args.select_by,
+            "epochs_run": len(throughput),
+            "early_stopping": {"patience": args.patience, "min_delta": args.min_delta,
+                               "stopped_early": stopped_early},
+            "checkpoints": {"best": best_path, "last": last_path if args.checkpoint_every else None,
+                            "resumed_from": args.resume},
+            "test_acc": float(acc),
+            "test_wetland_f1": float(test_f1),
+            "test_f1_per_class": [None if np.isnan(f) else round(float(f), 4) for f in test_cm.f1()],
+            "optimizer": "AdamW_CosineAnnealingLR",
+            "dataset": source,
+            "performance": {**perf_config, "device": device.type,
+                            "train_samples_per_sec": [round(t, 1) for t in throughput]},
+        }
+        with open(out_meta, "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+
+        print(f"\nSaved: {out_model}")
+        print(f"Saved: {out_meta}")
+
+    if distributed:
+        dist.barrier()
+        dist.destroy_process_group()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,102 @@
+"""
+Reproducible train/test datasets from a seeded split index
+===========================================================
+Instead of passing the 1.5M-sample .npz around, share the split index
+(a few MB: row, col, class, split per sample + the seed and split settings)
+and rebuild the arrays from the tiles whenever needed.
+
+    # 1. sample the split (streams the labels raster; same seed -> same index)
+    python build_dataset.py index bow_river_wetlands_10m_final.tif middle_split_index.npz \\
+        --split middle --test-row-min 12288 --test-row-max 18432 --seed 42
+
+    # 2. rebuild the dataset from the tiles (or a pixel store), in parallel
+    python build_dataset.py extract middle_split_index.npz <embeddings_dir> wetland_dataset_middle_split.npz
+
+Splits (matching the RF / SVM scripts):
+    random   whole raster, random train/test
+    column   test = cols < --test-col-max         (random_forest_spatial, wetland_dataset_smart_split.npz)
+    middle   test = rows [--test-row-min, --test-row-max)  (random_forest_spatial_middle, SVM, combos)
+
+Budgets default to the middle-split notebook's; override with e.g.
+--train "0:600000,1:14418,2:150000,3:500000,4:150000,5:100000".
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from data_preprocessing.sampling import SPLIT_KINDS, SPLIT_TEST, build_dataset, load_index, make_split, save_index
+
+DEFAULT_TRAIN = {0: 600_000, 1: 14_418, 2: 150_000, 3: 500_000, 4: 150_000, 5: 100_000}
+DEFAULT_TEST = {0: 150_000, 1: 4_806, 2: 37_500, 3: 125_000, 4: 37_500, 5: 25_000}
+
+
+def parse_budgets(text):
+    return {int(c): int(n) for c, n in (item.split(':') for item in text.split(','))}
+
+
+def cmd_index(args):
+    train = parse_budgets(args.train) if args.train else DEFAULT_TRAIN
+    test = parse_budgets(args.test) if args.test else DEFAULT_TEST
+    random_classes = [int(c) for c in args.random_classes.split(',')] if args.random_classes else ()
+
+    print(f"Sampling {args.split} split (seed {args.seed}) from {args.labels}...")
+    t0 = time.time()
+    index = make_split(args.labels, args.split, train, test, seed=args.seed,
+                       test_col_max=args.test_col_max, test_row_min=args.test_row_min,
+                       test_row_max=args.test_row_max, random_classes=random_classes)
+    save_index(args.index, index)
+
+    is_test = index['split'] == SPLIT_TEST
+    print(f"\n  {'Class':>5}  {'train':>10}  {'test':>10}")
+    for cls in sorted(set(train) | set(test)):
+        of_cls = index['labels'] == cls
+        print(f"  {cls:>5}  {(of_cls & ~is_test).sum():>10,}  {(of_cls & is_test).sum():>10,}")
+    print(f"\n✓ {index['labels'].size:,} samples -> {args.index} "
+          f"({Path(args.index).stat().st_size / 1024**2:.1f} MB, {time.time() - t0:.1f}s)")
+
+
+def cmd_extract(args):
+    index = load_index(args.index)
+    print(f"Rebuilding {index['meta']['kind']} split (seed {index['meta']['seed']}, "
+          f"{index['labels'].size:,} samples) from {args.embeddings_dir}...")
+    t0 = time.time()
+    data = build_dataset(index, args.embeddings_dir, n_workers=args.workers)
+    np.savez_compressed(args.output, **data)
+    print(f"\n✓ Saved {args.output} ({time.time() - t0:.1f}s)")
+    print(f"  X_train: {data['X_train'].shape}  |  X_test: {data['X_test'].shape}")
+    if int(data['n_missing']):
+        print(f"  ⚠ {int(data['n_missing']):,} samples dropped (no embedding / NaN)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Seeded split index and parallel dataset rebuild')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('index', help='Sample a split and write its index')
+    p.add_argument('labels', help='Labels raster')
+    p.add_argument('index', help='Output index .npz')
+    p.add_argument('--split', choices=SPLIT_KINDS, default='middle')
+    p.add_argument('--seed', type=int, default=42)
+    p.add_argument('--train', default=None, help='Train budgets "cls:n,cls:n,..."')
+    p.add_argument('--test', default=None, help='Test budgets "cls:n,cls:n,..."')
+    p.add_argument('--test-col-max', type=int, default=None)
+    p.add_argument('--test-row-min', type=int, default=None)
+    p.add_argument('--test-row-max', type=int, default=None)
+    p.add_argument('--random-classes', default=None,
+                   help='Classes split at random even for spatial splits, e.g. "1,2" for the column split')
+    p.set_defaults(func=cmd_index)
+
+    p = sub.add_parser('extract', help='Rebuild the dataset .npz from an index')
+    p.add_argument('index', help='Index .npz from the index command')
+    p.add_argument('embeddings_dir', help='Embedding tiles directory or pixel store')
+    p.add_argument('output', help='Output dataset .npz')
+    p.add_argument('--workers', '-w', type=int, default=None, help='Parallel tile readers (default: all cores)')
+    p.set_defaults(func=cmd_extract)
+
+    args = parser.parse_args()
+    args.func(args)
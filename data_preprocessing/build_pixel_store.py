@@ -0,0 +1,70 @@
+"""
+Build a pixel-interleaved embedding store from the GEE tiles
+=============================================================
+One-time conversion of every 64-band (64, h, w) GeoTIFF tile into an
+(h, w, 64) .npy file that can be memory-mapped. Pixels then come out as
+contiguous (n, 64) rows that sklearn and torch consume without the
+reshape(64, n).T copy.
+
+The output directory can be passed anywhere an embeddings directory is
+expected (generate_classification_map.py, visualize_test_region*.py), and
+PixelStore(store_dir) gives windowed / point reads for dataset building.
+
+Re-running only converts tiles that are new or changed.
+
+--dtype float16 halves the store and int8 quarters it (per-band affine
+quantization, scale/offset kept in store.json). Readers decode back to
+float32 transparently; see quantization_report.py for the accuracy impact.
+
+Usage:
+    python build_pixel_store.py <embeddings_dir> <store_dir>
+    python build_pixel_store.py <embeddings_dir> <store_dir> --labels bow_river_wetlands_10m_final.tif --workers 8
+    python build_pixel_store.py <embeddings_dir> <store_dir> --dtype int8
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from inference import build_pixel_store, find_embedding_tiles
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert GEE embedding tiles to a pixel-interleaved store')
+    parser.add_argument('embeddings_dir', help='Directory containing embedding GeoTIFF tiles')
+    parser.add_argument('store_dir', help='Output directory for the pixel store')
+    parser.add_argument('--labels', '-l', default=None,
+                        help='Labels raster defining the full grid (default: union of tile extents)')
+    parser.add_argument('--workers', '-w', type=int, default=None,
+                        help='Parallel conversion processes (default: all cores)')
+    parser.add_argument('--dtype', '-d', choices=['float32', 'float16', 'int8'], default='float32',
+                        help='Storage encoding (default: float32, exact)')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("PIXEL STORE BUILDER")
+    print("=" * 60)
+
+    tile_files = find_embedding_tiles(args.embeddings_dir)
+    tile_files = [t for t in tile_files if t.suffix.lower() == '.tif']
+    print(f"\n1. Found {len(tile_files)} tiles in {args.embeddings_dir}")
+    if not tile_files:
+        print("   ERROR: No GeoTIFF tiles found.")
+        sys.exit(1)
+
+    print(f"\n2. Converting to {args.store_dir} ...")
+    t0 = time.time()
+    store = build_pixel_store(tile_files, args.store_dir, reference_path=args.labels, n_workers=args.workers,
+                              encoding=args.dtype)
+
+    size_gb = sum(t.path.stat().st_size for t in store.tiles) / 1024**3
+    print(f"\n{'='*60}")
+    print("DONE")
+    print(f"{'='*60}")
+    print(f"  Tiles:  {len(store)}")
+    print(f"  Grid:   {store.height} x {store.width} x {store.n_bands}")
+    print(f"  Dtype:  {store.encoding}")
+    print(f"  Size:   {size_gb:.2f} GB")
+    print(f"  Time:   {time.time() - t0:.1f}s")
@@ -1,124 +1,201 @@
 """
 Create VRT from new matched tiles and verify alignment
+
+Tile metadata (size, dtype, block shape, transform) is collected in one
+parallel pass and cached in the tile catalog (see check_tile_coverage.py), so
+each tile is opened at most once and a rebuild after adding tiles only opens
+the new files. Every source gets an explicit SrcRect / DstRect computed from
+its geotransform, plus SourceProperties so GDAL doesn't have to open every
+tile just to read the VRT.
+
+Usage:
+    python build_vrt_and_verify.py
+    python build_vrt_and_verify.py --tiles Google_Dataset --labels bow_river_wetlands_10m_final.tif \\
+        --output bow_river_embeddings_2020_matched.vrt --workers 8
 """
-import rasterio
-from rasterio.merge import merge
-import glob
+import argparse
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from xml.dom import minidom
 
-# Find all new tiles
-tile_pattern = "Google_Dataset/bow_river_embeddings_2020_matched-*.tif"
-tile_files = sorted(glob.glob(tile_pattern))
-print(f"Found {len(tile_files)} tiles")
+import rasterio
+from rasterio.crs import CRS
 
-# Create VRT using rasterio
-print("Building VRT...")
-from rasterio import shutil as rio_shutil
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from inference import TileCatalog, parse_tile_offset
+from inference.catalog import CATALOG_NAME
 
-# Use gdalbuildvrt-like functionality
-vrt_options = {
-    'resolution': 'highest'
+GDAL_TYPES = {
+    'uint8': 'Byte', 'int8': 'Int8', 'uint16': 'UInt16', 'int16': 'Int16',
+    'uint32': 'UInt32', 'int32': 'Int32', 'float32': 'Float32', 'float64': 'Float64',
 }
 
-# Build VRT by opening all tiles and getting combined metadata
-src_files = [rasterio.open(fp) for fp in tile_files]
 
-# Get bounds
-all_bounds = [src.bounds for src in src_files]
-min_left = min(b.left for b in all_bounds)
-min_bottom = min(b.bottom for b in all_bounds)
-max_right = max(b.right for b in all_bounds)
-max_top = max(b.top for b in all_bounds)
-
-# Create VRT XML manually (simple approach)
-import xml.etree.ElementTree as ET
-
-first_src = src_files[0]
-vrt_width = int((max_right - min_left) / first_src.res[0])
-vrt_height = int((max_top - min_bottom) / first_src.res[1])
-
-vrt_root = ET.Element('VRTDataset', {
-    'rasterXSize': str(vrt_width),
-    'rasterYSize': str(vrt_height)
-})
-
-# Add SRS
-srs = ET.SubElement(vrt_root, 'SRS')
-srs.text = first_src.crs.to_wkt()
-
-# Add GeoTransform
-geotransform = ET.SubElement(vrt_root, 'GeoTransform')
-geotransform.text = f"{min_left}, {first_src.res[0]}, 0, {max_top}, 0, {-first_src.res[1]}"
-
-# Add bands
-for band_idx in range(1, first_src.count + 1):
-    band = ET.SubElement(vrt_root, 'VRTRasterBand', {
-        'dataType': 'Float32',
-        'band': str(band_idx)
-    })
-    
-    # Add each tile as a source
-    for tile_file in tile_files:
-        with rasterio.open(tile_file) as tile:
+def vrt_grid(entries, reference_path=None):
+    """(width, height, geotransform, crs_wkt) of the VRT: the labels grid or the union of tiles."""
+    if reference_path is not None:
+        with rasterio.open(reference_path) as ref:
+            return ref.width, ref.height, list(ref.transform)[:6], ref.crs.to_wkt() if ref.crs else None
+
+    res_x, _, _, _, res_y, _ = entries[0]['transform']
+    left = min(e['transform'][2] for e in entries)
+    top = max(e['transform'][5] for e in entries)
+    right = max(e['transform'][2] + e['width'] * res_x for e in entries)
+    bottom = min(e['transform'][5] + e['height'] * res_y for e in entries)
+    width = int(round((right - left) / res_x))
+    height = int(round((top - bottom) / -res_y))
+    return width, height, [res_x, 0.0, left, 0.0, res_y, top], entries[0]['crs']
+
+
+def placement(entry, geotransform):
+    """DstRect (x_off, y_off) of a tile inside the VRT grid, from its geotransform."""
+    res_x, _, left, _, res_y, top = geotransform
+    x_off = (entry['transform'][2] - left) / res_x
+    y_off = (entry['transform'][5] - top) / res_y
+    return x_off, y_off
+
+
+def build_vrt(entries, tiles_dir, vrt_file, reference_path=None):
+    width, height, gt, crs_wkt = vrt_grid(entries, reference_path)
+    first = entries[0]
+    n_bands = first['count']
+    data_type = GDAL_TYPES[first['dtype']]
+    vrt_dir = Path(vrt_file).resolve().parent
+
+    vrt_root = ET.Element('VRTDataset', {'rasterXSize': str(width), 'rasterYSize': str(height)})
+    if crs_wkt:
+        ET.SubElement(vrt_root, 'SRS').text = crs_wkt
+    ET.SubElement(vrt_root, 'GeoTransform').text = (
+        f"{gt[2]!r}, {gt[0]!r}, {gt[1]!r}, {gt[5]!r}, {gt[3]!r}, {gt[4]!r}"
+    )
+
+    # Per-tile source XML shared by all bands; only SourceBand differs
+    placed, warnings = [], []
+    for e in entries:
+        x_off, y_off = placement(e, gt)
+        if abs(x_off - round(x_off)) > 1e-6 or abs(y_off - round(y_off)) > 1e-6:
+            warnings.append(f"{e['file']}: off-grid by ({x_off % 1:.4f}, {y_off % 1:.4f}) px")
+        x_off, y_off = int(round(x_off)), int(round(y_off))
+        row_off, col_off = parse_tile_offset(e['file'])
+        if reference_path is not None and row_off is not None and (row_off, col_off) != (y_off, x_off):
+            warnings.append(f"{e['file']}: name says row {row_off} col {col_off}, "
+                            f"transform places it at row {y_off} col {x_off}")
+        src_name = os.path.relpath(Path(tiles_dir).resolve() / e['file'], vrt_dir)
+        placed.append((e, src_name, x_off, y_off))
+
+    for band_idx in range(1, n_bands + 1):
+        band = ET.SubElement(vrt_root, 'VRTRasterBand', {'dataType': data_type, 'band': str(band_idx)})
+        if data_type.startswith('Float'):
+            ET.SubElement(band, 'NoDataValue').text = 'nan'
+        for e, src_name, x_off, y_off in placed:
             simple_source = ET.SubElement(band, 'SimpleSource')
-            
-            src_filename = ET.SubElement(simple_source, 'SourceFilename', {'relativeToVRT': '1'})
-            src_filename.text = tile_file
-            
-            src_band = ET.SubElement(simple_source, 'SourceBand')
-            src_band.text = str(band_idx)
-
-# Write VRT
-from xml.dom import minidom
-vrt_file = "bow_river_embeddings_2020_matched.vrt"
-xml_str = minidom.parseString(ET.tostring(vrt_root)).toprettyxml(indent="  ")
-with open(vrt_file, 'w') as f:
-    f.write(xml_str)
-
-# Close all source files
-for src in src_files:
-    src.close()
-
-print(f"✓ Created: {vrt_file}")
-
-# Now verify alignment
-print("\n" + "="*60)
-print("VERIFYING ALIGNMENT")
-print("="*60)
-
-with rasterio.open(vrt_file) as emb:
-    with rasterio.open("bow_river_wetlands_10m_final.tif") as lab:
-        
-        print("\nEmbeddings VRT:")
-        print(f"  Dimensions: {emb.height} x {emb.width}")
-        print(f"  Bands: {emb.count}")
-        print(f"  CRS: {emb.crs}")
-        print(f"  Bounds: {emb.bounds}")
-        
-        print("\nLabels:")
-        print(f"  Dimensions: {lab.height} x {lab.width}")
-        print(f"  Bands: {lab.count}")
-        print(f"  CRS: {lab.crs}")
-        print(f"  Bounds: {lab.bounds}")
-        
+            ET.SubElement(simple_source, 'SourceFilename', {'relativeToVRT': '1'}).text = src_name
+            ET.SubElement(simple_source, 'SourceBand').text = str(band_idx)
+            block_y, block_x = e['block_shape']
+            ET.SubElement(simple_source, 'SourceProperties', {
+                'RasterXSize': str(e['width']), 'RasterYSize': str(e['height']),
+                'DataType': GDAL_TYPES[e['dtype']],
+                'BlockXSize': str(block_x), 'BlockYSize': str(block_y),
+            })
+            ET.SubElement(simple_source, 'SrcRect', {
+                'xOff': '0', 'yOff': '0', 'xSize': str(e['width']), 'ySize': str(e['height']),
+            })
+            ET.SubElement(simple_source, 'DstRect', {
+                'xOff': str(x_off), 'yOff': str(y_off), 'xSize': str(e['width']), 'ySize': str(e['height']),
+            })
+
+    xml_str = minidom.parseString(ET.tostring(vrt_root)).toprettyxml(indent="  ")
+    with open(vrt_file, 'w') as f:
+        f.write(xml_str)
+    return width, height, warnings
+
+
+def verify_alignment(vrt_file, labels_file):
+    with rasterio.open(vrt_file) as emb:
+        with rasterio.open(labels_file) as lab:
+
+            print("\nEmbeddings VRT:")
+            print(f"  Dimensions: {emb.height} x {emb.width}")
+            print(f"  Bands: {emb.count}")
+            print(f"  CRS: {emb.crs}")
+            print(f"  Bounds: {emb.bounds}")
+
+            print("\nLabels:")
+            print(f"  Dimensions: {lab.height} x {lab.width}")
+            print(f"  Bands: {lab.count}")
+            print(f"  CRS: {lab.crs}")
+            print(f"  Bounds: {lab.bounds}")
+
+            print("\n" + "="*60)
+            print("RESULTS:")
+            print("="*60)
+
+            # Check dimensions
+            dims_match = (emb.height, emb.width) == (lab.height, lab.width)
+            print(f"{'✓' if dims_match else '❌'} Dimensions: {emb.height}x{emb.width} vs {lab.height}x{lab.width}")
+
+            # Check CRS
+            crs_match = emb.crs == lab.crs
+            print(f"{'✓' if crs_match else '❌'} CRS: {emb.crs} vs {lab.crs}")
+
+            # Check bounds (within 1m tolerance)
+            bounds_close = all(abs(a - b) < 1.0 for a, b in zip(emb.bounds, lab.bounds))
+            print(f"{'✓' if bounds_close else '❌'} Bounds match (within 1m)")
+
+            if dims_match and crs_match and bounds_close:
+                print("\n🎉 SUCCESS! Rasters are perfectly aligned!")
+                print(f"\nUpdate your dataloader.py to use: '{vrt_file}'")
+            else:
+                print("\n⚠ WARNING: Rasters may not be perfectly aligned")
+                print("You may need to re-download or reproject")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build an embeddings VRT from GEE tiles and verify alignment')
+    parser.add_argument('--tiles', '-t', default='Google_Dataset', help='Directory containing the tiles')
+    parser.add_argument('--pattern', default='bow_river_embeddings_2020_matched-*.tif')
+    parser.add_argument('--labels', '-l', default='bow_river_wetlands_10m_final.tif',
+                        help='Labels raster; the VRT is built on its grid if it exists')
+    parser.add_argument('--output', '-o', default='bow_river_embeddings_2020_matched.vrt')
+    parser.add_argument('--catalog', '-c', default=None,
+                        help=f'Tile catalog path (default: <tiles>/{CATALOG_NAME})')
+    parser.add_argument('--workers', '-w', type=int, default=None,
+                        help='Parallel metadata readers (default: all cores)')
+    args = parser.parse_args()
+
+    # Find all new tiles
+    tile_files = sorted(Path(args.tiles).glob(args.pattern))
+    print(f"Found {len(tile_files)} tiles")
+    if not tile_files:
+        sys.exit(1)
+
+    t0 = time.time()
+    catalog = TileCatalog(args.catalog or Path(args.tiles) / CATALOG_NAME)
+    scanned = catalog.scan(tile_files, n_workers=args.workers, stats=False)
+    catalog.save()
+    print(f"Tile metadata: read {len(scanned)} tiles, {len(tile_files) - len(scanned)} from catalog "
+          f"({time.time() - t0:.1f}s)")
+
+    entries = [catalog.get(t) for t in tile_files]
+    mixed = {(e['count'], e['dtype'], CRS.from_wkt(e['crs']) if e['crs'] else None) for e in entries}
+    if len(mixed) != 1:
+        print(f"❌ Tiles disagree on band count / dtype / CRS: {mixed}")
+        sys.exit(1)
+
+    # Create VRT
+    print("Building VRT...")
+    reference = args.labels if os.path.exists(args.labels) else None
+    width, height, warnings = build_vrt(entries, args.tiles, args.output, reference_path=reference)
+    print(f"✓ Created: {args.output} ({height} x {width}, {len(entries)} sources per band)")
+    for w in warnings:
+        print(f"  ⚠ {w}")
+
+    # Now verify alignment
+    if reference is not None:
         print("\n" + "="*60)
-        print("RESULTS:")
+        print("VERIFYING ALIGNMENT")
         print("="*60)
-        
-        # Check dimensions
-        dims_match = (emb.height, emb.width) == (lab.height, lab.width)
-        print(f"{'✓' if dims_match else '❌'} Dimensions: {emb.height}x{emb.width} vs {lab.height}x{lab.width}")
-        
-        # Check CRS
-        crs_match = emb.crs == lab.crs
-        print(f"{'✓' if crs_match else '❌'} CRS: {emb.crs} vs {lab.crs}")
-        
-        # Check bounds (within 1m tolerance)
-        bounds_close = all(abs(a - b) < 1.0 for a, b in zip(emb.bounds, lab.bounds))
-        print(f"{'✓' if bounds_close else '❌'} Bounds match (within 1m)")
-        
-        if dims_match and crs_match and bounds_close:
-            print("\n🎉 SUCCESS! Rasters are perfectly aligned!")
-            print(f"\nUpdate your dataloader.py to use: '{vrt_file}'")
-        else:
-            print("\n⚠ WARNING: Rasters may not be perfectly aligned")
-            print("You may need to re-download or reproject")
+        verify_alignment(args.output, args.labels)
@@ -1,72 +1,104 @@
 """
 Check which GEE embedding tiles contain valid data vs NaN
 This will help you identify which parts of Bow River have coverage
+
+Every block of every band of every tile is read (in parallel), so partially
+NaN tiles are measured exactly. Results are kept in a tile catalog
+(tile_catalog.json next to the tiles by default) holding per-tile valid-pixel
+fraction, per-band NaN counts, min/max/mean and a block coverage bitmap.
+Re-running only scans new or changed tiles.
+
+generate_classification_map.py and dataloader_tile_optimized.py pick the
+catalog up automatically and skip empty tiles / blocks without opening them.
+
+Usage:
+    python check_tile_coverage.py <tiles_dir>
+    python check_tile_coverage.py <tiles_dir> --catalog tile_catalog.json --workers 8 --block-size 256
 """
-import rasterio
-import numpy as np
+import argparse
+import sys
+import time
 from pathlib import Path
 
-# Directory containing tiles (update this path)
-tiles_dir = Path("./EarthEngine-Download")  # Current directory or update to your tiles folder
-tile_files = sorted(tiles_dir.glob("bow_river_embeddings_2020_CORRECTED*.tif"))
-
-print(f"Found {len(tile_files)} tiles\n")
-print("="*80)
-print("Checking each tile for valid data...")
-print("="*80)
-
-valid_tiles = []
-nan_tiles = []
-
-for tile_file in tile_files:
-    file_size_mb = tile_file.stat().st_size / (1024**2)
-    
-    try:
-        with rasterio.open(tile_file) as src:
-            # Sample first band, small window
-            data = src.read(1, window=((0, min(100, src.height)), (0, min(100, src.width))))
-            
-            has_data = not np.all(np.isnan(data))
-            percent_nan = np.isnan(data).sum() / data.size * 100
-            
-            status = "✓ VALID" if has_data else "✗ NaN"
-            
-            if has_data:
-                valid_tiles.append(tile_file.name)
-            else:
-                nan_tiles.append(tile_file.name)
-            
-            print(f"{status:10} | {file_size_mb:6.1f} MB | {percent_nan:5.1f}% NaN | {tile_file.name}")
-    
-    except Exception as e:
-        print(f"ERROR     | {file_size_mb:6.1f} MB | Error: {e} | {tile_file.name}")
-
-print("\n" + "="*80)
-print(f"SUMMARY")
-print("="*80)
-print(f"Valid tiles (with data):  {len(valid_tiles)}")
-print(f"NaN tiles (empty):        {len(nan_tiles)}")
-print(f"Coverage:                 {len(valid_tiles)/(len(valid_tiles)+len(nan_tiles))*100:.1f}%")
-
-print("\n" + "="*80)
-print("RECOMMENDATION")
-print("="*80)
-
-if len(valid_tiles) > 0:
-    print(f"✓ You have {len(valid_tiles)} tiles with valid data!")
-    print(f"✓ Train your model using ONLY these tiles")
-    print(f"✓ Your model will work for ~{len(valid_tiles)/(len(valid_tiles)+len(nan_tiles))*100:.0f}% of the Bow River region")
-    
-    if len(nan_tiles) > len(valid_tiles):
-        print(f"\n⚠ WARNING: Most of your region ({len(nan_tiles)} tiles) has no embedding coverage")
-        print(f"⚠ Consider supplementing with Sentinel-2 for full coverage")
-else:
-    print("✗ No valid tiles found - all are NaN")
-    print("✗ You MUST switch to Sentinel-2 or another dataset")
-
-# Save valid tile list
-if len(valid_tiles) > 0:
-    with open("valid_tiles_list.txt", "w") as f:
-        for tile in valid_tiles:
-            f.write(f"{tile}\n")
-    print(f"\n✓ Valid tile list saved to: valid_tiles_list.txt")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from inference import TileCatalog, find_embedding_tiles
+from inference.catalog import CATALOG_NAME, DEFAULT_BLOCK_SIZE
+
+
+def print_entry(entry):
+    stats = entry['stats']
+    size_mb = entry['size'] / (1024**2)
+    pct_valid = 100 * stats['valid_fraction']
+    status = "✓ VALID" if stats['n_valid'] else "✗ NaN"
+    blocks = ''.join(stats['bitmap'])
+    print(f"{status:10} | {size_mb:6.1f} MB | {100 - pct_valid:5.1f}% NaN | "
+          f"{blocks.count('1'):4d}/{len(blocks):<4d} blocks | {entry['file']}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Scan embedding tiles for valid (non-NaN) coverage')
+    parser.add_argument('tiles_dir', nargs='?', default='./EarthEngine-Download',
+                        help='Directory containing embedding GeoTIFF tiles')
+    parser.add_argument('--catalog', '-c', default=None,
+                        help=f'Catalog path (default: <tiles_dir>/{CATALOG_NAME})')
+    parser.add_argument('--workers', '-w', type=int, default=None,
+                        help='Parallel scan processes (default: all cores)')
+    parser.add_argument('--block-size', '-b', type=int, default=DEFAULT_BLOCK_SIZE,
+                        help=f'Coverage bitmap block size in pixels (default: {DEFAULT_BLOCK_SIZE})')
+    parser.add_argument('--rescan', action='store_true', help='Rescan every tile, ignoring the catalog')
+    args = parser.parse_args()
+
+    tiles_dir = Path(args.tiles_dir)
+    tile_files = [t for t in find_embedding_tiles(tiles_dir) if t.suffix.lower() == '.tif']
+    catalog = TileCatalog(args.catalog or tiles_dir / CATALOG_NAME)
+
+    print(f"Found {len(tile_files)} tiles\n")
+    print("="*80)
+    print("Checking each tile for valid data...")
+    print("="*80)
+
+    t0 = time.time()
+    scanned = catalog.scan(tile_files, n_workers=args.workers, block_size=args.block_size,
+                           rescan=args.rescan, on_entry=print_entry)
+    catalog.save()
+    print(f"\nScanned {len(scanned)} tiles in {time.time() - t0:.1f}s "
+          f"({len(tile_files) - len(scanned)} unchanged, from catalog)")
+    print(f"Catalog: {catalog.path}")
+
+    entries = [catalog.get(t) for t in tile_files]
+    valid_tiles = [e['file'] for e in entries if e['stats']['n_valid']]
+    nan_tiles = [e['file'] for e in entries if not e['stats']['n_valid']]
+    n_pixels = sum(e['stats']['n_pixels'] for e in entries)
+    n_valid = sum(e['stats']['n_valid'] for e in entries)
+
+    print("\n" + "="*80)
+    print(f"SUMMARY")
+    print("="*80)
+    print(f"Valid tiles (with data):  {len(valid_tiles)}")
+    print(f"NaN tiles (empty):        {len(nan_tiles)}")
+    if entries:
+        print(f"Coverage:                 {len(valid_tiles)/len(entries)*100:.1f}% of tiles, "
+              f"{100*n_valid/max(n_pixels, 1):.1f}% of pixels")
+
+    print("\n" + "="*80)
+    print("RECOMMENDATION")
+    print("="*80)
+
+    if len(valid_tiles) > 0:
+        print(f"✓ You have {len(valid_tiles)} tiles with valid data!")
+        print(f"✓ Train your model using ONLY these tiles")
+        print(f"✓ Your model will work for ~{100*n_valid/n_pixels:.0f}% of the tiled Bow River region")
+
+        if len(nan_tiles) > len(valid_tiles):
+            print(f"\n⚠ WARNING: Most of your region ({len(nan_tiles)} tiles) has no embedding coverage")
+            print(f"⚠ Consider supplementing with Sentinel-2 for full coverage")
+    else:
+        print("✗ No valid tiles found - all are NaN")
+        print("✗ You MUST switch to Sentinel-2 or another dataset")
+
+    # Save valid tile list
+    if len(valid_tiles) > 0:
+        with open("valid_tiles_list.txt", "w") as f:
+            for tile in valid_tiles:
+                f.write(f"{tile}\n")
+        print(f"\n✓ Valid tile list saved to: valid_tiles_list.txt")
@@ -1,27 +1,41 @@
+import sys
 import rasterio
+from rasterio.windows import Window
 import numpy as np
 import torch
 from tqdm import tqdm
 from pathlib import Path
 from collections import defaultdict
 
-# File paths
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from inference import PixelStore, TileCatalog, is_pixel_store
+from inference.catalog import DEFAULT_BLOCK_SIZE
+from inference.tiles import parse_tile_offset
+from data_preprocessing.sampling import count_classes, sample_balanced
+
+# File paths (embeddings_dir may also be a pixel store from build_pixel_store.py,
+# in any dtype -- samples are then gathered straight from the memory-mapped tiles)
 labels_file = "/kaggle/input/bo-river-and-google-earth/bow_river_wetlands_10m_final.tif"
 embeddings_dir = Path("/kaggle/input/bo-river-and-google-earth/Google_Dataset")
+catalog_file = None   # tile_catalog.json from check_tile_coverage.py (default: looked up in embeddings_dir)
+SEED = 42             # same seed -> same sampled pixels
 
 print("="*60)
 print("TILE-OPTIMIZED DATALOADER - Fast Version")
 print("="*60)
 
-# Load labels
-print("\n1. Loading labels...")
+# Labels are streamed in strips by the sampler, never loaded whole
+print("\n1. Labels (streamed)...")
 with rasterio.open(labels_file) as labels_src:
-    labels_full = labels_src.read(1)
-    print(f"   Labels shape: {labels_full.shape}")
+    print(f"   Labels shape: {labels_src.shape}")
 
 # Get list of all embedding tiles
-tile_files = sorted(embeddings_dir.glob("*.tif"))
-print(f"\n2. Found {len(tile_files)} embedding tiles")
+store = PixelStore(embeddings_dir) if is_pixel_store(embeddings_dir) else None
+tile_files = [t.path for t in store.tiles] if store else sorted(embeddings_dir.glob("*.tif"))
+print(f"\n2. Found {len(tile_files)} embedding tiles" + (f" (pixel store, {store.encoding})" if store else ""))
+catalog = TileCatalog(catalog_file) if catalog_file else TileCatalog.for_tiles(embeddings_dir)
+if catalog is not None:
+    print(f"   Tile catalog: {sum(catalog.is_empty(t) for t in tile_files)} empty tiles will be skipped")
 
 # Balanced sampling strategy
 samples_per_class = {
@@ -35,48 +49,18 @@ samples_per_class = {
 total_target = sum(samples_per_class.values())
 print(f"\n3. Balanced sampling target: {total_target:,} samples")
 
-# Analyze class distribution
-valid_mask = (labels_full >= 0) & (labels_full <= 5)
-unique_classes, class_counts = np.unique(labels_full[valid_mask], return_counts=True)
+# Analyze class distribution (one streamed counting pass)
+class_counts = count_classes(labels_file, num_classes=6)
+unique_classes = np.flatnonzero(class_counts)
 print("\n   Class distribution:")
-for cls, count in zip(unique_classes, class_counts):
-    print(f"     Class {cls}: {count:,} pixels ({100*count/valid_mask.sum():.2f}%)")
+for cls in unique_classes:
+    print(f"     Class {cls}: {class_counts[cls]:,} pixels ({100*class_counts[cls]/class_counts.sum():.2f}%)")
 
-# Sample pixel coordinates
+# Sample pixel coordinates (second streamed pass, exact per-class budgets, shuffled)
 print("\n4. Sampling pixel coordinates...")
-sampled_indices_y = []
-sampled_indices_x = []
-sampled_labels = []
-
+y_indices, x_indices, y = sample_balanced(labels_file, samples_per_class, seed=SEED, counts=class_counts)
 for cls in unique_classes:
-    class_mask = (labels_full == cls)
-    y_idx, x_idx = np.where(class_mask)
-    
-    n_available = len(y_idx)
-    n_target = samples_per_class[cls]
-    n_sample = min(n_target, n_available)
-    
-    if n_available > n_target:
-        sample_idx = np.random.choice(n_available, n_target, replace=False)
-    else:
-        sample_idx = np.arange(n_available)
-    
-    sampled_indices_y.append(y_idx[sample_idx])
-    sampled_indices_x.append(x_idx[sample_idx])
-    sampled_labels.append(np.full(n_sample, cls))
-    
-    print(f"   Class {cls}: sampled {n_sample:,} / {n_available:,}")
-
-# Combine and shuffle
-y_indices = np.concatenate(sampled_indices_y)
-x_indices = np.concatenate(sampled_indices_x)
-y = np.concatenate(sampled_labels)
-
-np.random.seed(42)
-shuffle_idx = np.random.permutation(len(y_indices))
-y_indices = y_indices[shuffle_idx]
-x_indices = x_indices[shuffle_idx]
-y = y[shuffle_idx]
+    print(f"   Class {cls}: sampled {(y == cls).sum():,} / {class_counts[cls]:,}")
 
 print(f"\n   Total samples: {len(y):,}")
 
@@ -91,63 +75,71 @@ print("\n5. Class weights for training:")
 for cls in range(6):
     print(f"   Class {cls}: {class_weights[cls]:.4f}")
 
-# OPTIMIZATION: Read tile-by-tile instead of row-by-row
-print("\n6. Extracting embeddings (TILE-BY-TILE - FAST!)...")
-print(f"   Will process {len(tile_files)} tiles once each\n")
-
 # Pre-allocate output
 n_samples = len(y_indices)
-X = np.zeros((n_samples, 64), dtype=np.float32)  # 64 bands
-found_samples = np.zeros(n_samples, dtype=bool)
-
-# Process each tile
-with tqdm(total=len(tile_files), desc="Processing tiles", unit=" tiles") as pbar:
-    for tile_file in tile_files:
-        # Open tile
-        with rasterio.open(tile_file) as tile_src:
-            # Get tile bounds in global coordinates
-            tile_bounds = tile_src.bounds
-            tile_transform = tile_src.transform
-            
-            # Read entire tile into memory (much faster than per-pixel)
-            tile_data = tile_src.read()  # Shape: (64, height, width)
-            
-            # Get tile position in global raster
-            tile_row_offset = int(round((tile_bounds.top - tile_src.bounds.top) / abs(tile_transform[4])))
-            tile_col_offset = int(round((tile_bounds.left - tile_src.bounds.left) / tile_transform[0]))
-            
-            # Actually, let's use the filename to determine position
-            # Filename format: bow_river_embeddings_2020_matched-RRRRRRRRRR-CCCCCCCCCC.tif
-            parts = tile_file.stem.split('-')
-            if len(parts) == 3:
-                tile_row_offset = int(parts[1])
-                tile_col_offset = int(parts[2])
-            else:
-                # Fallback to transform if filename parsing fails
-                tile_row_offset = 0
-                tile_col_offset = 0
-            
-            # Find which samples fall within this tile
-            tile_height, tile_width = tile_src.height, tile_src.width
-            
-            # Check which sample coordinates are in this tile's bounds
-            in_tile_y = (y_indices >= tile_row_offset) & (y_indices < tile_row_offset + tile_height)
-            in_tile_x = (x_indices >= tile_col_offset) & (x_indices < tile_col_offset + tile_width)
-            in_tile_mask = in_tile_y & in_tile_x
-            
-            if in_tile_mask.any():
-                # Get local coordinates within this tile
-                local_y = y_indices[in_tile_mask] - tile_row_offset
-                local_x = x_indices[in_tile_mask] - tile_col_offset
-                
-                # Extract embeddings for these samples
-                for i, (ly, lx) in enumerate(zip(local_y, local_x)):
-                    global_idx = np.where(in_tile_mask)[0][i]
-                    X[global_idx, :] = tile_data[:, ly, lx]
-                    found_samples[global_idx] = True
-        
-        pbar.update(1)
-        pbar.set_postfix({"found": f"{found_samples.sum():,}/{n_samples:,}"})
+
+if store is not None:
+    print("\n6. Extracting embeddings from pixel store...")
+    X = store.sample(y_indices, x_indices)
+    found_samples = ~np.isnan(X).all(axis=1)
+    X[~found_samples] = 0
+else:
+    # Read tile-by-tile instead of row-by-row; within a tile only the blocks
+    # holding samples are read, and blocks the catalog marks as empty not at all
+    print("\n6. Extracting embeddings (TILE-BY-TILE - FAST!)...")
+    print(f"   Will process {len(tile_files)} tiles once each\n")
+
+    X = np.zeros((n_samples, 64), dtype=np.float32)  # 64 bands
+    found_samples = np.zeros(n_samples, dtype=bool)
+    skipped_empty_blocks = 0
+
+    # Process each tile
+    with tqdm(total=len(tile_files), desc="Processing tiles", unit=" tiles") as pbar:
+        for tile_file in tile_files:
+            if catalog is not None and catalog.is_empty(tile_file):
+                pbar.update(1)
+                continue
+
+            with rasterio.open(tile_file) as tile_src:
+                # Tile position in the global raster, from the filename
+                # (bow_river_embeddings_2020_matched-RRRRRRRRRR-CCCCCCCCCC.tif)
+                tile_row_offset, tile_col_offset = parse_tile_offset(tile_file)
+                if tile_row_offset is None:
+                    tile_row_offset = tile_col_offset = 0
+                tile_height, tile_width = tile_src.height, tile_src.width
+
+                # Samples inside this tile, in tile-local coordinates
+                sample_idx = np.flatnonzero(
+                    (y_indices >= tile_row_offset) & (y_indices < tile_row_offset + tile_height)
+                    & (x_indices >= tile_col_offset) & (x_indices < tile_col_offset + tile_width))
+                local_y = y_indices[sample_idx] - tile_row_offset
+                local_x = x_indices[sample_idx] - tile_col_offset
+
+                # Drop samples in blocks without valid pixels (left unfound, like all-NaN store pixels)
+                mask = catalog.block_mask(tile_file) if catalog is not None else None
+                bs = mask[0] if mask is not None else DEFAULT_BLOCK_SIZE
+                if mask is not None and len(sample_idx):
+                    keep = mask[1][local_y // bs, local_x // bs]
+                    skipped_empty_blocks += int((~keep).sum())
+                    sample_idx, local_y, local_x = sample_idx[keep], local_y[keep], local_x[keep]
+
+                # One windowed read per block that holds samples
+                block_id = (local_y // bs) * (-(-tile_width // bs)) + local_x // bs
+                order = np.argsort(block_id, kind="stable")
+                bounds = np.flatnonzero(np.diff(block_id[order])) + 1
+                for group in np.split(order, bounds) if len(order) else []:
+                    r0 = int(local_y[group[0]] // bs) * bs
+                    c0 = int(local_x[group[0]] // bs) * bs
+                    window = Window(c0, r0, min(bs, tile_width - c0), min(bs, tile_height - r0))
+                    block = tile_src.read(window=window)  # Shape: (64, h, w)
+                    X[sample_idx[group]] = block[:, local_y[group] - r0, local_x[group] - c0].T
+                    found_samples[sample_idx[group]] = True
+
+            pbar.update(1)
+            pbar.set_postfix({"found": f"{found_samples.sum():,}/{n_samples:,}"})
+
+    if skipped_empty_blocks:
+        print(f"   {skipped_empty_blocks:,} samples fell in blocks the catalog marks as empty")
 
 print(f"\n✓ Extracted {found_samples.sum():,} / {n_samples:,} samples")
 
@@ -0,0 +1,142 @@
+"""
+Accuracy impact of a quantized pixel store
+===========================================
+Runs the existing RF / SVM models on a test split three times -- on the float32
+embeddings and on their float16 and int8 round trips (exactly what a
+build_pixel_store.py --dtype float16/int8 store hands back to readers) -- and
+reports how far accuracy / F1 move and how many predictions change.
+
+The int8 scale/offset comes from an int8 store's store.json when --store is
+given, otherwise from the per-band range of X_train (falling back to X_test).
+
+Usage:
+    python quantization_report.py <dataset.npz> --model rf=../random_forest_all/random_forest_spatial/rf_model.pkl
+    python quantization_report.py <dataset.npz> --store <int8_store_dir> \\
+        --model svm=best_svm.pkl:svm_rbf_bg_scaler.pkl \\
+        --cascade svm_rbf=stage1.pkl:stage2.pkl:svm_rbf_bg_scaler.pkl
+
+    --model   LABEL=MODEL[:SCALER]           single model (optional scaler)
+    --cascade LABEL=STAGE1:STAGE2[:SCALER]   two-stage background / wetland pipeline
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import joblib
+import numpy as np
+from sklearn.metrics import accuracy_score, precision_recall_fscore_support
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from inference import CascadeModel, ChunkedPredictor, PixelStore
+from inference.pixel_store import decode, encode, int8_params
+
+LABELS = [0, 1, 2, 3, 4, 5]
+
+
+def parse_model_spec(spec: str, cascade: bool):
+    label, _, paths = spec.partition('=')
+    parts = paths.split(':')
+    n_models = 2 if cascade else 1
+    if not label or len(parts) not in (n_models, n_models + 1):
+        kind = 'LABEL=STAGE1:STAGE2[:SCALER]' if cascade else 'LABEL=MODEL[:SCALER]'
+        raise SystemExit(f"Bad spec {spec!r}, expected {kind}")
+    models = [joblib.load(p) for p in parts[:n_models]]
+    model = CascadeModel(*models) if cascade else models[0]
+    scaler = joblib.load(parts[n_models]) if len(parts) > n_models else None
+    return label, ChunkedPredictor(model, scaler=scaler)
+
+
+def score(y_true, y_pred) -> dict:
+    _, _, f1, _ = precision_recall_fscore_support(y_true, y_pred, labels=LABELS, average=None, zero_division=0)
+    _, _, f1_w, _ = precision_recall_fscore_support(y_true, y_pred, labels=LABELS, average='weighted',
+                                                    zero_division=0)
+    return {
+        'accuracy': float(accuracy_score(y_true, y_pred)),
+        'weighted_f1': float(f1_w),
+        'mean_wetland_f1': float(np.mean(f1[1:])),
+        'per_class_f1': [float(v) for v in f1],
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure accuracy impact of float16 / int8 embedding stores')
+    parser.add_argument('dataset', help='npz with X_test / y_test (and optionally X_train)')
+    parser.add_argument('--store', '-s', default=None, help='int8 pixel store to take scale/offset from')
+    parser.add_argument('--model', '-m', action='append', default=[], help='LABEL=MODEL[:SCALER]')
+    parser.add_argument('--cascade', '-c', action='append', default=[], help='LABEL=STAGE1:STAGE2[:SCALER]')
+    parser.add_argument('--output', '-o', default='quantization_report.json')
+    args = parser.parse_args()
+
+    if not args.model and not args.cascade:
+        parser.error('give at least one --model or --cascade')
+
+    print("=" * 60)
+    print("QUANTIZATION ACCURACY REPORT")
+    print("=" * 60)
+
+    data = np.load(args.dataset)
+    X_test = data['X_test'].astype(np.float32)
+    y_test = data['y_test']
+    X_range = data['X_train'] if 'X_train' in data.files else X_test
+
+    if args.store:
+        store = PixelStore(args.store)
+        if store.encoding != 'int8':
+            raise SystemExit(f"{args.store} is a {store.encoding} store; int8 scale/offset needed")
+        scale, offset = store.scale, store.offset
+        range_source = f"store {args.store}"
+    else:
+        scale, offset = int8_params(np.nanmin(X_range, axis=0), np.nanmax(X_range, axis=0))
+        range_source = 'X_train' if 'X_train' in data.files else 'X_test'
+    data.close()
+    print(f"\n1. Test samples: {X_test.shape[0]:,}  (int8 range from {range_source})")
+
+    variants = {'float32': X_test}
+    errors = {}
+    for encoding in ('float16', 'int8'):
+        X_q = decode(encode(X_test, encoding, scale, offset), encoding, scale, offset)
+        variants[encoding] = X_q
+        diff = np.abs(X_q - X_test)
+        errors[encoding] = {
+            'bytes_per_pixel': int(np.dtype(encoding).itemsize * X_test.shape[1]),
+            'max_abs_error': float(np.nanmax(diff)),
+            'mean_abs_error': float(np.nanmean(diff)),
+        }
+        print(f"   {encoding:8s} {errors[encoding]['bytes_per_pixel']:3d} B/px  "
+              f"mean |err| {errors[encoding]['mean_abs_error']:.2e}  max |err| {errors[encoding]['max_abs_error']:.2e}")
+
+    specs = [(s, False) for s in args.model] + [(s, True) for s in args.cascade]
+    results = {}
+    print("\n2. Evaluating models...")
+    for spec, cascade in specs:
+        label, predictor = parse_model_spec(spec, cascade)
+        t0 = time.time()
+        preds = {enc: predictor.predict_pixels(X) for enc, X in variants.items()}
+        ref = score(y_test, preds['float32'])
+        results[label] = {'float32': ref}
+        print(f"\n   {label}  (float32: acc {ref['accuracy']:.4f}, weighted F1 {ref['weighted_f1']:.4f})")
+        for encoding in ('float16', 'int8'):
+            s = score(y_test, preds[encoding])
+            s['agreement_with_float32'] = float(np.mean(preds[encoding] == preds['float32']))
+            s['delta_accuracy'] = s['accuracy'] - ref['accuracy']
+            s['delta_weighted_f1'] = s['weighted_f1'] - ref['weighted_f1']
+            s['delta_mean_wetland_f1'] = s['mean_wetland_f1'] - ref['mean_wetland_f1']
+            results[label][encoding] = s
+            print(f"     {encoding:8s} Δacc {s['delta_accuracy']:+.4f}  ΔF1 {s['delta_weighted_f1']:+.4f}  "
+                  f"Δwetland F1 {s['delta_mean_wetland_f1']:+.4f}  "
+                  f"agreement {100 * s['agreement_with_float32']:.3f}%")
+        print(f"     ({time.time() - t0:.1f}s)")
+
+    report = {
+        'dataset': str(args.dataset),
+        'n_test': int(X_test.shape[0]),
+        'int8_range_source': range_source,
+        'encodings': errors,
+        'models': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✓ Report saved to {args.output}")
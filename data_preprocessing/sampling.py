@@ -0,0 +1,337 @@
+"""
+Class-balanced pixel sampling that streams the labels raster.
+
+    rows, cols, labels = sample_balanced(labels_file, {0: 600_000, 1: 19_225, ...}, seed=42)
+
+The labels raster is never loaded whole and no per-class np.where index
+arrays are built. Two passes over full-width strips of rows:
+
+  1. count every class (inside an optional zone mask)
+  2. walk the strips again; for each strip and class draw how many of the
+     remaining picks fall in it from a hypergeometric distribution, then pick
+     that many of the strip's matching pixels uniformly
+
+which is an exact uniform sample without replacement per class. Memory is
+O(samples + one strip), and the result depends only on the seed and
+rows_per_strip.
+
+make_split() builds the random / column / middle-band train-test splits the
+RF and SVM scripts use on top of this, save_index() stores the result as a
+compact (row, col, class, split) index, and build_dataset() rebuilds the
+training arrays from the tiles in parallel (see build_dataset.py).
+"""
+
+from __future__ import annotations
+
+import json
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+
+LABEL_NODATA = 255
+ROWS_PER_STRIP = 256
+
+
+def iter_label_strips(labels_path, rows_per_strip: int = ROWS_PER_STRIP):
+    """Yield (row_off, strip) full-width strips of band 1."""
+    with rasterio.open(labels_path) as src:
+        for row in range(0, src.height, rows_per_strip):
+            h = min(rows_per_strip, src.height - row)
+            yield row, src.read(1, window=Window(0, row, src.width, h))
+
+
+def _eligible(strip: np.ndarray, row_off: int, zone) -> np.ndarray | None:
+    """Zone mask for a strip (None = every pixel)."""
+    return None if zone is None else zone(row_off, strip.shape)
+
+
+def count_classes(labels_path, num_classes: int = 6, zone=None,
+                  rows_per_strip: int = ROWS_PER_STRIP) -> np.ndarray:
+    """
+    Pixel count per class, streamed. `zone(row_off, (h, w)) -> bool mask`
+    restricts counting to part of the raster.
+    """
+    counts = np.zeros(num_classes, dtype=np.int64)
+    for row_off, strip in iter_label_strips(labels_path, rows_per_strip):
+        mask = _eligible(strip, row_off, zone)
+        values = strip.ravel() if mask is None else strip[mask]
+        counts += np.bincount(values[values < num_classes], minlength=num_classes)[:num_classes]
+    return counts
+
+
+def sample_balanced(labels_path, samples_per_class: dict, seed=42, zone=None, counts: np.ndarray | None = None,
+                    rows_per_strip: int = ROWS_PER_STRIP, shuffle: bool = True):
+    """
+    Draw min(target, available) pixels of every class in `samples_per_class`.
+
+    seed: int or np.random.Generator.
+    zone: optional callable (row_off, (h, w)) -> bool mask of eligible pixels.
+    counts: per-class counts from count_classes() with the same zone, to skip
+        the counting pass.
+
+    Returns (rows, cols, labels) as int64 / int64 / uint8 arrays, shuffled
+    unless shuffle=False (then in raster order).
+    """
+    rng = seed if isinstance(seed, np.random.Generator) else np.random.default_rng(seed)
+    classes = sorted(samples_per_class)
+    if counts is None:
+        counts = count_classes(labels_path, max(classes) + 1, zone, rows_per_strip)
+
+    remaining = {cls: int(counts[cls]) for cls in classes}
+    needed = {cls: min(int(samples_per_class[cls]), remaining[cls]) for cls in classes}
+    picked_rows, picked_cols, picked_labels = [], [], []
+
+    for row_off, strip in iter_label_strips(labels_path, rows_per_strip):
+        if not any(needed.values()):
+            break
+        width = strip.shape[1]
+        flat = strip.ravel()
+        mask = _eligible(strip, row_off, zone)
+        if mask is not None:
+            mask = mask.ravel()
+        for cls in classes:
+            if not remaining[cls]:
+                continue
+            hit = flat == cls
+            if mask is not None:
+                hit &= mask
+            pos = np.flatnonzero(hit)
+            if pos.size == 0:
+                continue
+            k = 0
+            if needed[cls]:
+                # Number of the remaining picks that land in this strip
+                k = int(rng.hypergeometric(pos.size, remaining[cls] - pos.size, needed[cls])) \
+                    if remaining[cls] > pos.size else needed[cls]
+            remaining[cls] -= pos.size
+            if k == 0:
+                continue
+            chosen = np.sort(pos[rng.choice(pos.size, k, replace=False)])
+            picked_rows.append(row_off + chosen // width)
+            picked_cols.append(chosen % width)
+            picked_labels.append(np.full(k, cls, dtype=np.uint8))
+            needed[cls] -= k
+
+    if not picked_rows:
+        return np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0, np.uint8)
+    rows = np.concatenate(picked_rows).astype(np.int64)
+    cols = np.concatenate(picked_cols).astype(np.int64)
+    labels = np.concatenate(picked_labels)
+    if shuffle:
+        order = rng.permutation(labels.size)
+        rows, cols, labels = rows[order], cols[order], labels[order]
+    return rows, cols, labels
+
+
+# ──────────────────────────────────────────────
+# TRAIN / TEST SPLITS
+# ──────────────────────────────────────────────
+#
+# Every split is a pure function of (labels raster, budgets, split parameters,
+# seed), so a dataset is fully described by a small index of
+# (row, col, class, split) and can be rebuilt from the tiles at any time.
+
+SPLIT_TRAIN = 0
+SPLIT_TEST = 1
+SPLIT_KINDS = ('random', 'column', 'middle')
+
+
+def column_zone(test_col_max: int, test: bool):
+    """Column split: test = cols < test_col_max (western tiles), train = the rest."""
+    def zone(row_off, shape):
+        cols = np.arange(shape[1])[None, :] < test_col_max
+        return np.broadcast_to(cols if test else ~cols, shape)
+    return zone
+
+
+def row_band_zone(test_row_min: int, test_row_max: int, test: bool):
+    """Middle-band split: test = rows [test_row_min, test_row_max), train = north + south."""
+    def zone(row_off, shape):
+        rows = np.arange(row_off, row_off + shape[0])[:, None]
+        band = (rows >= test_row_min) & (rows < test_row_max)
+        return np.broadcast_to(band if test else ~band, shape)
+    return zone
+
+
+def _random_split(labels, test_samples: dict):
+    """Per class, the first test_samples[cls] of the (already shuffled) samples go to test."""
+    split = np.full(labels.size, SPLIT_TRAIN, dtype=np.uint8)
+    for cls, n_test in test_samples.items():
+        idx = np.flatnonzero(labels == cls)
+        split[idx[:n_test]] = SPLIT_TEST
+    return split
+
+
+def make_split(labels_path, kind: str, train_samples: dict, test_samples: dict, seed: int = 42,
+               test_col_max: int | None = None, test_row_min: int | None = None,
+               test_row_max: int | None = None, random_classes=(), rows_per_strip: int = ROWS_PER_STRIP) -> dict:
+    """
+    Sample a train/test split of the labels raster.
+
+    kind='random'  classes sampled over the whole raster, then split at random
+    kind='column'  test = cols < test_col_max (model_rf_spatial.py)
+    kind='middle'  test = rows [test_row_min, test_row_max) (model_rf_middle.py, SVM)
+
+    random_classes: classes that are sampled over the whole raster and split
+    at random even for spatial splits (e.g. 1 and 2 in the column split,
+    which only occur in the west).
+
+    Returns an index dict: rows, cols, labels, split arrays and a meta dict
+    with everything needed to reproduce it.
+    """
+    if kind not in SPLIT_KINDS:
+        raise ValueError(f"kind must be one of {SPLIT_KINDS}, got {kind!r}")
+    if kind == 'column' and test_col_max is None:
+        raise ValueError("column split needs test_col_max")
+    if kind == 'middle' and (test_row_min is None or test_row_max is None):
+        raise ValueError("middle split needs test_row_min and test_row_max")
+
+    # Independent, reproducible streams for each sampling step
+    rng_random, rng_train, rng_test = (np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(3))
+    random_classes = set(train_samples) if kind == 'random' else set(random_classes)
+    parts = []
+
+    if random_classes:
+        budgets = {c: train_samples.get(c, 0) + test_samples.get(c, 0) for c in sorted(random_classes)}
+        r, c, l = sample_balanced(labels_path, budgets, rng_random, rows_per_strip=rows_per_strip)
+        s = _random_split(l, {cls: test_samples.get(cls, 0) for cls in budgets})
+        parts.append((r, c, l, s))
+
+    if kind != 'random':
+        if kind == 'column':
+            train_zone, test_zone = column_zone(test_col_max, False), column_zone(test_col_max, True)
+        else:
+            train_zone = row_band_zone(test_row_min, test_row_max, False)
+            test_zone = row_band_zone(test_row_min, test_row_max, True)
+        for budgets, zone, rng, split_id in ((train_samples, train_zone, rng_train, SPLIT_TRAIN),
+                                             (test_samples, test_zone, rng_test, SPLIT_TEST)):
+            budgets = {c: n for c, n in budgets.items() if c not in random_classes}
+            if budgets:
+                r, c, l = sample_balanced(labels_path, budgets, rng, zone=zone, rows_per_strip=rows_per_strip)
+                parts.append((r, c, l, np.full(l.size, split_id, dtype=np.uint8)))
+
+    rows, cols, labels, split = (np.concatenate(a) for a in zip(*parts))
+    meta = {
+        'labels_file': str(labels_path),
+        'kind': kind,
+        'seed': int(seed),
+        'rows_per_strip': rows_per_strip,
+        'train_samples': {str(k): int(v) for k, v in train_samples.items()},
+        'test_samples': {str(k): int(v) for k, v in test_samples.items()},
+        'random_classes': sorted(int(c) for c in random_classes),
+        'test_col_max': test_col_max,
+        'test_row_min': test_row_min,
+        'test_row_max': test_row_max,
+    }
+    return {'rows': rows, 'cols': cols, 'labels': labels, 'split': split, 'meta': meta}
+
+
+def save_index(path, index: dict):
+    """Write a split index: int32 rows/cols, uint8 class/split, JSON meta."""
+    np.savez_compressed(
+        path,
+        rows=index['rows'].astype(np.int32),
+        cols=index['cols'].astype(np.int32),
+        labels=index['labels'].astype(np.uint8),
+        split=index['split'].astype(np.uint8),
+        meta=np.array(json.dumps(index['meta'])),
+    )
+
+
+def load_index(path) -> dict:
+    with np.load(path) as data:
+        index = {k: data[k] for k in ('rows', 'cols', 'labels', 'split')}
+        index['meta'] = json.loads(str(data['meta']))
+    return index
+
+
+# ──────────────────────────────────────────────
+# DATASET REBUILD
+# ──────────────────────────────────────────────
+
+def _extract_from_tile(args):
+    """Embeddings at tile-local (rows, cols), read a strip of rows at a time."""
+    tile_path, local_rows, local_cols = args
+    with rasterio.open(tile_path) as src:
+        X = np.full((local_rows.size, src.count), np.nan, dtype=np.float32)
+        strip_id = local_rows // ROWS_PER_STRIP
+        for strip in np.unique(strip_id):
+            sel = np.flatnonzero(strip_id == strip)
+            r0, r1 = local_rows[sel].min(), local_rows[sel].max() + 1
+            c0, c1 = local_cols[sel].min(), local_cols[sel].max() + 1
+            block = src.read(window=Window(c0, r0, c1 - c0, r1 - r0), out_dtype=np.float32)
+            X[sel] = block[:, local_rows[sel] - r0, local_cols[sel] - c0].T
+    return X
+
+
+def extract_embeddings(embeddings_dir, rows: np.ndarray, cols: np.ndarray, n_workers: int | None = None,
+                       verbose: bool = True) -> np.ndarray:
+    """
+    (n, bands) float32 embeddings at raster (rows, cols), NaN where no tile
+    covers a pixel. Pixel stores are gathered directly; GeoTIFF tiles are
+    read in parallel, one process per tile, only the rows holding samples.
+    """
+    from inference import PixelStore, find_embedding_tiles, is_pixel_store, tile_index
+
+    if is_pixel_store(embeddings_dir):
+        return PixelStore(embeddings_dir).sample(rows, cols)
+
+    jobs, owners = [], []
+    for tile in tile_index(find_embedding_tiles(embeddings_dir)):
+        with rasterio.open(tile.path) as src:
+            h, w, n_bands = src.height, src.width, src.count
+        in_tile = np.flatnonzero((rows >= tile.row_off) & (rows < tile.row_off + h) &
+                                 (cols >= tile.col_off) & (cols < tile.col_off + w))
+        if in_tile.size:
+            jobs.append((tile.path, rows[in_tile] - tile.row_off, cols[in_tile] - tile.col_off))
+            owners.append(in_tile)
+    if not jobs:
+        raise ValueError(f"No tiles in {embeddings_dir} cover the sampled pixels")
+
+    X = np.full((rows.size, n_bands), np.nan, dtype=np.float32)
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        for (tile_path, _, _), in_tile, values in zip(jobs, owners, pool.map(_extract_from_tile, jobs)):
+            X[in_tile] = values
+            if verbose:
+                print(f"   ✓ {Path(tile_path).name}: {in_tile.size:,} samples")
+    return X
+
+
+def class_weights_for(y: np.ndarray, num_classes: int = 6) -> np.ndarray:
+    """Inverse-frequency weights normalised to sum to num_classes (as in the dataset notebooks)."""
+    counts = np.bincount(y, minlength=num_classes)[:num_classes].astype(np.float64)
+    weights = np.divide(1.0, counts, out=np.zeros(num_classes), where=counts > 0)
+    return (weights / weights.sum() * num_classes).astype(np.float32)
+
+
+def build_dataset(index: dict, embeddings_dir, n_workers: int | None = None, verbose: bool = True) -> dict:
+    """
+    Rebuild the arrays of a split index from the tiles. Samples whose
+    embedding has any NaN band are dropped (as in the dataset notebooks).
+    Returns the npz contents expected by the RF / SVM scripts.
+    """
+    X = extract_embeddings(embeddings_dir, index['rows'], index['cols'], n_workers, verbose)
+    found = ~np.isnan(X).any(axis=1)
+    train = found & (index['split'] == SPLIT_TRAIN)
+    test = found & (index['split'] == SPLIT_TEST)
+    meta = index['meta']
+
+    out = {
+        'X_train': X[train], 'y_train': index['labels'][train].astype(np.int64),
+        'X_test': X[test], 'y_test': index['labels'][test].astype(np.int64),
+        'class_weights': class_weights_for(index['labels'][train]),
+        'n_missing': np.array(int((~found).sum())),
+    }
+    if meta['kind'] == 'random':
+        out['X'] = X[found]
+        out['y'] = index['labels'][found].astype(np.int64)
+    if meta['test_col_max'] is not None:
+        out['test_col_max'] = np.array(meta['test_col_max'], dtype=np.int64)
+    if meta['test_row_min'] is not None:
+        out['test_row_min'] = np.array(meta['test_row_min'], dtype=np.int64)
+        out['test_row_max'] = np.array(meta['test_row_max'], dtype=np.int64)
+    return out
@@ -0,0 +1,215 @@
+"""
+Verify that the embedding VRT lines up with the labels raster
+==============================================================
+Beyond comparing dimensions / CRS / bounds, this streams both rasters block by
+block (one process per tile, one block in memory per process) and reports per
+tile:
+
+  - label / embedding NaN overlap: labelled pixels with no embedding, and
+    embedding pixels with no label
+  - the sub-pixel offset between the tile's own geotransform and the labels
+    grid
+
+and samples a grid of labels pixel centres across the basin to measure the
+geographic misregistration (metres from each labels pixel centre to the
+centre of the embedding pixel that covers it, through the VRT and through the
+tile's own transform).
+
+Tiles are taken from the VRT's DstRect placements (see build_vrt_and_verify.py).
+
+Usage:
+    python verify_alignment.py bow_river_embeddings_2020_matched.vrt bow_river_wetlands_10m_final.tif
+    python verify_alignment.py <vrt> <labels> --workers 8 --grid 200 --output alignment_report.json
+"""
+
+import argparse
+import json
+import sys
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+LABEL_NODATA = 255
+BLOCK_SIZE = 256
+
+
+def vrt_sources(vrt_file):
+    """(source path, x_off, y_off, width, height) for every tile in the VRT's first band."""
+    vrt_file = Path(vrt_file)
+    band = ET.parse(vrt_file).getroot().find('VRTRasterBand')
+    sources = []
+    for src in band:
+        if not src.tag.endswith('Source'):
+            continue
+        name = src.find('SourceFilename')
+        path = Path(name.text)
+        if name.get('relativeToVRT') == '1':
+            path = vrt_file.parent / path
+        dst = src.find('DstRect')
+        if dst is None:
+            with rasterio.open(path) as t:
+                rect = (0, 0, t.width, t.height)
+        else:
+            rect = tuple(int(round(float(dst.get(k)))) for k in ('xOff', 'yOff', 'xSize', 'ySize'))
+        sources.append((str(path), *rect))
+    return sources
+
+
+def grid_offset(transform, ref_transform):
+    """Offset of `transform`'s origin on the `ref_transform` pixel grid (col, row)."""
+    col, row = ~ref_transform * (transform.c, transform.f)
+    return col, row
+
+
+def misregistration_m(xs, ys, transform):
+    """Distance from each (x, y) to the centre of the `transform` pixel containing it."""
+    cols, rows = ~transform * (xs, ys)
+    cx, cy = transform * (np.floor(cols) + 0.5, np.floor(rows) + 0.5)
+    return np.hypot(cx - xs, cy - ys)
+
+
+def check_tile(args) -> dict:
+    """Stream one tile's footprint of the VRT and labels; NaN overlap and transform offset."""
+    vrt_file, labels_file, tile_path, x_off, y_off, width, height, lab_row, lab_col, sample_rc = args
+
+    with rasterio.open(labels_file) as lab, rasterio.open(vrt_file) as emb:
+        with rasterio.open(tile_path) as tile:
+            tile_transform = tile.transform
+        d_col, d_row = grid_offset(tile_transform, lab.transform)
+        sub_col, sub_row = d_col - lab_col, d_row - lab_row
+
+        n = n_labelled = n_emb_valid = lab_no_emb = emb_no_lab = 0
+        for row in range(0, height, BLOCK_SIZE):
+            bh = min(BLOCK_SIZE, height - row)
+            for col in range(0, width, BLOCK_SIZE):
+                bw = min(BLOCK_SIZE, width - col)
+                labels = lab.read(1, window=Window(lab_col + col, lab_row + row, bw, bh), boundless=True,
+                                  fill_value=LABEL_NODATA)
+                block = emb.read(window=Window(x_off + col, y_off + row, bw, bh), out_dtype=np.float32)
+                labelled = labels != LABEL_NODATA
+                emb_valid = ~np.isnan(block).any(axis=0)
+                n += labels.size
+                n_labelled += int(labelled.sum())
+                n_emb_valid += int(emb_valid.sum())
+                lab_no_emb += int((labelled & ~emb_valid).sum())
+                emb_no_lab += int((emb_valid & ~labelled).sum())
+
+        # Sample points inside this tile, through the tile's own transform
+        rows, cols = sample_rc
+        xs, ys = lab.transform * (cols + 0.5, rows + 0.5)
+        tile_err = misregistration_m(np.asarray(xs), np.asarray(ys), tile_transform) if len(rows) else np.zeros(0)
+
+    return {
+        'tile': Path(tile_path).name,
+        'row_off': lab_row,
+        'col_off': lab_col,
+        'height': height,
+        'width': width,
+        'n_pixels': n,
+        'n_labelled': n_labelled,
+        'n_embedding_valid': n_emb_valid,
+        'labelled_without_embedding': lab_no_emb,
+        'embedding_without_label': emb_no_lab,
+        'labelled_nan_rate': lab_no_emb / n_labelled if n_labelled else 0.0,
+        'subpixel_offset': [float(sub_row), float(sub_col)],
+        'n_grid_samples': int(len(rows)),
+        'max_misregistration_m': float(tile_err.max()) if tile_err.size else None,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Streamed alignment check of the embedding VRT vs labels')
+    parser.add_argument('vrt', help='Embedding VRT (build_vrt_and_verify.py)')
+    parser.add_argument('labels', help='Labels raster')
+    parser.add_argument('--workers', '-w', type=int, default=None, help='Parallel processes (default: all cores)')
+    parser.add_argument('--grid', '-g', type=int, default=100, help='Sample grid is grid x grid pixel centres')
+    parser.add_argument('--output', '-o', default='alignment_report.json')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("ALIGNMENT VERIFICATION")
+    print("=" * 60)
+
+    with rasterio.open(args.vrt) as emb, rasterio.open(args.labels) as lab:
+        print(f"\nEmbeddings: {emb.height} x {emb.width} x {emb.count}, {emb.crs}")
+        print(f"Labels:     {lab.height} x {lab.width}, {lab.crs}")
+        crs_match = emb.crs == lab.crs
+        res_match = np.allclose(emb.res, lab.res)
+        dims_match = (emb.height, emb.width) == (lab.height, lab.width)
+        vrt_col, vrt_row = grid_offset(emb.transform, lab.transform)
+        vrt_offset = (int(round(vrt_row)), int(round(vrt_col)))
+        vrt_subpixel = (vrt_row - vrt_offset[0], vrt_col - vrt_offset[1])
+
+        # Grid of labels pixel centres, and their misregistration through the VRT
+        rows = np.linspace(0, lab.height - 1, args.grid).round().astype(np.int64)
+        cols = np.linspace(0, lab.width - 1, args.grid).round().astype(np.int64)
+        grid_r, grid_c = (a.ravel() for a in np.meshgrid(rows, cols, indexing='ij'))
+        xs, ys = lab.transform * (grid_c + 0.5, grid_r + 0.5)
+        vrt_err = misregistration_m(np.asarray(xs), np.asarray(ys), emb.transform)
+
+    print(f"\n{'✓' if crs_match else '❌'} CRS")
+    print(f"{'✓' if res_match else '❌'} Resolution")
+    print(f"{'✓' if dims_match else '⚠'} Dimensions")
+    print(f"   VRT origin on labels grid: row {vrt_row:+.4f}, col {vrt_col:+.4f} px")
+    print(f"   Grid misregistration through VRT ({grid_r.size:,} points): "
+          f"mean {vrt_err.mean():.3f} m, max {vrt_err.max():.3f} m")
+    if not (crs_match and res_match):
+        print("\n❌ CRS / resolution differ - reproject before checking pixels")
+        sys.exit(1)
+
+    sources = vrt_sources(args.vrt)
+    print(f"\nStreaming {len(sources)} tiles...")
+    jobs = []
+    for path, x_off, y_off, width, height in sources:
+        r0, c0 = y_off + vrt_offset[0], x_off + vrt_offset[1]
+        inside = (grid_r >= r0) & (grid_r < r0 + height) & (grid_c >= c0) & (grid_c < c0 + width)
+        jobs.append((args.vrt, args.labels, path, x_off, y_off, width, height, r0, c0,
+                     (grid_r[inside], grid_c[inside])))
+
+    t0 = time.time()
+    tiles = []
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for result in pool.map(check_tile, jobs):
+            tiles.append(result)
+            sub = result['subpixel_offset']
+            flag = '✓' if max(abs(v) for v in sub) < 0.01 and result['labelled_nan_rate'] < 0.01 else '⚠'
+            print(f"  {flag} {result['tile']} | labelled-but-NaN {100 * result['labelled_nan_rate']:6.2f}% | "
+                  f"NaN-free-but-unlabelled {result['embedding_without_label']:>10,} | "
+                  f"offset ({sub[0]:+.3f}, {sub[1]:+.3f}) px")
+
+    n_labelled = sum(t['n_labelled'] for t in tiles)
+    lab_no_emb = sum(t['labelled_without_embedding'] for t in tiles)
+    max_sub = max((max(abs(v) for v in t['subpixel_offset']) for t in tiles), default=0.0)
+    tile_errs = [t['max_misregistration_m'] for t in tiles if t['max_misregistration_m'] is not None]
+
+    print(f"\n{'='*60}")
+    print("SUMMARY")
+    print(f"{'='*60}")
+    print(f"  Tiles checked:              {len(tiles)} ({time.time() - t0:.1f}s)")
+    print(f"  Labelled pixels w/o embed.: {lab_no_emb:,} / {n_labelled:,} "
+          f"({100 * lab_no_emb / max(n_labelled, 1):.3f}%)")
+    print(f"  Max tile sub-pixel offset:  {max_sub:.4f} px")
+    print(f"  Max tile misregistration:   {max(tile_errs, default=0.0):.3f} m")
+
+    report = {
+        'vrt': args.vrt,
+        'labels': args.labels,
+        'crs_match': bool(crs_match),
+        'resolution_match': bool(res_match),
+        'dimensions_match': bool(dims_match),
+        'vrt_offset_px': [float(vrt_row), float(vrt_col)],
+        'vrt_subpixel_offset_px': [float(v) for v in vrt_subpixel],
+        'grid_points': int(grid_r.size),
+        'vrt_misregistration_m': {'mean': float(vrt_err.mean()), 'max': float(vrt_err.max())},
+        'labelled_without_embedding': lab_no_emb,
+        'n_labelled': n_labelled,
+        'tiles': tiles,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✓ Report saved to {args.output}")
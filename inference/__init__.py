@@ -0,0 +1,51 @@
+"""
+Shared inference utilities for the embedding-tile classifiers.
+
+Map generation, the test-region visualizers and the two-stage pipeline all
+predict through this package, so optimizations here apply everywhere.
+"""
+
+from inference.catalog import TileCatalog
+from inference.metrics import NODATA, ConfusionAccumulator, DecimatedCanvas
+from inference.mosaic import TileMosaic, open_embeddings
+from inference.predict import (
+    N_BANDS,
+    CascadeModel,
+    ChunkedPredictor,
+    TileSkipped,
+    iter_region_predictions,
+    predict_region,
+    predict_tile,
+)
+from inference.pixel_store import PixelStore, build_pixel_store, is_pixel_store, load_store
+from inference.regions import Placement, Region
+from inference.tiles import (
+    TileInfo, find_embedding_tiles, parse_tile_offset, tile_band_count, tile_index,
+)
+
+__all__ = [
+    'NODATA',
+    'N_BANDS',
+    'CascadeModel',
+    'ChunkedPredictor',
+    'ConfusionAccumulator',
+    'DecimatedCanvas',
+    'PixelStore',
+    'Placement',
+    'Region',
+    'TileCatalog',
+    'TileInfo',
+    'TileMosaic',
+    'TileSkipped',
+    'build_pixel_store',
+    'find_embedding_tiles',
+    'is_pixel_store',
+    'iter_region_predictions',
+    'load_store',
+    'open_embeddings',
+    'parse_tile_offset',
+    'predict_region',
+    'predict_tile',
+    'tile_band_count',
+    'tile_index',
+]
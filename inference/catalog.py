@@ -0,0 +1,254 @@
+"""
+Persistent per-tile catalog of embedding tiles.
+
+    catalog = TileCatalog(catalog_path)
+    catalog.scan(tile_paths, n_workers=8)     # only new / changed tiles are opened
+    catalog.save()
+
+Every entry holds the tile's raster metadata (enough to place it in a VRT
+without reopening it) and, after a full scan, validity statistics computed over every pixel of every band: valid-pixel count (a
+pixel is valid when no band is NaN), per-band NaN counts, min/max/mean, and a
+coverage bitmap with one bit per block_size x block_size block. Inference and
+dataset building use it to skip empty tiles and empty blocks without opening
+them.
+
+Entries are keyed by file stem, so a catalog built from the GeoTIFF tiles
+also answers for the same tiles in a pixel store. Queries only trust an
+entry while the GeoTIFF it was scanned from keeps its size and mtime; a
+re-exported tile counts as unscanned until the next scan.
+"""
+
+from __future__ import annotations
+
+import json
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from inference.tiles import parse_tile_offset
+
+
+CATALOG_NAME = 'tile_catalog.json'
+CATALOG_VERSION = 1
+DEFAULT_BLOCK_SIZE = 256
+
+
+def tile_key(tile) -> str:
+    """Catalog key for a tile path or TileInfo."""
+    return Path(getattr(tile, 'path', tile)).stem
+
+
+def scan_tile(tile_path, block_size: int = DEFAULT_BLOCK_SIZE, stats: bool = True) -> dict:
+    """
+    Catalog entry for one GeoTIFF tile. With stats=False only the header is
+    read; otherwise every block is streamed for the validity statistics.
+    """
+    import rasterio
+    from rasterio.windows import Window
+
+    tile_path = Path(tile_path)
+    stat = tile_path.stat()
+    row_off, col_off = parse_tile_offset(tile_path)
+
+    with rasterio.open(tile_path) as src:
+        h, w, n_bands = src.height, src.width, src.count
+        entry = {
+            'file': tile_path.name,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'row_off': row_off,
+            'col_off': col_off,
+            'height': h,
+            'width': w,
+            'count': n_bands,
+            'dtype': src.dtypes[0],
+            'block_shape': list(src.block_shapes[0]),
+            'nodata': src.nodata,
+            'crs': src.crs.to_wkt() if src.crs else None,
+            'transform': list(src.transform)[:6],
+        }
+        if not stats:
+            return entry
+
+        n_valid = 0
+        nan_counts = np.zeros(n_bands, dtype=np.int64)
+        band_min = np.full(n_bands, np.inf)
+        band_max = np.full(n_bands, -np.inf)
+        band_sum = np.zeros(n_bands, dtype=np.float64)
+        bitmap = []
+        for row in range(0, h, block_size):
+            bh = min(block_size, h - row)
+            bits = []
+            for col in range(0, w, block_size):
+                bw = min(block_size, w - col)
+                block = src.read(window=Window(col, row, bw, bh), out_dtype=np.float32)
+                flat = block.reshape(n_bands, -1)
+                nan = np.isnan(flat)
+                band_nan = nan.sum(axis=1)
+                nan_counts += band_nan
+                block_valid = int((~nan.any(axis=0)).sum())
+                n_valid += block_valid
+                bits.append('1' if block_valid else '0')
+                has_data = band_nan < flat.shape[1]
+                if has_data.any():
+                    band_min[has_data] = np.fmin(band_min[has_data], np.nanmin(flat[has_data], axis=1))
+                    band_max[has_data] = np.fmax(band_max[has_data], np.nanmax(flat[has_data], axis=1))
+                    band_sum += np.nansum(flat, axis=1, dtype=np.float64)
+            bitmap.append(''.join(bits))
+
+    n_finite = h * w - nan_counts
+    with np.errstate(invalid='ignore', divide='ignore'):
+        band_mean = band_sum / n_finite
+
+    def _list(values):
+        return [float(v) if np.isfinite(v) else None for v in values]
+
+    entry['stats'] = {
+        'block_size': block_size,
+        'n_pixels': h * w,
+        'n_valid': n_valid,
+        'valid_fraction': n_valid / (h * w) if h * w else 0.0,
+        'band_nan_counts': nan_counts.tolist(),
+        'band_min': _list(band_min),
+        'band_max': _list(band_max),
+        'band_mean': _list(band_mean),
+        'bitmap': bitmap,
+    }
+    return entry
+
+
+def _scan_tile_args(args):
+    return scan_tile(*args)
+
+
+class TileCatalog:
+    """JSON-backed catalog of tile entries keyed by file stem."""
+
+    def __init__(self, path, entries: dict | None = None):
+        self.path = Path(path)
+        self.entries = {} if entries is None else entries
+        if entries is None and self.path.is_file():
+            with open(self.path) as f:
+                self.entries = json.load(f).get('tiles', {})
+
+    @classmethod
+    def for_tiles(cls, embeddings_dir) -> 'TileCatalog | None':
+        """The catalog saved next to a tile directory, if one exists."""
+        path = Path(embeddings_dir) / CATALOG_NAME
+        return cls(path) if path.is_file() else None
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, tile) -> bool:
+        return tile_key(tile) in self.entries
+
+    def get(self, tile) -> dict | None:
+        return self.entries.get(tile_key(tile))
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': CATALOG_VERSION, 'tiles': self.entries}, f)
+        tmp_path.replace(self.path)
+
+    def is_current(self, tile_path, block_size: int = DEFAULT_BLOCK_SIZE, stats: bool = True) -> bool:
+        """
+        True if the entry was read from this exact file (and, with stats=True,
+        fully scanned with this block size).
+        """
+        entry = self.get(tile_path)
+        if entry is None or 'block_shape' not in entry:
+            return False
+        if stats and ('stats' not in entry or entry['stats']['block_size'] != block_size):
+            return False
+        return self._matches_file(tile_path, entry)
+
+    def _matches_file(self, tile, entry: dict) -> bool:
+        """
+        True if the file the entry was read from still has its size and mtime.
+        For a copy of the tile under another name (a pixel store .npy), that
+        is the GeoTIFF next to the catalog.
+        """
+        path = Path(getattr(tile, 'path', tile))
+        if path.name != entry['file']:
+            path = self.path.parent / entry['file']
+        try:
+            stat = path.stat()
+        except OSError:
+            return False
+        return entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime
+
+    def _stats(self, tile) -> dict | None:
+        """The tile's statistics, or None if it has none or the file changed since the scan."""
+        entry = self.get(tile)
+        if entry is None or 'stats' not in entry or not self._matches_file(tile, entry):
+            return None
+        return entry['stats']
+
+    def scan(self, tile_paths, n_workers: int | None = None, block_size: int = DEFAULT_BLOCK_SIZE,
+             rescan: bool = False, stats: bool = True, on_entry=None) -> list[dict]:
+        """
+        Scan tiles that are new or changed since the last scan (all of them
+        with rescan=True) in a process pool. stats=False only reads headers,
+        keeping any statistics already catalogued for unchanged tiles.
+        Returns the new entries; on_entry(entry) is called as each tile finishes.
+        """
+        todo = [Path(p) for p in tile_paths if rescan or not self.is_current(p, block_size, stats)]
+        scanned = []
+        if not todo:
+            return scanned
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            for entry in pool.map(_scan_tile_args, [(p, block_size, stats) for p in todo]):
+                key = Path(entry['file']).stem
+                old = self.entries.get(key)
+                if (not stats and old and 'stats' in old
+                        and (old['size'], old['mtime']) == (entry['size'], entry['mtime'])):
+                    entry['stats'] = old['stats']
+                self.entries[key] = entry
+                scanned.append(entry)
+                if on_entry is not None:
+                    on_entry(entry)
+        return scanned
+
+    # ── queries ─────────────────────────────────
+
+    def is_empty(self, tile) -> bool:
+        """True only if a full scan of the current file found no valid pixel in the tile."""
+        stats = self._stats(tile)
+        return stats is not None and stats['n_valid'] == 0
+
+    def block_mask(self, tile) -> tuple[int, np.ndarray] | None:
+        """
+        (block_size, boolean (block rows, block cols) array of the blocks holding
+        valid pixels), or None if the tile has not been scanned or changed since.
+        """
+        stats = self._stats(tile)
+        if stats is None:
+            return None
+        return stats['block_size'], np.array([list(r) for r in stats['bitmap']]) == '1'
+
+    def data_extent(self, tile, rows: slice, cols: slice) -> tuple[slice, slice] | None:
+        """
+        Shrink a (rows, cols) window inside a tile to the blocks the coverage
+        bitmap marks as holding data. Returns None if the window holds none;
+        the window itself if the tile has not been scanned or changed since.
+        """
+        mask = self.block_mask(tile)
+        if mask is None:
+            return rows, cols
+        bs, bitmap = mask
+        b_r0, b_r1 = rows.start // bs, -(-rows.stop // bs)
+        b_c0, b_c1 = cols.start // bs, -(-cols.stop // bs)
+        sub = bitmap[b_r0:b_r1, b_c0:b_c1]
+        if not sub.any():
+            return None
+        data_rows = np.flatnonzero(sub.any(axis=1))
+        data_cols = np.flatnonzero(sub.any(axis=0))
+        r0 = max(rows.start, (b_r0 + data_rows[0]) * bs)
+        r1 = min(rows.stop, (b_r0 + data_rows[-1] + 1) * bs)
+        c0 = max(cols.start, (b_c0 + data_cols[0]) * bs)
+        c1 = min(cols.stop, (b_c0 + data_cols[-1] + 1) * bs)
+        return slice(int(r0), int(r1)), slice(int(c0), int(c1))
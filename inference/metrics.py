@@ -0,0 +1,128 @@
+"""
+Streaming evaluation helpers for tile-by-tile inference.
+
+Instead of assembling full (height, width) prediction and ground-truth arrays
+and looping over classes afterwards, callers update a ConfusionAccumulator
+once per tile. Overall accuracy, per-class recall / precision / F1 and the
+correct/wrong pixel counts for the error overlay are then read straight off
+the K x K matrix.
+
+For figures, DecimatedCanvas keeps a strided preview of a region so panels can
+be rendered without holding the full-resolution arrays in memory.
+"""
+
+from __future__ import annotations
+
+import math
+
+import numpy as np
+
+
+NODATA = 255
+
+
+class ConfusionAccumulator:
+    """
+    Running K x K confusion matrix (rows = ground truth, cols = predicted).
+
+    Pixels whose prediction equals `nodata` are ignored. Pixels with a valid
+    prediction but a ground-truth value outside [0, K) are counted as wrong
+    (in `n_unlabelled`), matching the old full-array accuracy computation.
+    """
+
+    def __init__(self, num_classes: int = 6, nodata: int = NODATA):
+        self.num_classes = num_classes
+        self.nodata = nodata
+        self.matrix = np.zeros((num_classes, num_classes), dtype=np.int64)
+        self.n_unlabelled = 0
+
+    def update(self, y_true: np.ndarray, y_pred: np.ndarray) -> None:
+        """Add one tile (any shape, matching) of ground truth / predictions."""
+        k = self.num_classes
+        y_true = np.asarray(y_true).ravel()
+        y_pred = np.asarray(y_pred).ravel()
+
+        valid = y_pred != self.nodata
+        labelled = valid & (y_true >= 0) & (y_true < k)
+        self.n_unlabelled += int(valid.sum() - labelled.sum())
+
+        idx = y_true[labelled].astype(np.int64) * k + y_pred[labelled].astype(np.int64)
+        self.matrix += np.bincount(idx, minlength=k * k).reshape(k, k)
+
+    @property
+    def n_valid(self) -> int:
+        return int(self.matrix.sum()) + self.n_unlabelled
+
+    @property
+    def n_correct(self) -> int:
+        return int(np.trace(self.matrix))
+
+    @property
+    def n_wrong(self) -> int:
+        return self.n_valid - self.n_correct
+
+    @property
+    def support(self) -> np.ndarray:
+        """Ground-truth pixel count per class."""
+        return self.matrix.sum(axis=1)
+
+    def accuracy(self) -> float:
+        n = self.n_valid
+        return self.n_correct / n if n else 0.0
+
+    def recall(self) -> np.ndarray:
+        """Per-class accuracy (recall). NaN for classes absent from the ground truth."""
+        support = self.support
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(support > 0, np.diag(self.matrix) / np.maximum(support, 1), np.nan)
+
+    def precision(self) -> np.ndarray:
+        """Per-class precision. NaN for classes never predicted."""
+        predicted = self.matrix.sum(axis=0)
+        return np.where(predicted > 0, np.diag(self.matrix) / np.maximum(predicted, 1), np.nan)
+
+    def f1(self) -> np.ndarray:
+        """Per-class F1, 2 TP / (2 TP + FP + FN). NaN for classes neither present nor predicted."""
+        denom = self.support + self.matrix.sum(axis=0)
+        return np.where(denom > 0, 2 * np.diag(self.matrix) / np.maximum(denom, 1), np.nan)
+
+    @classmethod
+    def from_matrix(cls, matrix: np.ndarray, nodata: int = NODATA) -> 'ConfusionAccumulator':
+        """Wrap an already accumulated K x K matrix."""
+        acc = cls(num_classes=len(matrix), nodata=nodata)
+        acc.matrix += np.asarray(matrix, dtype=np.int64)
+        return acc
+
+
+class DecimatedCanvas:
+    """
+    Strided preview of a (height, width) region: keeps every `step`-th row and
+    column. Blocks are pasted in at their region-relative offsets, so memory is
+    O(height * width / step**2) regardless of the region size.
+    """
+
+    def __init__(self, height: int, width: int, step: int = 1, fill=NODATA, dtype=np.uint8):
+        self.step = max(1, int(step))
+        self.height = height
+        self.width = width
+        self.data = np.full(
+            (math.ceil(height / self.step), math.ceil(width / self.step)), fill, dtype=dtype
+        )
+
+    @staticmethod
+    def auto_step(width: int, max_width: int = 2000) -> int:
+        """Smallest stride that keeps the preview at most `max_width` columns wide."""
+        return max(1, math.ceil(width / max_width))
+
+    def paste(self, block: np.ndarray, row_off: int, col_off: int) -> None:
+        """Write `block` whose top-left pixel sits at (row_off, col_off) in the region."""
+        s = self.step
+        # First row/col inside the block that lands on the preview grid
+        r0 = (-row_off) % s
+        c0 = (-col_off) % s
+        sub = block[r0::s, c0::s]
+        if sub.size == 0:
+            return
+        pr = (row_off + r0) // s
+        pc = (col_off + c0) // s
+        self.data[pr:pr + sub.shape[0], pc:pc + sub.shape[1]] = sub
@@ -0,0 +1,93 @@
+"""
+Windowed reads across GeoTIFF tile borders.
+
+    mosaic = open_embeddings(embeddings_dir)          # TileMosaic or PixelStore
+    block = mosaic.read_window(row_off, col_off, h, w) # (h, w, bands) float32, NaN where uncovered
+
+TileMosaic gives a directory of GEE tiles the same read_window() as a
+PixelStore, so anything that needs a halo around a tile (patch models, the
+dense CNN map) reads neighbouring tiles through the tile index instead of
+assuming the window fits in one file. Tile sizes come from the tile catalog
+when there is one, otherwise from each tile's header (read once).
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+from inference.tiles import TileInfo, find_embedding_tiles, tile_index
+
+
+class TileMosaic:
+    """The GeoTIFF tiles of a tile index as one raster, for windowed reads."""
+
+    def __init__(self, tiles: list[TileInfo], catalog=None):
+        self.tiles = list(tiles)
+        self._shapes = []
+        self.n_bands = None
+        for tile in self.tiles:
+            entry = catalog.get(tile) if catalog is not None else None
+            if entry is not None:
+                self._shapes.append((int(entry['height']), int(entry['width'])))
+                self.n_bands = self.n_bands or int(entry['count'])
+            else:
+                with rasterio.open(tile.path) as src:
+                    self._shapes.append((src.height, src.width))
+                    self.n_bands = self.n_bands or src.count
+        self._open = {}
+
+    @property
+    def tile_shapes(self) -> list[tuple[int, int]]:
+        return self._shapes
+
+    def __len__(self) -> int:
+        return len(self.tiles)
+
+    def __enter__(self) -> 'TileMosaic':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for src in self._open.values():
+            src.close()
+        self._open.clear()
+
+    def _dataset(self, i: int):
+        if i not in self._open:
+            self._open[i] = rasterio.open(self.tiles[i].path)
+        return self._open[i]
+
+    def read_window(self, row_off: int, col_off: int, height: int, width: int,
+                    fill: float = np.nan) -> np.ndarray:
+        """
+        (height, width, bands) float32 window in raster coordinates, stitched
+        across tile borders. Pixels not covered by any tile are `fill`.
+        """
+        out = np.full((height, width, self.n_bands), fill, dtype=np.float32)
+        for i, (tile, (th, tw)) in enumerate(zip(self.tiles, self._shapes)):
+            r0 = max(row_off, tile.row_off)
+            r1 = min(row_off + height, tile.row_off + th)
+            c0 = max(col_off, tile.col_off)
+            c1 = min(col_off + width, tile.col_off + tw)
+            if r0 >= r1 or c0 >= c1:
+                continue
+            block = self._dataset(i).read(
+                window=Window(c0 - tile.col_off, r0 - tile.row_off, c1 - c0, r1 - r0), out_dtype=np.float32
+            )
+            out[r0 - row_off:r1 - row_off, c0 - col_off:c1 - col_off] = block.transpose(1, 2, 0)
+        return out
+
+
+def open_embeddings(embeddings_dir, catalog=None):
+    """PixelStore for a pixel-store directory, otherwise a TileMosaic of its GeoTIFF tiles."""
+    from inference.pixel_store import PixelStore, is_pixel_store
+
+    if is_pixel_store(Path(embeddings_dir)):
+        return PixelStore(embeddings_dir)
+    return TileMosaic(tile_index(find_embedding_tiles(embeddings_dir)), catalog=catalog)
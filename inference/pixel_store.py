@@ -0,0 +1,334 @@
+"""
+Pixel-interleaved embedding store.
+
+GEE tiles are band-major (64, h, w), so every consumer had to reshape and
+transpose before sklearn/torch could use them. The store is a one-time
+conversion of each tile into an (h, w, 64) .npy file that can be memory-mapped:
+any full-width row range of a tile is then a contiguous (n, 64) array.
+
+Layout of a store directory:
+
+    store.json                      metadata + tile index
+    <tile stem>.npy                 one per GEE tile, same -RRRRRRRRRR-CCCCCCCCCC suffix
+
+Because file stems keep the tile offsets, the store directory can be passed
+anywhere an embeddings directory is expected (see inference.tiles).
+
+Tiles can be stored as:
+    float32  exact copy (zero-copy reads)
+    float16  half the size, NaN preserved
+    int8     quarter the size; per-band affine x = q * scale + offset,
+             with q = -128 reserved for NaN
+Readers always get float32 back, so the encoding is transparent to callers.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+from inference.tiles import TileInfo, parse_tile_offset
+
+
+STORE_META = 'store.json'
+STORE_VERSION = 2
+ROWS_PER_READ = 256   # tile rows converted per GeoTIFF read (bounds builder memory)
+
+ENCODINGS = ('float32', 'float16', 'int8')
+INT8_NAN = -128
+INT8_MAX = 127
+
+
+def is_pixel_store(path) -> bool:
+    return (Path(path) / STORE_META).is_file()
+
+
+# ──────────────────────────────────────────────
+# ENCODING
+# ──────────────────────────────────────────────
+
+def int8_params(band_min: np.ndarray, band_max: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Per-band scale/offset mapping [band_min, band_max] onto [-127, 127]."""
+    band_min = np.asarray(band_min, dtype=np.float64)
+    band_max = np.asarray(band_max, dtype=np.float64)
+    offset = (band_max + band_min) / 2
+    scale = np.maximum(band_max - band_min, 1e-12) / (2 * INT8_MAX)
+    return scale.astype(np.float32), offset.astype(np.float32)
+
+
+def encode(x: np.ndarray, encoding: str, scale=None, offset=None) -> np.ndarray:
+    """Encode float32 pixels (..., bands) for storage."""
+    if encoding == 'float32':
+        return x.astype(np.float32, copy=False)
+    if encoding == 'float16':
+        return x.astype(np.float16)
+    nan = np.isnan(x)
+    q = np.rint((x - offset) / scale)
+    np.clip(q, -INT8_MAX, INT8_MAX, out=q)
+    q[nan] = 0
+    q = q.astype(np.int8)
+    q[nan] = INT8_NAN
+    return q
+
+
+def decode(q: np.ndarray, encoding: str, scale=None, offset=None) -> np.ndarray:
+    """Inverse of encode(): stored pixels (..., bands) back to float32."""
+    if encoding == 'float32':
+        return q
+    if encoding == 'float16':
+        return q.astype(np.float32)
+    x = q.astype(np.float32)
+    x *= scale
+    x += offset
+    x[q == INT8_NAN] = np.nan
+    return x
+
+
+class PixelStore:
+    """Reader for a pixel-interleaved store built by build_pixel_store()."""
+
+    def __init__(self, store_dir):
+        self.store_dir = Path(store_dir)
+        with open(self.store_dir / STORE_META) as f:
+            self.meta = json.load(f)
+        self.n_bands = int(self.meta['n_bands'])
+        self.height = int(self.meta['height'])
+        self.width = int(self.meta['width'])
+        self.encoding = self.meta.get('encoding', 'float32')
+        self.scale = np.asarray(self.meta['scale'], dtype=np.float32) if self.meta.get('scale') else None
+        self.offset = np.asarray(self.meta['offset'], dtype=np.float32) if self.meta.get('offset') else None
+        self.tiles = [
+            TileInfo(self.store_dir / t['file'], int(t['row_off']), int(t['col_off']))
+            for t in self.meta['tiles']
+        ]
+        self._shapes = [(int(t['height']), int(t['width'])) for t in self.meta['tiles']]
+
+    def __len__(self) -> int:
+        return len(self.tiles)
+
+    @property
+    def tile_shapes(self) -> list[tuple[int, int]]:
+        return self._shapes
+
+    def decode(self, raw: np.ndarray) -> np.ndarray:
+        """Stored pixels -> float32 (no-op view for float32 stores)."""
+        return decode(raw, self.encoding, self.scale, self.offset)
+
+    def open_tile(self, i: int) -> np.ndarray:
+        """Memory-mapped (h, w, bands) view of tile i in its stored encoding."""
+        return np.load(self.tiles[i].path, mmap_mode='r')
+
+    def tile_pixels(self, i: int) -> np.ndarray:
+        """
+        (h * w, bands) float32 pixels of tile i. A memory-mapped view with no
+        copy for float32 stores; quantized stores decode into a new array.
+        """
+        return self.decode(self.open_tile(i).reshape(-1, self.n_bands))
+
+    def _overlapping(self, row_off: int, col_off: int, height: int, width: int):
+        for i, (tile, (th, tw)) in enumerate(zip(self.tiles, self._shapes)):
+            r0 = max(row_off, tile.row_off)
+            r1 = min(row_off + height, tile.row_off + th)
+            c0 = max(col_off, tile.col_off)
+            c1 = min(col_off + width, tile.col_off + tw)
+            if r0 < r1 and c0 < c1:
+                yield i, tile, r0, r1, c0, c1
+
+    def read_window(self, row_off: int, col_off: int, height: int, width: int,
+                    fill: float = np.nan) -> np.ndarray:
+        """
+        (height, width, bands) float32 window in raster coordinates, stitched
+        across tile borders. Pixels not covered by any tile are `fill`.
+        """
+        out = np.full((height, width, self.n_bands), fill, dtype=np.float32)
+        for i, tile, r0, r1, c0, c1 in self._overlapping(row_off, col_off, height, width):
+            mm = self.open_tile(i)
+            out[r0 - row_off:r1 - row_off, c0 - col_off:c1 - col_off] = self.decode(
+                mm[r0 - tile.row_off:r1 - tile.row_off, c0 - tile.col_off:c1 - tile.col_off]
+            )
+        return out
+
+    def sample(self, rows: np.ndarray, cols: np.ndarray, fill: float = np.nan) -> np.ndarray:
+        """Gather (n, bands) float32 embeddings at raster pixel coordinates."""
+        rows = np.asarray(rows)
+        cols = np.asarray(cols)
+        out = np.full((rows.size, self.n_bands), fill, dtype=np.float32)
+        for i, (tile, (th, tw)) in enumerate(zip(self.tiles, self._shapes)):
+            in_tile = np.flatnonzero(
+                (rows >= tile.row_off) & (rows < tile.row_off + th) &
+                (cols >= tile.col_off) & (cols < tile.col_off + tw)
+            )
+            if in_tile.size:
+                mm = self.open_tile(i)
+                out[in_tile] = self.decode(mm[rows[in_tile] - tile.row_off, cols[in_tile] - tile.col_off])
+        return out
+
+
+@lru_cache(maxsize=8)
+def load_store(store_dir) -> PixelStore:
+    """Cached PixelStore for a directory (used when only a tile path is known)."""
+    return PixelStore(store_dir)
+
+
+# ──────────────────────────────────────────────
+# BUILDER
+# ──────────────────────────────────────────────
+
+def tile_band_range(tile_path) -> tuple[np.ndarray, np.ndarray]:
+    """Per-band nan-min / nan-max of one GeoTIFF tile."""
+    import rasterio
+    from rasterio.windows import Window
+
+    with rasterio.open(tile_path) as src:
+        lo = np.full(src.count, np.inf)
+        hi = np.full(src.count, -np.inf)
+        for row in range(0, src.height, ROWS_PER_READ):
+            rh = min(ROWS_PER_READ, src.height - row)
+            block = src.read(window=Window(0, row, src.width, rh), out_dtype=np.float32)
+            flat = block.reshape(src.count, -1)
+            if np.isnan(flat).all():
+                continue
+            lo = np.fmin(lo, np.nanmin(flat, axis=1))
+            hi = np.fmax(hi, np.nanmax(flat, axis=1))
+    return lo, hi
+
+
+def convert_tile(tile_path, out_path, encoding: str = 'float32', scale=None, offset=None) -> dict:
+    """Convert one band-major GeoTIFF tile into an (h, w, bands) .npy file."""
+    import rasterio
+    from rasterio.windows import Window
+
+    tile_path = Path(tile_path)
+    row_off, col_off = parse_tile_offset(tile_path)
+    n_clipped = 0
+    with rasterio.open(tile_path) as src:
+        h, w, n_bands = src.height, src.width, src.count
+        tmp_path = Path(out_path).with_suffix('.tmp.npy')
+        mm = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.dtype(encoding), shape=(h, w, n_bands))
+        for row in range(0, h, ROWS_PER_READ):
+            rh = min(ROWS_PER_READ, h - row)
+            block = src.read(window=Window(0, row, w, rh), out_dtype=np.float32).transpose(1, 2, 0)
+            if encoding == 'int8':
+                with np.errstate(invalid='ignore'):
+                    n_clipped += int((np.abs((block - offset) / scale) > INT8_MAX + 0.5).sum())
+            mm[row:row + rh] = encode(block, encoding, scale, offset)
+        mm.flush()
+        del mm
+    os.replace(tmp_path, out_path)
+    return {
+        'file': Path(out_path).name,
+        'source': tile_path.name,
+        'row_off': row_off,
+        'col_off': col_off,
+        'height': h,
+        'width': w,
+        'n_bands': n_bands,
+        'n_clipped': n_clipped,
+    }
+
+
+def _convert_tile_args(args):
+    return convert_tile(*args)
+
+
+def build_pixel_store(tile_paths, store_dir, reference_path=None, n_workers: int | None = None,
+                      encoding: str = 'float32', verbose: bool = True) -> PixelStore:
+    """
+    Convert GEE tiles into a pixel-interleaved store. Tiles whose .npy already
+    exists and is newer than the source are reused, so re-running after new
+    tiles are downloaded only converts the new ones.
+
+    reference_path: labels raster whose height/width/CRS/transform describe the
+    full grid (defaults to the union of tile extents).
+    encoding: 'float32', 'float16' or 'int8'. For int8 the per-band range is
+    measured over all tiles on the first build and kept for incremental
+    rebuilds (out-of-range values are clipped and counted per tile).
+    """
+    import rasterio
+
+    if encoding not in ENCODINGS:
+        raise ValueError(f"encoding must be one of {ENCODINGS}, got {encoding!r}")
+
+    store_dir = Path(store_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+    tile_paths = [Path(p) for p in tile_paths]
+
+    existing, prev_meta = {}, {}
+    if is_pixel_store(store_dir):
+        with open(store_dir / STORE_META) as f:
+            prev_meta = json.load(f)
+        if prev_meta.get('encoding', 'float32') == encoding:
+            existing = {t['source']: t for t in prev_meta['tiles']}
+
+    entries, todo = [], []
+    for tile_path in tile_paths:
+        if parse_tile_offset(tile_path)[0] is None:
+            if verbose:
+                print(f"   SKIP {tile_path.name} (can't parse offset)")
+            continue
+        out_path = store_dir / f"{tile_path.stem}.npy"
+        prev = existing.get(tile_path.name)
+        if prev and out_path.exists() and out_path.stat().st_mtime >= tile_path.stat().st_mtime:
+            entries.append(prev)
+        else:
+            todo.append(tile_path)
+
+    scale = offset = None
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        if encoding == 'int8':
+            if existing and prev_meta.get('scale'):
+                scale = np.asarray(prev_meta['scale'], dtype=np.float32)
+                offset = np.asarray(prev_meta['offset'], dtype=np.float32)
+            else:
+                if verbose:
+                    print(f"   Measuring per-band range over {len(todo)} tiles for int8 quantization")
+                ranges = list(pool.map(tile_band_range, todo))
+                band_min = np.min([lo for lo, _ in ranges], axis=0)
+                band_max = np.max([hi for _, hi in ranges], axis=0)
+                scale, offset = int8_params(band_min, band_max)
+
+        if verbose:
+            print(f"   {len(entries)} tiles up to date, converting {len(todo)} ({encoding})")
+        jobs = [(p, store_dir / f"{p.stem}.npy", encoding, scale, offset) for p in todo]
+        for entry in pool.map(_convert_tile_args, jobs):
+            entries.append(entry)
+            if verbose:
+                clipped = f", {entry['n_clipped']:,} values clipped" if entry['n_clipped'] else ""
+                print(f"   ✓ {entry['source']} -> {entry['file']} ({entry['height']}x{entry['width']}{clipped})")
+
+    if not entries:
+        raise ValueError("No convertible tiles found")
+    n_bands = {e['n_bands'] for e in entries}
+    if len(n_bands) != 1:
+        raise ValueError(f"Tiles have mixed band counts: {sorted(n_bands)}")
+    entries.sort(key=lambda e: (e['row_off'], e['col_off']))
+
+    meta = {
+        'format': 'pixel_interleaved',
+        'version': STORE_VERSION,
+        'encoding': encoding,
+        'dtype': encoding,
+        'scale': scale.tolist() if scale is not None else None,
+        'offset': offset.tolist() if offset is not None else None,
+        'n_bands': n_bands.pop(),
+        'height': max(e['row_off'] + e['height'] for e in entries),
+        'width': max(e['col_off'] + e['width'] for e in entries),
+        'crs': None,
+        'transform': None,
+        'tiles': entries,
+    }
+    if reference_path is not None:
+        with rasterio.open(reference_path) as ref:
+            meta['height'], meta['width'] = ref.height, ref.width
+            meta['crs'] = ref.crs.to_wkt() if ref.crs else None
+            meta['transform'] = list(ref.transform)[:6]
+
+    with open(store_dir / STORE_META, 'w') as f:
+        json.dump(meta, f, indent=2)
+    load_store.cache_clear()
+    return PixelStore(store_dir)
@@ -0,0 +1,202 @@
+"""
+One prediction path for every map / test-region script.
+
+    tiles  = tile_index(find_embedding_tiles(embeddings_dir))
+    region = Region.row_band(test_row_min, test_row_max, full_width)
+    for placement, pred_2d in iter_region_predictions(tiles, region, ChunkedPredictor(rf_model)):
+        ...
+
+Only the part of each tile that overlaps the region is read. NaN pixels are
+masked on the band-major (64, h, w) block directly, and valid pixels are
+gathered into C-ordered (chunk, 64) arrays a chunk at a time, so the full
+transposed tile is never copied. Tiles from a float32 PixelStore are
+already (h, w, 64) and go to the model without any copy; float16/int8 stores
+are decoded a strip of rows at a time.
+"""
+
+from __future__ import annotations
+
+from typing import Iterable, Iterator
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+from inference.metrics import NODATA
+from inference.pixel_store import ROWS_PER_READ, load_store
+from inference.regions import Placement, Region
+from inference.tiles import TileInfo
+
+
+N_BANDS = 64
+DEFAULT_CHUNK_SIZE = 262_144   # pixels per model.predict call
+
+
+class TileSkipped(Exception):
+    """Raised when a tile cannot contribute predictions to a region."""
+
+
+class CascadeModel:
+    """
+    Two-stage classifier with a sklearn-style predict():
+    stage 1 is binary (0 = background, 1 = wetland); pixels it calls wetland
+    are re-labelled by stage 2, everything else stays 0.
+    """
+
+    def __init__(self, stage1, stage2):
+        self.stage1 = stage1
+        self.stage2 = stage2
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        final = np.zeros(X.shape[0], dtype=np.uint8)
+        wetland_mask = np.asarray(self.stage1.predict(X)) == 1
+        if wetland_mask.any():
+            final[wetland_mask] = np.asarray(self.stage2.predict(X[wetland_mask]))
+        return final
+
+
+class ChunkedPredictor:
+    """Wraps a fitted model (and optional scaler) for bounded-memory prediction."""
+
+    def __init__(self, model, scaler=None, chunk_size: int = DEFAULT_CHUNK_SIZE, nodata: int = NODATA):
+        self.model = model
+        self.scaler = scaler
+        self.chunk_size = chunk_size
+        self.nodata = nodata
+
+    def predict_pixels(self, X: np.ndarray) -> np.ndarray:
+        """Predict an (n, bands) array of valid pixels in chunks."""
+        out = np.empty(X.shape[0], dtype=np.uint8)
+        for start in range(0, X.shape[0], self.chunk_size):
+            out[start:start + self.chunk_size] = self._predict(X[start:start + self.chunk_size])
+        return out
+
+    def predict_block(self, block: np.ndarray) -> np.ndarray:
+        """
+        Predict a band-major (bands, h, w) block. Returns an (h, w) uint8 array
+        with `nodata` wherever any band is NaN.
+        """
+        n_bands, h, w = block.shape
+        flat = block.reshape(n_bands, h * w)
+        valid_idx = np.flatnonzero(~np.isnan(flat).any(axis=0))
+
+        preds = np.full(h * w, self.nodata, dtype=np.uint8)
+        for start in range(0, valid_idx.size, self.chunk_size):
+            sel = valid_idx[start:start + self.chunk_size]
+            # Row gather from the (n, bands) view yields a C-ordered copy of just this chunk
+            preds[sel] = self._predict(flat.T[sel])
+        return preds.reshape(h, w)
+
+    def predict_interleaved(self, block: np.ndarray) -> np.ndarray:
+        """
+        Predict a pixel-interleaved (h, w, bands) block, e.g. a PixelStore tile.
+        When the block spans whole tile rows its (h * w, bands) view is passed
+        to the model directly; only partially-NaN blocks gather a copy.
+        """
+        h, w, n_bands = block.shape
+        X = block.reshape(h * w, n_bands)
+        valid = ~np.isnan(X).any(axis=1)
+
+        if valid.all():
+            return self.predict_pixels(X).reshape(h, w)
+
+        preds = np.full(h * w, self.nodata, dtype=np.uint8)
+        valid_idx = np.flatnonzero(valid)
+        for start in range(0, valid_idx.size, self.chunk_size):
+            sel = valid_idx[start:start + self.chunk_size]
+            preds[sel] = self._predict(X[sel])
+        return preds.reshape(h, w)
+
+    def _predict(self, X: np.ndarray) -> np.ndarray:
+        if self.scaler is not None:
+            X = self.scaler.transform(X)
+        return np.asarray(self.model.predict(X)).astype(np.uint8, copy=False)
+
+
+def _data_slices(tile: TileInfo, placement: Placement, catalog) -> tuple[slice, slice]:
+    """Tile-local slices to read: the placement, trimmed to catalogued data blocks."""
+    rows, cols = placement.tile_slices
+    if catalog is None:
+        return rows, cols
+    extent = catalog.data_extent(tile, rows, cols)
+    if extent is None:
+        raise TileSkipped("no valid pixels in region (catalog)")
+    return extent
+
+
+def _paste(placement: Placement, rows: slice, cols: slice, pred: np.ndarray, nodata: int) -> np.ndarray:
+    """Place a prediction for a trimmed read back into the full placement."""
+    if pred.shape == (placement.height, placement.width):
+        return pred
+    r, c = placement.tile_slices
+    out = np.full((placement.height, placement.width), nodata, dtype=np.uint8)
+    out[rows.start - r.start:rows.stop - r.start, cols.start - c.start:cols.stop - c.start] = pred
+    return out
+
+
+def predict_tile(tile: TileInfo, region: Region, predictor: ChunkedPredictor,
+                 expected_bands: int = N_BANDS, catalog=None) -> tuple[Placement, np.ndarray]:
+    """
+    Read the part of `tile` inside `region` and predict it. With a
+    TileCatalog, empty tiles are skipped unopened and only blocks marked as
+    holding data are read.
+    """
+    if catalog is not None and catalog.is_empty(tile):
+        raise TileSkipped("no valid pixels (catalog)")
+
+    if tile.path.suffix == '.npy':
+        pixels = np.load(tile.path, mmap_mode='r')   # PixelStore tile: (h, w, bands)
+        h, w, n_bands = pixels.shape
+        if n_bands != expected_bands:
+            raise TileSkipped(f"{n_bands} bands, expected {expected_bands}")
+        placement = region.clip(tile, h, w)
+        if placement is None:
+            raise TileSkipped("outside region")
+        rows, cols = _data_slices(tile, placement, catalog)
+        block = pixels[rows, cols]
+        if pixels.dtype == np.float32:
+            pred_2d = predictor.predict_interleaved(block)
+        else:
+            # Quantized store: decode a strip of rows at a time
+            store = load_store(tile.path.parent)
+            pred_2d = np.empty(block.shape[:2], dtype=np.uint8)
+            for row in range(0, block.shape[0], ROWS_PER_READ):
+                strip = store.decode(block[row:row + ROWS_PER_READ])
+                pred_2d[row:row + ROWS_PER_READ] = predictor.predict_interleaved(strip)
+        return placement, _paste(placement, rows, cols, pred_2d, predictor.nodata)
+
+    with rasterio.open(tile.path) as src:
+        if src.count != expected_bands:
+            raise TileSkipped(f"{src.count} bands, expected {expected_bands}")
+        placement = region.clip(tile, src.height, src.width)
+        if placement is None:
+            raise TileSkipped("outside region")
+        rows, cols = _data_slices(tile, placement, catalog)
+        block = src.read(window=Window(cols.start, rows.start, cols.stop - cols.start, rows.stop - rows.start))
+    return placement, _paste(placement, rows, cols, predictor.predict_block(block), predictor.nodata)
+
+
+def iter_region_predictions(tiles: Iterable[TileInfo], region: Region, predictor: ChunkedPredictor,
+                            skipped: list | None = None, catalog=None) -> Iterator[tuple[Placement, np.ndarray]]:
+    """
+    Yield (placement, pred_2d) for every tile overlapping `region`.
+    Tiles that can't be used are appended to `skipped` as (name, reason).
+    """
+    for tile in tiles:
+        if not region.may_intersect(tile):
+            continue
+        try:
+            yield predict_tile(tile, region, predictor, catalog=catalog)
+        except TileSkipped as e:
+            if skipped is not None:
+                skipped.append((tile.name, str(e)))
+
+
+def predict_region(tiles: Iterable[TileInfo], region: Region, predictor: ChunkedPredictor,
+                   out: np.ndarray | None = None, skipped: list | None = None, catalog=None) -> np.ndarray:
+    """Predict a region into a (height, width) uint8 array (nodata where uncovered)."""
+    if out is None:
+        out = np.full(region.shape, predictor.nodata, dtype=np.uint8)
+    for placement, pred_2d in iter_region_predictions(tiles, region, predictor, skipped, catalog):
+        out[placement.region_slices] = pred_2d
+    return out
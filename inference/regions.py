@@ -0,0 +1,109 @@
+"""
+Pixel regions of the labels raster that inference can be restricted to.
+
+A Region is a rectangle in full-raster pixel coordinates. Clipping a tile
+against it yields a Placement: the window to read inside the tile and where
+that block lands in raster and region coordinates.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+from rasterio.windows import Window
+
+from inference.tiles import TileInfo
+
+
+@dataclass(frozen=True)
+class Region:
+    row_off: int
+    col_off: int
+    height: int
+    width: int
+
+    @classmethod
+    def full(cls, height: int, width: int) -> 'Region':
+        """The whole raster."""
+        return cls(0, 0, height, width)
+
+    @classmethod
+    def row_band(cls, row_min: int, row_max: int, width: int) -> 'Region':
+        """Full-width band of rows [row_min, row_max)."""
+        return cls(row_min, 0, row_max - row_min, width)
+
+    @classmethod
+    def bbox(cls, row_min: int, row_max: int, col_min: int, col_max: int) -> 'Region':
+        """Rows [row_min, row_max) x cols [col_min, col_max)."""
+        return cls(row_min, col_min, row_max - row_min, col_max - col_min)
+
+    @property
+    def row_end(self) -> int:
+        return self.row_off + self.height
+
+    @property
+    def col_end(self) -> int:
+        return self.col_off + self.width
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.height, self.width
+
+    def may_intersect(self, tile: TileInfo) -> bool:
+        """Cheap pre-filter from offsets alone (tile size unknown until opened)."""
+        return tile.row_off < self.row_end and tile.col_off < self.col_end
+
+    def clip(self, tile: TileInfo, tile_height: int, tile_width: int) -> 'Placement | None':
+        """Intersect a tile with this region; None if they don't overlap."""
+        row_start = max(tile.row_off, self.row_off)
+        row_end   = min(tile.row_off + tile_height, self.row_end)
+        col_start = max(tile.col_off, self.col_off)
+        col_end   = min(tile.col_off + tile_width, self.col_end)
+        if row_start >= row_end or col_start >= col_end:
+            return None
+        return Placement(
+            tile=tile,
+            row_off=row_start,
+            col_off=col_start,
+            height=row_end - row_start,
+            width=col_end - col_start,
+            region=self,
+        )
+
+
+@dataclass(frozen=True)
+class Placement:
+    tile: TileInfo
+    row_off: int     # absolute raster row of the block's top-left pixel
+    col_off: int
+    height: int
+    width: int
+    region: Region
+
+    @property
+    def tile_window(self) -> Window:
+        """Window to read inside the tile."""
+        return Window(self.col_off - self.tile.col_off, self.row_off - self.tile.row_off,
+                      self.width, self.height)
+
+    @property
+    def tile_slices(self) -> tuple[slice, slice]:
+        """Row/col slices inside the tile (for (h, w, bands) pixel-store arrays)."""
+        r = self.row_off - self.tile.row_off
+        c = self.col_off - self.tile.col_off
+        return slice(r, r + self.height), slice(c, c + self.width)
+
+    @property
+    def raster_window(self) -> Window:
+        """Same block in full-raster coordinates (labels raster, output map)."""
+        return Window(self.col_off, self.row_off, self.width, self.height)
+
+    @property
+    def region_offset(self) -> tuple[int, int]:
+        """Top-left of the block relative to the region."""
+        return self.row_off - self.region.row_off, self.col_off - self.region.col_off
+
+    @property
+    def region_slices(self) -> tuple[slice, slice]:
+        r, c = self.region_offset
+        return slice(r, r + self.height), slice(c, c + self.width)
@@ -0,0 +1,83 @@
+"""
+Embedding tile discovery.
+
+GEE exports the 64-band embeddings as GeoTIFF tiles named
+*-RRRRRRRRRR-CCCCCCCCCC.tif, where the two trailing numbers are the tile's
+row/col pixel offset inside the full labels raster.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import NamedTuple
+
+
+# Tried in order; the first pattern that matches anything wins
+TILE_PATTERNS = [
+    "bow_river_embeddings_2020_CORRECTED*.tif",
+    "bow_river_embeddings_2020_matched*.tif",
+    "bow_river_embeddings_*.tif",
+    "*.tif",
+]
+
+
+class TileInfo(NamedTuple):
+    path: Path
+    row_off: int
+    col_off: int
+
+    @property
+    def name(self) -> str:
+        return self.path.name
+
+
+def find_embedding_tiles(embeddings_dir) -> list[Path]:
+    """
+    Find all embedding tiles in the given directory. A pixel-interleaved
+    store directory (see inference.pixel_store) yields its .npy tiles instead.
+    """
+    from inference.pixel_store import PixelStore, is_pixel_store
+
+    embeddings_path = Path(embeddings_dir)
+    if is_pixel_store(embeddings_path):
+        return [tile.path for tile in PixelStore(embeddings_path).tiles]
+    for pattern in TILE_PATTERNS:
+        tiles = sorted(embeddings_path.glob(pattern))
+        if tiles:
+            return tiles
+    return []
+
+
+def parse_tile_offset(tile_path) -> tuple[int | None, int | None]:
+    """
+    Parse row/col offset from tile filename.
+    Expected format: *-RRRRRRRRRR-CCCCCCCCCC.tif
+    """
+    parts = Path(tile_path).stem.split('-')
+    if len(parts) >= 3:
+        try:
+            return int(parts[-2]), int(parts[-1])
+        except ValueError:
+            pass
+    return None, None
+
+
+def tile_index(tile_paths) -> list[TileInfo]:
+    """Attach parsed offsets to tile paths, dropping any that can't be parsed."""
+    index = []
+    for tile_path in tile_paths:
+        row_off, col_off = parse_tile_offset(tile_path)
+        if row_off is not None:
+            index.append(TileInfo(Path(tile_path), row_off, col_off))
+    return index
+
+
+def tile_band_count(tile_path) -> int:
+    """Band count of a GeoTIFF tile or a pixel-store .npy tile."""
+    tile_path = Path(tile_path)
+    if tile_path.suffix == '.npy':
+        import numpy as np
+        return int(np.load(tile_path, mmap_mode='r').shape[-1])
+    import rasterio
+    with rasterio.open(tile_path) as src:
+        return src.count
@@ -14,13 +14,16 @@ Classes:
 
 Usage (local):
     python generate_classification_map.py "C:/path/to/embedding_tiles"
+    python generate_classification_map.py "C:/path/to/pixel_store"   # see data_preprocessing/build_pixel_store.py
+
+    A tile catalog from data_preprocessing/check_tile_coverage.py (tile_catalog.json
+    in the tiles directory, or --catalog) lets empty tiles and blocks be skipped.
 
 Usage (Colab - see generate_classification_map.ipynb):
     Preferred approach when tiles are on Google Drive.
 """
 
 import rasterio
-from rasterio.windows import Window
 import numpy as np
 import joblib
 import os
@@ -29,6 +32,12 @@ import argparse
 from pathlib import Path
 from datetime import datetime
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from inference import (
+    ChunkedPredictor, Region, TileCatalog, TileSkipped,
+    find_embedding_tiles, predict_tile, tile_band_count, tile_index,
+)
+
 # ======================================
 # CONFIGURATION
 # ======================================
@@ -48,44 +57,7 @@ CLASS_NAMES = {
 NODATA_VALUE = 255
 
 
-def find_embedding_tiles(embeddings_dir):
-    """Find all embedding GeoTIFF tiles in the given directory."""
-    embeddings_path = Path(embeddings_dir)
-    
-    # Try multiple naming patterns
-    patterns = [
-        "bow_river_embeddings_2020_CORRECTED*.tif",
-        "bow_river_embeddings_2020_matched*.tif",
-        "bow_river_embeddings_*.tif",
-        "*.tif",
-    ]
-    
-    for pattern in patterns:
-        tiles = sorted(embeddings_path.glob(pattern))
-        if tiles:
-            print(f"  Found {len(tiles)} tiles matching '{pattern}'")
-            return tiles
-    
-    return []
-
-
-def parse_tile_offset(tile_path):
-    """
-    Parse row/col offset from tile filename.
-    Expected format: *-RRRRRRRRRR-CCCCCCCCCC.tif
-    """
-    parts = tile_path.stem.split('-')
-    if len(parts) >= 3:
-        try:
-            row_offset = int(parts[-2])
-            col_offset = int(parts[-1])
-            return row_offset, col_offset
-        except ValueError:
-            pass
-    return None, None
-
-
-def generate_classification_map(embeddings_dir, model_path, labels_path, output_path):
+def generate_classification_map(embeddings_dir, model_path, labels_path, output_path, catalog_path=None):
     """
     Main function: apply RF model to embedding tiles and create classification GeoTIFF.
     """
@@ -137,13 +109,18 @@ def generate_classification_map(embeddings_dir, model_path, labels_path, output_
     if not tile_files:
         print(f"   ERROR: No embedding tiles found in {embeddings_dir}")
         sys.exit(1)
+    print(f"  Found {len(tile_files)} tiles")
     
     # Verify first tile has 64 bands
-    with rasterio.open(tile_files[0]) as test_src:
-        n_bands = test_src.count
-        print(f"   Bands per tile: {n_bands}")
-        if n_bands != 64:
-            print(f"   WARNING: Expected 64 bands, got {n_bands}")
+    n_bands = tile_band_count(tile_files[0])
+    print(f"   Bands per tile: {n_bands}")
+    if n_bands != 64:
+        print(f"   WARNING: Expected 64 bands, got {n_bands}")
+    
+    catalog = TileCatalog(catalog_path) if catalog_path else TileCatalog.for_tiles(embeddings_dir)
+    if catalog is not None:
+        n_empty = sum(catalog.is_empty(t) for t in tile_files)
+        print(f"   Tile catalog: {catalog.path} ({n_empty} empty tiles will be skipped)")
     
     # ------------------------------------------
     # 4. Create output GeoTIFF
@@ -185,77 +162,43 @@ def generate_classification_map(embeddings_dir, model_path, labels_path, output_
     class_counts = np.zeros(6, dtype=np.int64)
     skipped_tiles = []
     
+    tiles = tile_index(tile_files)
+    parsed = {tile.path for tile in tiles}
+    for tile_file in tile_files:
+        if tile_file not in parsed:
+            print(f"   SKIP {tile_file.name} (can't parse offset)")
+            skipped_tiles.append(tile_file.name)
+    region = Region.full(out_height, out_width)
+    predictor = ChunkedPredictor(rf_model, nodata=NODATA_VALUE)
+    
     with rasterio.open(output_path, 'r+') as dst:
-        for tile_idx, tile_file in enumerate(tile_files):
-            tile_name = tile_file.name
-            progress = f"[{tile_idx + 1}/{len(tile_files)}]"
+        for tile_idx, tile in enumerate(tiles):
+            progress = f"[{tile_idx + 1}/{len(tiles)}]"
             
-            # Parse tile position
-            row_offset, col_offset = parse_tile_offset(tile_file)
-            if row_offset is None:
-                print(f"   {progress} SKIP {tile_name} (can't parse offset)")
-                skipped_tiles.append(tile_name)
+            try:
+                placement, pred_2d = predict_tile(tile, region, predictor, catalog=catalog)
+            except TileSkipped as e:
+                print(f"   {progress} SKIP {tile.name} ({e})")
+                skipped_tiles.append(tile.name)
+                continue
+            except Exception as e:
+                print(f"   {progress} ERROR {tile.name}: {e}")
+                skipped_tiles.append(tile.name)
                 continue
             
-            try:
-                with rasterio.open(tile_file) as tile_src:
-                    # Verify band count
-                    if tile_src.count != 64:
-                        print(f"   {progress} SKIP {tile_name} ({tile_src.count} bands, expected 64)")
-                        skipped_tiles.append(tile_name)
-                        continue
-                    
-                    tile_h = tile_src.height
-                    tile_w = tile_src.width
-                    
-                    # Clip to output bounds
-                    valid_h = min(tile_h, out_height - row_offset)
-                    valid_w = min(tile_w, out_width - col_offset)
-                    
-                    if valid_h <= 0 or valid_w <= 0:
-                        print(f"   {progress} SKIP {tile_name} (outside bounds)")
-                        skipped_tiles.append(tile_name)
-                        continue
-                    
-                    # Read tile data: shape (64, valid_h, valid_w)
-                    tile_data = tile_src.read(
-                        window=Window(0, 0, valid_w, valid_h)
-                    )
-                    
-                    # Reshape to (n_pixels, 64) for prediction
-                    n_pixels = valid_h * valid_w
-                    pixels = tile_data.reshape(64, n_pixels).T  # (n_pixels, 64)
-                    
-                    # Create mask for valid (non-NaN) pixels
-                    valid_mask = ~np.isnan(pixels).any(axis=1)
-                    n_valid = valid_mask.sum()
-                    n_nan = n_pixels - n_valid
-                    
-                    # Predict on valid pixels only
-                    predictions = np.full(n_pixels, NODATA_VALUE, dtype=np.uint8)
-                    
-                    if n_valid > 0:
-                        predictions[valid_mask] = rf_model.predict(pixels[valid_mask]).astype(np.uint8)
-                    
-                    # Reshape back to 2D
-                    pred_2d = predictions.reshape(valid_h, valid_w)
-                    
-                    # Write to output at correct position
-                    write_window = Window(col_offset, row_offset, valid_w, valid_h)
-                    dst.write(pred_2d, 1, window=write_window)
-                    
-                    # Update stats
-                    total_pixels_classified += n_valid
-                    total_pixels_nodata += n_nan
-                    for cls in range(6):
-                        class_counts[cls] += np.sum(predictions[valid_mask] == cls)
-                    
-                    print(f"   {progress} ✓ {tile_name} | {valid_h}x{valid_w} | "
-                          f"{n_valid:,} classified, {n_nan:,} nodata")
+            # Write to output at correct position
+            dst.write(pred_2d, 1, window=placement.raster_window)
             
-            except Exception as e:
-                print(f"   {progress} ERROR {tile_name}: {e}")
-                skipped_tiles.append(tile_name)
+            # Update stats
+            valid_preds = pred_2d[pred_2d != NODATA_VALUE]
+            n_valid = valid_preds.size
+            n_nan = pred_2d.size - n_valid
+            total_pixels_classified += n_valid
+            total_pixels_nodata += n_nan
+            class_counts += np.bincount(valid_preds, minlength=6)[:6]
+            
+            print(f"   {progress} ✓ {tile.name} | {placement.height}x{placement.width} | "
+                  f"{n_valid:,} classified, {n_nan:,} nodata")
     
     # ------------------------------------------
     # 6. Summary
@@ -317,6 +260,11 @@ if __name__ == '__main__':
         default=DEFAULT_OUTPUT_PATH,
         help=f'Path for output classification GeoTIFF (default: {DEFAULT_OUTPUT_PATH})'
     )
+    parser.add_argument(
+        '--catalog', '-c',
+        default=None,
+        help='Tile catalog from check_tile_coverage.py (default: <embeddings_dir>/tile_catalog.json if present)'
+    )
     
     args = parser.parse_args()
     
@@ -325,4 +273,5 @@ if __name__ == '__main__':
         model_path=args.model,
         labels_path=args.labels,
         output_path=args.output,
+        catalog_path=args.catalog,
     )
@@ -311,8 +311,15 @@ import joblib
 import rasterio
 import time
 import os
+import sys
 import glob
 drive.mount('/content/drive')
+
+# Shared inference package from this repo (git clone it into /content first)
+REPO_DIR = '/content/Wetland-Mapping-ELEC498-Group-46'
+sys.path.insert(0, REPO_DIR)
+from inference import CascadeModel, ChunkedPredictor
+
 # Define directories
 DRIVE_DIR = '/content/drive/My Drive/CapstoneRFData'
 INPUT_TILES_DIR = os.path.join(DRIVE_DIR, 'input_tiles')
@@ -346,6 +353,7 @@ try:
 
     print("Loading Stage 2 (Wetland-only) model...")
     rf_stage2 = joblib.load(STAGE2_MODEL_PATH)
+    predictor = ChunkedPredictor(CascadeModel(rf_stage1, rf_stage2))
     print("Models ready.\n")
 
 except FileNotFoundError as e:
@@ -366,34 +374,21 @@ def process_tile(input_filename):
 
         profile.update(count=1, dtype=rasterio.uint8, nodata=255)
 
-    n_bands, height, width = img_data.shape
-
-    # 2. Reshape for Scikit-Learn
-    img_data = np.moveaxis(img_data, 0, -1)
-    X_flat = img_data.reshape(-1, n_bands)
-    final_predictions = np.zeros(X_flat.shape[0], dtype=np.uint8)
-
-    # 3. STAGE 1: Predict Background (0) vs. Wetland (1)
-    stage1_preds = rf_stage1.predict(X_flat)
-    wetland_mask = (stage1_preds == 1)
-    num_wetland_pixels = np.sum(wetland_mask)
+    # 2-4. Stage 1 + Stage 2 through the shared chunked predictor (NaN pixels -> 255)
+    pred_2d = predictor.predict_block(img_data)
 
+    valid_preds = pred_2d[pred_2d != 255]
+    num_wetland_pixels = int(np.count_nonzero(valid_preds))
     print(f"  -> Found {num_wetland_pixels:,} wetland pixels "
-          f"({(num_wetland_pixels/len(X_flat))*100:.1f}% of tile).")
+          f"({(num_wetland_pixels/max(valid_preds.size, 1))*100:.1f}% of tile).")
 
-    # 4. STAGE 2: Classify specific wetland types
     if num_wetland_pixels > 0:
-        X_wetlands = X_flat[wetland_mask]
-        stage2_preds = rf_stage2.predict(X_wetlands)
-        final_predictions[wetland_mask] = stage2_preds
-
-        unique, counts = np.unique(stage2_preds, return_counts=True)
+        unique, counts = np.unique(valid_preds[valid_preds != 0], return_counts=True)
         print("  -> Wetland breakdown:")
         for cls, count in zip(unique, counts):
             print(f"     Class {cls}: {count:,} pixels")
 
     # 5. Save output
-    pred_2d = final_predictions.reshape(height, width)
     with rasterio.open(output_path, 'w', **profile) as dst:
         dst.write(pred_2d, 1)
 
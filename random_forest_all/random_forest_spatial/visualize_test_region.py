@@ -12,6 +12,8 @@ Usage:
     python visualize_test_region.py <embeddings_dir>
     python visualize_test_region.py <embeddings_dir> --model path/to/model.pkl --output my_fig.png
 
+<embeddings_dir> may also be a pixel store (data_preprocessing/build_pixel_store.py).
+
 Requires:
     wetland_dataset_spatial_split.npz  (for test_row_min)
     rf_wetland_model_spatial_*.pkl     (trained spatial model)
@@ -31,6 +33,12 @@ import numpy as np
 import rasterio
 from rasterio.windows import Window
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from inference import (
+    ChunkedPredictor, ConfusionAccumulator, DecimatedCanvas, Region,
+    find_embedding_tiles, iter_region_predictions, parse_tile_offset, tile_index,
+)
+
 
 # ──────────────────────────────────────────────
 # CONFIGURATION
@@ -80,29 +88,11 @@ def labels_to_rgb(label_array):
 
 def find_tiles_in_test_region(embeddings_dir: Path, test_row_min: int):
     """Return tile paths whose row offset >= test_row_min."""
-    patterns = [
-        "bow_river_embeddings_2020_CORRECTED*.tif",
-        "bow_river_embeddings_2020_matched*.tif",
-        "bow_river_embeddings_*.tif",
-        "*.tif",
-    ]
-    tile_files = []
-    for pat in patterns:
-        found = sorted(embeddings_dir.glob(pat))
-        if found:
-            tile_files = found
-            break
-
     test_tiles = []
-    for tf in tile_files:
-        parts = tf.stem.split('-')
-        if len(parts) >= 3:
-            try:
-                row_off = int(parts[-2])
-                if row_off >= test_row_min:
-                    test_tiles.append(tf)
-            except ValueError:
-                pass
+    for tf in find_embedding_tiles(embeddings_dir):
+        row_off, _ = parse_tile_offset(tf)
+        if row_off is not None and row_off >= test_row_min:
+            test_tiles.append(tf)
     return test_tiles
 
 
@@ -139,12 +129,22 @@ def run(embeddings_dir, model_path, npz_path, labels_path, output_path):
         sys.exit(1)
     print(f"   Test region: rows {test_row_min}–{full_height-1}  ({test_height} rows)")
 
-    # ── 4. Load ground truth for test region ────────────────────
-    print(f"\n4. Reading ground truth labels for test region...")
+    # Panels are rendered from a strided preview so the full-resolution
+    # test region never has to be held in memory.
+    step = DecimatedCanvas.auto_step(full_width)
+    gt_preview      = DecimatedCanvas(test_height, full_width, step, fill=-1, dtype=np.int16)
+    pred_preview    = DecimatedCanvas(test_height, full_width, step)
+    overlay_preview = DecimatedCanvas(test_height, full_width, step, fill=0)  # 0 nodata, 1 correct, 2 wrong
+
+    # ── 4. Load ground truth preview for test region ────────────
+    print(f"\n4. Reading ground truth labels for test region (preview step {step})...")
     with rasterio.open(labels_path) as src:
-        gt_window = Window(0, test_row_min, full_width, test_height)
-        ground_truth = src.read(1, window=gt_window).astype(np.int16)
-    print(f"   Shape: {ground_truth.shape}")
+        strip_h = step * 256
+        for strip_row in range(0, test_height, strip_h):
+            h = min(strip_h, test_height - strip_row)
+            strip = src.read(1, window=Window(0, test_row_min + strip_row, full_width, h))
+            gt_preview.paste(strip.astype(np.int16), strip_row, 0)
+    print(f"   Preview shape: {gt_preview.data.shape}")
 
     # ── 5. Find test tiles ───────────────────────────────────────
     print(f"\n5. Finding test tiles in: {embeddings_dir}")
@@ -157,97 +157,56 @@ def run(embeddings_dir, model_path, npz_path, labels_path, output_path):
     # ── 6. Run inference tile by tile ───────────────────────────
     print(f"\n6. Running inference on test region...")
     NODATA = 255
-    predictions = np.full((test_height, full_width), NODATA, dtype=np.uint8)
-
-    for tile_path in test_tiles:
-        parts = tile_path.stem.split('-')
-        try:
-            tile_row_off = int(parts[-2])
-            tile_col_off = int(parts[-1])
-        except (ValueError, IndexError):
-            continue
-
-        with rasterio.open(tile_path) as tile_src:
-            if tile_src.count != 64:
-                continue
-            tile_h = tile_src.height
-            tile_w = tile_src.width
-
-            # Row range relative to full raster
-            abs_row_start = tile_row_off
-            abs_row_end   = tile_row_off + tile_h
-
-            # Clip to test region [test_row_min, full_height)
-            clip_row_start = max(abs_row_start, test_row_min)
-            clip_row_end   = min(abs_row_end,   full_height)
-            if clip_row_start >= clip_row_end:
-                continue
-
-            # Window inside the tile
-            tile_local_row_start = clip_row_start - abs_row_start
-            tile_local_row_end   = clip_row_end   - abs_row_start
-            valid_h = tile_local_row_end - tile_local_row_start
-            valid_w = min(tile_w, full_width - tile_col_off)
-
-            tile_data = tile_src.read(
-                window=Window(0, tile_local_row_start, valid_w, valid_h)
-            )  # (64, valid_h, valid_w)
-
-            n_pixels = valid_h * valid_w
-            pixels = tile_data.reshape(64, n_pixels).T  # (n_pixels, 64)
-            valid_mask = ~np.isnan(pixels).any(axis=1)
-
-            preds_flat = np.full(n_pixels, NODATA, dtype=np.uint8)
-            if valid_mask.any():
-                preds_flat[valid_mask] = rf_model.predict(pixels[valid_mask]).astype(np.uint8)
-
-            pred_2d = preds_flat.reshape(valid_h, valid_w)
-
-            # Place into output array (row coords relative to test_row_min)
-            out_row_start = clip_row_start - test_row_min
-            out_row_end   = out_row_start + valid_h
-            col_start     = tile_col_off
-            col_end       = col_start + valid_w
-
-            predictions[out_row_start:out_row_end, col_start:col_end] = pred_2d
-        print(f"   ✓ {tile_path.name}")
-
-    # ── 7. Build accuracy overlay ────────────────────────────────
+    confusion = ConfusionAccumulator(num_classes=len(CLASS_NAMES), nodata=NODATA)
+
+    region = Region.row_band(test_row_min, full_height, full_width)
+    predictor = ChunkedPredictor(rf_model, nodata=NODATA)
+
+    labels_src = rasterio.open(labels_path)
+    for placement, pred_2d in iter_region_predictions(tile_index(test_tiles), region, predictor):
+        # Matching ground truth for just this tile, then fold it into the metrics
+        gt_2d = labels_src.read(1, window=placement.raster_window)
+        confusion.update(gt_2d, pred_2d)
+
+        # Place into previews (coords relative to the test region)
+        out_row, out_col = placement.region_offset
+        status = np.where(pred_2d == NODATA, 0, np.where(pred_2d == gt_2d, 1, 2)).astype(np.uint8)
+        pred_preview.paste(pred_2d, out_row, out_col)
+        overlay_preview.paste(status, out_row, out_col)
+        print(f"   ✓ {placement.tile.name}")
+    labels_src.close()
+
+    # ── 7. Accuracy from the accumulated confusion matrix ───────
     print(f"\n7. Computing accuracy...")
-    valid_mask_2d = predictions != NODATA
-    n_valid = valid_mask_2d.sum()
+    n_valid = confusion.n_valid
 
     if n_valid == 0:
         print("   ERROR: No valid predictions found. Tiles may not cover test region.")
         sys.exit(1)
 
-    correct = (predictions[valid_mask_2d] == ground_truth[valid_mask_2d])
-    acc = correct.mean()
+    acc = confusion.accuracy()
     print(f"   Pixels evaluated: {n_valid:,}")
     print(f"   Overall accuracy: {acc*100:.2f}%")
 
     # Per-class accuracy
     print("\n   Per-class accuracy:")
-    classes_seen = np.unique(ground_truth[valid_mask_2d])
-    for cls in classes_seen:
-        cls_mask = valid_mask_2d & (ground_truth == cls)
-        if cls_mask.sum() == 0:
-            continue
-        cls_acc = (predictions[cls_mask] == cls).mean()
-        print(f"     Class {cls} ({CLASS_NAMES.get(cls, '?'):20s}): {cls_acc*100:.1f}%  (n={cls_mask.sum():,})")
+    support = confusion.support
+    recall  = confusion.recall()
+    for cls in np.flatnonzero(support):
+        print(f"     Class {cls} ({CLASS_NAMES.get(cls, '?'):20s}): {recall[cls]*100:.1f}%  (n={support[cls]:,})")
+    if confusion.n_unlabelled:
+        print(f"     Unlabelled ground truth (counted as wrong): {confusion.n_unlabelled:,}")
 
     # ── 8. Build RGB images ──────────────────────────────────────
     print(f"\n8. Rendering panels...")
 
-    gt_rgb   = labels_to_rgb(ground_truth)
-    pred_rgb = labels_to_rgb(predictions)
+    gt_rgb   = labels_to_rgb(gt_preview.data)
+    pred_rgb = labels_to_rgb(pred_preview.data)
 
     # Overlay: green = correct, red = wrong, grey = nodata
-    overlay = np.full((*predictions.shape, 3), 0.6, dtype=np.float32)  # grey base
-    correct_px = valid_mask_2d & (predictions == ground_truth)
-    wrong_px   = valid_mask_2d & (predictions != ground_truth)
-    overlay[correct_px] = [0.10, 0.80, 0.10]   # green
-    overlay[wrong_px]   = [0.90, 0.15, 0.15]   # red
+    overlay = np.full((*overlay_preview.data.shape, 3), 0.6, dtype=np.float32)  # grey base
+    overlay[overlay_preview.data == 1] = [0.10, 0.80, 0.10]   # green
+    overlay[overlay_preview.data == 2] = [0.90, 0.15, 0.15]   # red
 
     # ── 9. Plot ──────────────────────────────────────────────────
     fig, axes = plt.subplots(1, 3, figsize=(18, 6))
@@ -32,6 +32,12 @@ import numpy as np
 import rasterio
 from rasterio.windows import Window
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+from inference import (
+    ChunkedPredictor, ConfusionAccumulator, DecimatedCanvas, Region,
+    find_embedding_tiles, iter_region_predictions, parse_tile_offset, tile_index,
+)
+
 
 # ──────────────────────────────────────────────
 # CONFIGURATION
@@ -85,17 +91,11 @@ def labels_to_rgb(label_array):
 
 def find_tiles_in_band(embeddings_dir: Path, test_row_min: int, test_row_max: int):
     """Return tile paths whose row offset falls in [test_row_min, test_row_max]."""
-    tile_files = sorted(embeddings_dir.glob('*.tif'))
     test_tiles = []
-    for tf in tile_files:
-        parts = tf.stem.split('-')
-        if len(parts) >= 3:
-            try:
-                row_off = int(parts[-2])
-                if test_row_min <= row_off <= test_row_max:
-                    test_tiles.append(tf)
-            except ValueError:
-                pass
+    for tf in find_embedding_tiles(embeddings_dir):
+        row_off, _ = parse_tile_offset(tf)
+        if row_off is not None and test_row_min <= row_off <= test_row_max:
+            test_tiles.append(tf)
     return test_tiles
 
 
@@ -133,12 +133,21 @@ def run(embeddings_dir, model_path, scaler_path, npz_path, labels_path, output_p
     band_height = test_row_max - test_row_min
     print(f"   Test band:  rows {test_row_min}–{test_row_max}  ({band_height} rows)")
 
-    # ── 4. Load ground truth for the test band ──────────────────
-    print(f"\n4. Reading ground truth labels for test band...")
+    # Panels come from a strided preview; metrics are accumulated per tile
+    step = DecimatedCanvas.auto_step(full_width)
+    gt_preview      = DecimatedCanvas(band_height, full_width, step, fill=-1, dtype=np.int16)
+    pred_preview    = DecimatedCanvas(band_height, full_width, step)
+    overlay_preview = DecimatedCanvas(band_height, full_width, step, fill=0)
+
+    # ── 4. Load ground truth preview for the test band ──────────
+    print(f"\n4. Reading ground truth labels for test band (preview step {step})...")
     with rasterio.open(labels_path) as src:
-        gt_window = Window(0, test_row_min, full_width, band_height)
-        ground_truth = src.read(1, window=gt_window).astype(np.int16)
-    print(f"   Shape: {ground_truth.shape}")
+        strip_h = step * 256
+        for strip_row in range(0, band_height, strip_h):
+            h = min(strip_h, band_height - strip_row)
+            strip = src.read(1, window=Window(0, test_row_min + strip_row, full_width, h))
+            gt_preview.paste(strip.astype(np.int16), strip_row, 0)
+    print(f"   Preview shape: {gt_preview.data.shape}")
 
     # ── 5. Find test tiles ───────────────────────────────────────
     print(f"\n5. Finding test tiles in: {embeddings_dir}")
@@ -151,92 +160,54 @@ def run(embeddings_dir, model_path, scaler_path, npz_path, labels_path, output_p
     # ── 6. Run inference tile by tile ───────────────────────────
     print(f"\n6. Running inference on test band...")
     NODATA = 255
-    predictions = np.full((band_height, full_width), NODATA, dtype=np.uint8)
-
-    for tile_path in test_tiles:
-        parts = tile_path.stem.split('-')
-        try:
-            tile_row_off = int(parts[-2])
-            tile_col_off = int(parts[-1])
-        except (ValueError, IndexError):
-            continue
-
-        with rasterio.open(tile_path) as tile_src:
-            if tile_src.count != 64:
-                continue
-            tile_h = tile_src.height
-            tile_w = tile_src.width
-
-            abs_row_start = tile_row_off
-            abs_row_end   = tile_row_off + tile_h
-
-            # Clip to test band [test_row_min, test_row_max+tile_h)
-            clip_row_start = max(abs_row_start, test_row_min)
-            clip_row_end   = min(abs_row_end,   test_row_min + band_height)
-            if clip_row_start >= clip_row_end:
-                continue
-
-            tile_local_row_start = clip_row_start - abs_row_start
-            tile_local_row_end   = clip_row_end   - abs_row_start
-            valid_h = tile_local_row_end - tile_local_row_start
-            valid_w = min(tile_w, full_width - tile_col_off)
-
-            tile_data = tile_src.read(
-                window=Window(0, tile_local_row_start, valid_w, valid_h)
-            )  # (64, valid_h, valid_w)
-
-            n_pixels = valid_h * valid_w
-            pixels = tile_data.reshape(64, n_pixels).T  # (n_pixels, 64)
-            valid_mask = ~np.isnan(pixels).any(axis=1)
-
-            preds_flat = np.full(n_pixels, NODATA, dtype=np.uint8)
-            if valid_mask.any():
-                X_valid = pixels[valid_mask]
-                if scaler is not None:
-                    X_valid = scaler.transform(X_valid)
-                preds_flat[valid_mask] = rf_model.predict(X_valid).astype(np.uint8)
-
-            pred_2d = preds_flat.reshape(valid_h, valid_w)
-
-            out_row_start = clip_row_start - test_row_min
-            out_row_end   = out_row_start + valid_h
-            col_start     = tile_col_off
-            col_end       = col_start + valid_w
-
-            predictions[out_row_start:out_row_end, col_start:col_end] = pred_2d
-        print(f"   ✓ {tile_path.name}")
-
-    # ── 7. Build accuracy overlay ────────────────────────────────
+    confusion = ConfusionAccumulator(num_classes=len(CLASS_NAMES), nodata=NODATA)
+
+    region = Region.row_band(test_row_min, test_row_min + band_height, full_width)
+    predictor = ChunkedPredictor(rf_model, scaler=scaler, nodata=NODATA)
+
+    labels_src = rasterio.open(labels_path)
+    for placement, pred_2d in iter_region_predictions(tile_index(test_tiles), region, predictor):
+        # Matching ground truth for just this tile, then fold it into the metrics
+        gt_2d = labels_src.read(1, window=placement.raster_window)
+        confusion.update(gt_2d, pred_2d)
+
+        # Place into previews (coords relative to the test region)
+        out_row, out_col = placement.region_offset
+        status = np.where(pred_2d == NODATA, 0, np.where(pred_2d == gt_2d, 1, 2)).astype(np.uint8)
+        pred_preview.paste(pred_2d, out_row, out_col)
+        overlay_preview.paste(status, out_row, out_col)
+        print(f"   ✓ {placement.tile.name}")
+    labels_src.close()
+
+    # ── 7. Accuracy from the accumulated confusion matrix ───────
     print(f"\n7. Computing accuracy...")
-    valid_mask_2d = predictions != NODATA
-    n_valid = valid_mask_2d.sum()
+    n_valid = confusion.n_valid
 
     if n_valid == 0:
         print("   ERROR: No valid predictions found.")
         sys.exit(1)
 
-    correct = (predictions[valid_mask_2d] == ground_truth[valid_mask_2d])
-    acc = correct.mean()
+    acc = confusion.accuracy()
     print(f"   Pixels evaluated: {n_valid:,}")
     print(f"   Overall accuracy: {acc*100:.2f}%")
 
     print("\n   Per-class accuracy:")
-    for cls in np.unique(ground_truth[valid_mask_2d]):
-        cls_mask = valid_mask_2d & (ground_truth == cls)
-        if cls_mask.sum() == 0:
-            continue
-        cls_acc = (predictions[cls_mask] == cls).mean()
-        print(f"     Class {cls} ({CLASS_NAMES.get(cls, '?'):20s}): {cls_acc*100:.1f}%  (n={cls_mask.sum():,})")
+    support = confusion.support
+    recall  = confusion.recall()
+    for cls in np.flatnonzero(support):
+        print(f"     Class {cls} ({CLASS_NAMES.get(cls, '?'):20s}): {recall[cls]*100:.1f}%  (n={support[cls]:,})")
+    if confusion.n_unlabelled:
+        print(f"     Unlabelled ground truth (counted as wrong): {confusion.n_unlabelled:,}")
 
     # ── 8. Build RGB images ──────────────────────────────────────
     print(f"\n8. Rendering panels...")
 
-    gt_rgb   = labels_to_rgb(ground_truth)
-    pred_rgb = labels_to_rgb(predictions)
+    gt_rgb   = labels_to_rgb(gt_preview.data)
+    pred_rgb = labels_to_rgb(pred_preview.data)
 
-    overlay = np.full((*predictions.shape, 3), 0.6, dtype=np.float32)
-    overlay[valid_mask_2d & (predictions == ground_truth)] = [0.10, 0.80, 0.10]
-    overlay[valid_mask_2d & (predictions != ground_truth)] = [0.90, 0.15, 0.15]
+    overlay = np.full((*overlay_preview.data.shape, 3), 0.6, dtype=np.float32)
+    overlay[overlay_preview.data == 1] = [0.10, 0.80, 0.10]
+    overlay[overlay_preview.data == 2] = [0.90, 0.15, 0.15]
 
     # ── 9. Plot ──────────────────────────────────────────────────
     fig, axes = plt.subplots(1, 3, figsize=(18, 6))
@@ -0,0 +1,36 @@
+"""
+Shared hyperparameter-sweep runner for the RF and SVM grid searches.
+
+Each grid-search script prepares its dataset once and hands a module-level
+fit-and-score function to SweepRunner. The runner runs the configs on a
+process pool with the data in shared memory, caches finished runs, and
+writes one results table. successive_halving runs the same sweep with
+early elimination: candidates start on a stratified subsample with fewer
+trees, and only the best move on to the full budget. grow_forest lets
+configs that differ only in n_estimators share one warm-started forest.
+"""
+
+from sweep.growth import TreeVotes, grow_forest, nested_groups
+from sweep.halving import halving_schedule, rung_budget, stratified_subsample, successive_halving
+from sweep.runner import (
+    SweepRunner, available_cores, config_hash, file_fingerprint, plan_workers, write_table,
+)
+from sweep.shared import SharedArrays, attach
+
+__all__ = [
+    'SharedArrays',
+    'SweepRunner',
+    'TreeVotes',
+    'attach',
+    'available_cores',
+    'config_hash',
+    'file_fingerprint',
+    'grow_forest',
+    'halving_schedule',
+    'nested_groups',
+    'plan_workers',
+    'rung_budget',
+    'stratified_subsample',
+    'successive_halving',
+    'write_table',
+]
@@ -0,0 +1,88 @@
+"""
+Warm-start forest growth for sweeps over n_estimators.
+
+A grid with n_estimators in [100, 200, 300] at one depth would otherwise
+train three forests, fitting the first 100 trees three times.
+SweepRunner.run(..., grow=...) groups configs that differ only in
+n_estimators into one chain. The chain grows a single forest with
+warm_start and scores it after each increment:
+
+    for n_trees, y_pred, secs in grow_forest(model, X_train, y_train, X_test, [100, 200, 300]):
+        ...                           # model holds exactly n_trees trees here
+
+sklearn draws the new trees' seeds from random_state in order. So a grown
+forest has the same trees as one fitted fresh at that size. TreeVotes
+keeps the running sum of the trees' class probabilities on the test set.
+Each larger ensemble is then scored by adding only the new trees' votes,
+instead of running every tree again.
+"""
+
+from __future__ import annotations
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+def nested_groups(configs: list[dict], key: str = 'n_estimators') -> list[list[int]]:
+    """
+    Indices of `configs` grouped by everything except `key`. Each group is
+    sorted by `key`, and groups come in order of their first config.
+    """
+    groups = {}
+    for i, config in enumerate(configs):
+        rest = json.dumps({k: v for k, v in config.items() if k != key}, sort_keys=True, default=str)
+        groups.setdefault(rest, []).append(i)
+    return [sorted(idx, key=lambda i: configs[i][key]) for idx in groups.values()]
+
+
+class TreeVotes:
+    """Running sum of per-tree class probabilities over a fixed test set."""
+
+    def __init__(self, X_test: np.ndarray, classes: np.ndarray, n_jobs: int = 1):
+        self.X = np.ascontiguousarray(X_test, dtype=np.float32)
+        self.classes = classes
+        self.n_jobs = max(1, n_jobs)
+        self.sum = np.zeros((len(self.X), len(classes)), dtype=np.float64)
+        self.n_trees = 0
+
+    def add(self, trees) -> None:
+        """Add the votes of `trees` (fitted DecisionTreeClassifiers)."""
+        trees = list(trees)
+        if len(self.X) and trees:
+            predict = lambda tree: tree.predict_proba(self.X, check_input=False)
+            with ThreadPoolExecutor(self.n_jobs) as pool:
+                # Summed in tree order, so the result does not depend on n_jobs
+                for proba in pool.map(predict, trees):
+                    self.sum += proba
+        self.n_trees += len(trees)
+
+    def predict(self) -> np.ndarray:
+        if not len(self.X):
+            return np.empty(0, dtype=self.classes.dtype)
+        return self.classes.take(np.argmax(self.sum, axis=1))
+
+
+def grow_forest(model, X_train, y_train, X_test, sizes: list[int], n_jobs: int = 1):
+    """
+    Grow the forest `model` through the increasing `sizes`. After each size,
+    yields (n_trees, test predictions, cumulative training seconds). A size
+    equal to the previous one yields again without refitting. Between fits
+    the model has warm_start=False, so a model saved at a yield refits from
+    scratch as usual.
+    """
+    votes = None
+    train_secs = 0.0
+    for size in sizes:
+        if votes is None or size > votes.n_trees:
+            t0 = time.perf_counter()
+            model.set_params(n_estimators=size, warm_start=votes is not None)
+            model.fit(X_train, y_train)
+            model.set_params(warm_start=False)
+            train_secs += time.perf_counter() - t0
+            if votes is None:
+                votes = TreeVotes(X_test, model.classes_, n_jobs)
+            votes.add(model.estimators_[votes.n_trees:])
+        yield size, votes.predict(), train_secs
@@ -0,0 +1,114 @@
+"""
+Successive halving on top of SweepRunner.
+
+    rows = successive_halving(runner, fit_and_score, configs, score_key='mean_wetland_f1')
+
+Every candidate starts on a small budget: a stratified fraction of the
+training set and the same fraction of its trees. After each rung only the
+best 1/eta of the candidates (by score_key) move on to eta times the
+budget, until the survivors run at full budget. With 9 configs and eta=3
+that is 9 fits at 1/9, 3 at 1/3 and 1 full fit.
+
+Reduced-budget runs carry a 'budget' key in their config (so they cache
+separately). The full-budget rung uses the plain configs, so it shares its
+cache entries, saved models and metadata with the ordinary grid search.
+fit_and_score reads its budget through rung_budget():
+
+    n_estimators, idx = rung_budget(config, y_train)
+    if idx is not None:
+        X_train, y_train = X_train[idx], y_train[idx]
+    ...
+    if 'budget' in config:
+        return scores                 # partial rung: skip saving the model
+
+Every rung's rows land in <out_dir>/<name>_halving_results.csv.
+"""
+
+from __future__ import annotations
+
+import math
+import time
+
+import numpy as np
+
+from sweep.runner import write_table
+
+MIN_TREES = 10
+
+
+def stratified_subsample(y: np.ndarray, fraction: float, seed: int = 42) -> np.ndarray:
+    """
+    Sorted indices of a class-stratified `fraction` of y (at least one per
+    class). The same seed gives nested subsets as fraction grows, so every
+    rung extends the data the previous one saw.
+    """
+    rng = np.random.default_rng(seed)
+    keep = []
+    for cls in np.unique(y):
+        idx = np.flatnonzero(y == cls)
+        idx = idx[rng.permutation(len(idx))]
+        keep.append(idx[:max(1, int(round(len(idx) * fraction)))])
+    return np.sort(np.concatenate(keep))
+
+
+def rung_budget(config: dict, y_train: np.ndarray, min_trees: int = MIN_TREES) -> tuple[int, np.ndarray | None]:
+    """
+    (n_estimators, training indices) for a config's budget. The indices are
+    None at full budget.
+    """
+    budget = config.get('budget', 1.0)
+    n_estimators = config['n_estimators']
+    if budget >= 1.0:
+        return n_estimators, None
+    return max(min_trees, int(round(n_estimators * budget))), stratified_subsample(y_train, budget)
+
+
+def halving_schedule(n_candidates: int, eta: int = 3, min_budget: float | None = None) -> list[tuple[int, float]]:
+    """
+    [(candidates, budget fraction)] per rung. The last rung is at full budget.
+    Rungs below min_budget are dropped. Those candidates then start at the
+    first rung that remains.
+    """
+    if eta < 2:
+        raise ValueError(f"eta must be >= 2, got {eta}")
+    n_rungs = int(math.floor(math.log(max(n_candidates, 1), eta) + 1e-9)) + 1
+    rungs = [(math.ceil(n_candidates / eta ** r), float(eta) ** (r - n_rungs + 1)) for r in range(n_rungs)]
+    if min_budget is not None:
+        kept = [rung for rung in rungs if rung[1] >= min_budget] or rungs[-1:]
+        rungs = [(n_candidates, kept[0][1])] + kept[1:]
+    return rungs
+
+
+def successive_halving(runner, fn, configs: list[dict], score_key: str, eta: int = 3,
+                       min_budget: float | None = None, describe=None, grow=None) -> list[dict]:
+    """
+    Full-budget rows of the final rung's survivors, best first. Each rung
+    runs through runner.run, so rungs are parallel and cached like a grid
+    search. `grow` is passed on to runner.run.
+    """
+    schedule = halving_schedule(len(configs), eta, min_budget)
+    print(f"Successive halving '{runner.name}': "
+          + ' -> '.join(f"{n} @ {budget:.3g}" for n, budget in schedule) + f" (eta={eta}, by {score_key})")
+
+    survivors = list(configs)
+    history = []
+    for rung, (n_keep, budget) in enumerate(schedule):
+        survivors = survivors[:n_keep]
+        rung_configs = survivors if budget >= 1.0 else [{**c, 'budget': budget} for c in survivors]
+        print(f"\n--- Rung {rung}: {len(rung_configs)} candidates, budget {budget:.3g} ---")
+        t0 = time.perf_counter()
+        rows = runner.run(fn, rung_configs, describe=describe, write=False, grow=grow)
+        print(f"Rung {rung} done in {time.perf_counter() - t0:.1f}s")
+        history.extend({'rung': rung, 'budget': budget, **{k: v for k, v in row.items() if k != 'budget'}}
+                       for row in rows)
+
+        # Stable sort: ties keep the grid order
+        order = sorted(range(len(rows)), key=lambda i: rows[i][score_key], reverse=True)
+        survivors = [survivors[i] for i in order]
+        rows = [rows[i] for i in order]
+
+    table_path = runner.out_dir / f'{runner.name}_halving_results.csv'
+    runner.out_dir.mkdir(parents=True, exist_ok=True)
+    write_table(history, table_path)
+    print(f"Halving table: {table_path}")
+    return rows
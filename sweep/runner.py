@@ -0,0 +1,225 @@
+"""
+Hyperparameter sweeps over a process pool.
+
+    runner = SweepRunner('rf_wetland_only', out_dir=SCRIPT_DIR, data=data,
+                         data_key=file_fingerprint(DATA_PATH), jobs_per_fit=4)
+    rows = runner.run(fit_and_score, configs)      # fit_and_score(config, data, n_jobs) -> dict
+
+- The dataset is prepared once by the caller. Its arrays are placed in
+  shared memory, and its other values (class weights, labels, ...) are sent
+  to each worker once.
+- The core budget is split between concurrent fits and the n_jobs handed
+  to each fit (jobs_per_fit).
+- Every finished run is cached under <out_dir>/sweep_cache/<name>/ by a
+  hash of its config, the sweep's fixed inputs and the data fingerprint.
+  Re-running a sweep skips those runs, including after an interrupted sweep.
+- All rows, new and cached, go to one results table,
+  <out_dir>/<name>_results.csv.
+- With grow=..., configs that differ only in n_estimators run as one
+  chain that grows a single warm-started forest (sweep.growth), instead of
+  one fresh forest per config.
+- successive_halving (sweep.halving) runs the same configs as rungs of
+  growing budget and drops the weakest candidates between rungs.
+
+`fn` must be a module-level function, so workers can unpickle it; scripts
+using the runner keep their top-level code under `if __name__ == '__main__'`.
+"""
+
+from __future__ import annotations
+
+import csv
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+
+from sweep.growth import nested_groups
+from sweep.shared import SharedArrays, attach
+
+_WORKER_DATA = None
+_WORKER_HANDLES = None
+_WORKER_LIMITS = None
+
+
+def available_cores() -> int:
+    """Cores this process may run on (respects CPU affinity / container limits)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def file_fingerprint(path) -> str:
+    """Cheap identity of a data file for cache keys: name, size and mtime."""
+    stat = Path(path).stat()
+    return f"{Path(path).name}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def _jsonable(value):
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def config_hash(name: str, config: dict, fixed: dict | None = None, data_key: str | None = None) -> str:
+    """Stable hash of everything that determines a run's result."""
+    payload = json.dumps(_jsonable({'sweep': name, 'config': config, 'fixed': fixed or {}, 'data': data_key}),
+                         sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+
+def plan_workers(n_runs: int, cores: int, jobs_per_fit: int | None = None) -> tuple[int, int]:
+    """
+    (concurrent fits, n_jobs per fit) for n_runs on `cores`. Without
+    jobs_per_fit the cores are spread evenly over as many concurrent fits as
+    there are runs.
+    """
+    cores = max(1, cores)
+    if jobs_per_fit is None:
+        jobs_per_fit = max(1, cores // max(n_runs, 1))
+    jobs_per_fit = min(max(1, jobs_per_fit), cores)
+    return max(1, min(n_runs, cores // jobs_per_fit)), jobs_per_fit
+
+
+def write_table(rows: list[dict], path) -> None:
+    """CSV with one column per key seen in any row (in first-seen order)."""
+    columns = list(dict.fromkeys(k for row in rows for k in row))
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({k: json.dumps(v) if isinstance(v, (dict, list)) else v for k, v in row.items()})
+
+
+def _init_worker(spec, extras, n_jobs):
+    global _WORKER_DATA, _WORKER_HANDLES, _WORKER_LIMITS
+    arrays, _WORKER_HANDLES = attach(spec)
+    _WORKER_DATA = {**extras, **arrays}
+    # Keep BLAS / OpenMP inside each fit to its share of the cores
+    try:
+        from threadpoolctl import threadpool_limits
+        _WORKER_LIMITS = threadpool_limits(n_jobs)
+    except ImportError:
+        pass
+
+
+def _run_task(fn, grow, task_configs, data, n_jobs):
+    """Results for one task: a single config through fn, or a chain through grow."""
+    t0 = time.perf_counter()
+    if len(task_configs) > 1:
+        results = grow(task_configs, data, n_jobs)
+    else:
+        results = [fn(task_configs[0], data, n_jobs)]
+    return results, time.perf_counter() - t0
+
+
+def _run_in_worker(fn, grow, task_configs, n_jobs):
+    return _run_task(fn, grow, task_configs, _WORKER_DATA, n_jobs)
+
+
+class SweepRunner:
+    """Runs fn(config, data, n_jobs) -> result dict for every config, in parallel and cached."""
+
+    def __init__(self, name: str, out_dir, data: dict, data_key: str | None = None, fixed: dict | None = None,
+                 cores: int | None = None, jobs_per_fit: int | None = None, use_cache: bool = True):
+        self.name = name
+        self.out_dir = Path(out_dir)
+        self.data = data
+        self.data_key = data_key
+        self.fixed = fixed or {}
+        self.cores = cores or available_cores()
+        self.jobs_per_fit = jobs_per_fit
+        self.use_cache = use_cache
+        self.cache_dir = self.out_dir / 'sweep_cache' / name
+        self.table_path = self.out_dir / f'{name}_results.csv'
+
+    def _cache_path(self, config: dict) -> Path:
+        return self.cache_dir / f'{config_hash(self.name, config, self.fixed, self.data_key)}.json'
+
+    def _load_cached(self, config: dict):
+        path = self._cache_path(config)
+        if not (self.use_cache and path.exists()):
+            return None
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)['result']
+
+    def _store(self, config: dict, result: dict, seconds: float):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self._cache_path(config)
+        tmp = path.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(_jsonable({'config': config, 'fixed': self.fixed, 'data': self.data_key,
+                                 'seconds': seconds, 'result': result}), f, indent=2)
+        os.replace(tmp, path)
+
+    def run(self, fn, configs: list[dict], describe=None, write: bool = True, grow=None,
+            grow_key: str = 'n_estimators') -> list[dict]:
+        """
+        Rows (config keys + fn's result + 'cached'), in `configs` order, also
+        written to the results table unless write=False. describe(config,
+        result) -> str gives the progress line for a finished run.
+
+        grow(chain_configs, data, n_jobs) -> [result per config], if given,
+        runs each group of pending configs that differ only in grow_key
+        (sorted by it) as one task. Single configs still go through fn.
+        """
+        describe = describe or (lambda config, result: ', '.join(f'{k}={v}' for k, v in config.items()))
+        rows = [None] * len(configs)
+        pending = []
+        for i, config in enumerate(configs):
+            cached = self._load_cached(config)
+            if cached is None:
+                pending.append(i)
+            else:
+                rows[i] = {**config, **cached, 'cached': True}
+
+        if grow is None:
+            tasks = [[i] for i in pending]
+        else:
+            tasks = [[pending[j] for j in group] for group in nested_groups([configs[i] for i in pending], grow_key)]
+
+        workers, n_jobs = plan_workers(len(tasks), self.cores, self.jobs_per_fit)
+        chains = sum(len(task) > 1 for task in tasks)
+        print(f"Sweep '{self.name}': {len(configs)} configs, {len(configs) - len(pending)} cached, "
+              f"{len(pending)} to run" + (f" ({chains} warm-start chains)" if chains else '')
+              + f" | {workers} concurrent fits x n_jobs={n_jobs} on {self.cores} cores")
+
+        def finished(task, results, seconds, done):
+            for i, result in zip(task, results):
+                self._store(configs[i], result, seconds)
+                rows[i] = {**configs[i], **result, 'cached': False}
+            grown = f", grown {' -> '.join(str(configs[i][grow_key]) for i in task)}" if len(task) > 1 else ''
+            print(f"  [{done}/{len(tasks)}] ✓ {describe(configs[task[-1]], results[-1])} ({seconds:.1f}s{grown})")
+            for i, result in zip(task[:-1], results[:-1]):
+                print(f"          {describe(configs[i], result)}")
+
+        if tasks and workers == 1:
+            for done, task in enumerate(tasks, 1):
+                results, seconds = _run_task(fn, grow, [configs[i] for i in task], self.data, n_jobs)
+                finished(task, results, seconds, done)
+        elif tasks:
+            arrays = {k: v for k, v in self.data.items() if isinstance(v, np.ndarray)}
+            extras = {k: v for k, v in self.data.items() if not isinstance(v, np.ndarray)}
+            with SharedArrays(arrays) as shared:
+                print(f"  {shared.nbytes / 1024 ** 2:,.1f} MB of arrays in shared memory")
+                with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                         initargs=(shared.spec, extras, n_jobs)) as pool:
+                    futures = {pool.submit(_run_in_worker, fn, grow, [configs[i] for i in task], n_jobs): task
+                               for task in tasks}
+                    for done, future in enumerate(as_completed(futures), 1):
+                        results, seconds = future.result()
+                        finished(futures[future], results, seconds, done)
+
+        if write:
+            self.out_dir.mkdir(parents=True, exist_ok=True)
+            write_table(rows, self.table_path)
+            print(f"Results table: {self.table_path}")
+        return rows
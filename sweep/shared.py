@@ -0,0 +1,63 @@
+"""
+NumPy arrays in shared memory for process-pool workers.
+
+    with SharedArrays({'X_train': X_train, 'y_train': y_train}) as shared:
+        pool = ProcessPoolExecutor(initializer=init_worker,initargs=(shared.spec,))
+
+The parent copies each array into a multiprocessing.shared_memory block
+once. Workers attach to the blocks by name and get read-only views, so the
+dataset is neither pickled per task nor duplicated per process. This holds
+whatever the start method (fork, forkserver or spawn).
+"""
+
+from __future__ import annotations
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class SharedArrays:
+    """Owner of one shared-memory block per array; unlinks them on close()."""
+
+    def __init__(self, arrays: dict[str, np.ndarray]):
+        self._blocks = []
+        self.spec = {}
+        for key, arr in arrays.items():
+            arr = np.ascontiguousarray(arr)
+            shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+            np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+            self._blocks.append(shm)
+            self.spec[key] = (shm.name, arr.shape, arr.dtype.str)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(int(np.prod(shape)) * np.dtype(dtype).itemsize for _, shape, dtype in self.spec.values())
+
+    def __enter__(self) -> 'SharedArrays':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for shm in self._blocks:
+            shm.close()
+            shm.unlink()
+        self._blocks.clear()
+
+
+def attach(spec: dict) -> tuple[dict[str, np.ndarray], list]:
+    """
+    Read-only views of the arrays in `spec` (SharedArrays.spec), plus the
+    SharedMemory handles that must stay referenced while the views are used.
+    """
+    arrays, handles = {}, []
+    for key, (name, shape, dtype) in spec.items():
+        # Pool workers share the owner's resource tracker; the owner's close() does the unlink
+        shm = shared_memory.SharedMemory(name=name)
+        arr = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        arr.flags.writeable = False
+        arrays[key] = arr
+        handles.append(shm)
+    return arrays, handles